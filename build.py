@@ -33,10 +33,11 @@ EXIT_CODE_ENVIRONMENT_FILE_NOT_FOUND = 2
 EXIT_CODE_TASK_CANNOT_CHAIN_MANUAL_INTERVENTION_REQUIRED = 3
 EXIT_CODE_UNKNOWN_ERROR = -1
 
-def task(*, depends_on: list[str] = []):
+def task(*, depends_on: list[str] = [], setup_parser: Callable[[argparse.ArgumentParser], None] | None = None):
     def decorator(func: Callable) -> Callable:
         func._is_task = True  # ty: ignore[unresolved-attribute]
         func._depends_on = depends_on  # ty: ignore[unresolved-attribute]
+        func._setup_parser = setup_parser  # ty: ignore[unresolved-attribute]
         @functools.wraps(func)
         def wrapper(self, *args: Any, **kwargs: Any):
             # Get all dependencies including inherited ones
@@ -69,8 +70,7 @@ def task(*, depends_on: list[str] = []):
             bound.apply_defaults()
             result = func(*bound.args, **bound.kwargs)
             # Mark task as completed
-            task_name = getattr(self, args[0]).__name__ if args else func.__name__ # ty: ignore[unresolved-attribute]
-            self._completed.add(task_name)
+            self._completed.add(func.__name__)
             return result
         return wrapper
     return decorator
@@ -87,6 +87,11 @@ class TaskCannotChainManualInterventionRequired(RuntimeError):
     def __init__(self, task_name: str):
         super().__init__(f"Task {task_name} stopped. Manual intervention is required.")
 
+def _setup_run_parser(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--mode', choices=['development', 'production'],
+                        help='development reloads on change; production runs one worker per core (default: SERVER_MODE)')
+    parser.add_argument('--workers', type=int, help='Production worker processes (default: SERVER_WORKERS or the core count)')
+
 class Builder:
     def __init__(self):
         self._completed: Set[str] = set()
@@ -120,11 +125,18 @@ class Builder:
 
     # region Task parsers
     @task(depends_on=["setup"])
+    def bench(self):
+        """Run performance benchmarks"""
+        from benchmarks.basket import main as bench_basket
+        from benchmarks.plu_loader import main as bench_plu_loader
+        logger.info("Running benchmarks...")
+        bench_plu_loader()
+        bench_basket()
+
+    @task(depends_on=["setup"], setup_parser=lambda parser: parser.add_argument(
+        '--all', action='store_true', help='Remove all generated files'))
     def clean(self, all: bool = False):
         """Clean temporary files and logs"""
-        def _setup_parser(parser: argparse.ArgumentParser) -> None:
-            parser.add_argument('--all', action='store_true', help='Remove all generated files')
-        
         logger.info("Cleaning temporary files and logs...")
         paths = [
             "./logs",
@@ -142,12 +154,10 @@ class Builder:
             else:
                 shutil.rmtree(path)
 
-    @task(depends_on=["setup"])
+    @task(depends_on=["setup"], setup_parser=lambda parser: parser.add_argument(
+        '--env-file', default='.env', help='Environment file to load'))
     def config(self, env_file: str = '.env'):
         """Validate and configure settings"""
-        def _setup_parser(parser: argparse.ArgumentParser) -> None:
-            parser.add_argument('--env-file', default=env_file, help='Environment file to load')
-        
         logger.info("Validating configuration...")
         if not os.path.exists(env_file):
             if env_file == '.env':
@@ -161,21 +171,33 @@ class Builder:
         # TODO: Implement configuration validation
         # This would typically check environment variables, config files, etc.
 
-    @task(depends_on=["test"])
+    @task(depends_on=["test"], setup_parser=lambda parser: parser.add_argument(
+        '--env', default='dev', help='Environment to deploy to'))
     def deploy(self, env: str = "dev"):
         """Deploy the application"""
-        def _setup_parser(parser: argparse.ArgumentParser) -> None:
-            parser.add_argument('--env', default='dev', help='Environment to deploy to')
-
         logger.info(f"Deploying to {env}...")
         # TODO: Implement deployment logic
 
     @task(depends_on=["config"])
-    def run(self):
-        """Run the FastAPI server and website"""
-        def _setup_parser(parser: argparse.ArgumentParser) -> None:
-            pass
+    def migrate(self):
+        """Apply database migrations that have not been applied yet"""
+        from webapp.config import engine
+        from webapp.migrations import apply_migrations
+        
+        applied = apply_migrations(engine)
+        if applied:
+            logger.info(f"Applied migrations {', '.join(map(str, applied))}")
+        else:
+            logger.info("Database schema is up to date")
 
+    @task(depends_on=["config", "migrate"], setup_parser=_setup_run_parser)
+    def run(self, mode: str | None = None, workers: int | None = None):
+        """Run the FastAPI server and website"""
+        # Flags override .env, which the server reads
+        if mode:
+            os.environ['SERVER_MODE'] = mode
+        if workers:
+            os.environ['SERVER_WORKERS'] = str(workers)
         logger.info("Starting FastAPI server...")
         from webapp.main import main
         main()
@@ -0,0 +1 @@
+"""Performance benchmarks, run with `./build.py bench`."""
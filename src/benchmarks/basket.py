@@ -0,0 +1,77 @@
+"""Benchmark basket quotes against the 100 ms target on a large random market."""
+import logging
+import os
+import random
+import time
+from datetime import datetime
+
+from sqlmodel import Session, SQLModel, create_engine
+
+from webapp.database import SQLITE_DATETIME_FORMAT
+from webapp.products.basket import quote_basket
+from webapp.products.models import BasketItem, Product
+from webapp.products.prices import INSERT_PRICE_SQL
+from webapp.stores.models import Store
+
+logger = logging.getLogger(__name__)
+
+# Slowest acceptable quote of a full basket across hundreds of stores
+QUOTE_TARGET_SECONDS = 0.1
+
+# Size of the benchmark market
+DEFAULT_PRODUCTS = int(os.getenv("BENCH_BASKET_PRODUCTS", "50"))
+DEFAULT_STORES = int(os.getenv("BENCH_BASKET_STORES", "400"))
+
+# Quotes timed per store limit; the fastest is reported
+RUNS = 5
+
+
+def make_market(session: Session, products: int, stores: int, seed: int = 0) -> list[int]:
+    """Price every product independently at random at every store.
+    
+    Returns:
+        Ids of the products created
+    """
+    rng = random.Random(seed)
+    product_rows = [Product(name=f"Product {i}", upc=f"{i:05d}") for i in range(products)]
+    store_rows = [
+        Store(name=f"Store {i}", address=f"{i} Main St", city="Chattanooga", state="TN", zip_code="37402")
+        for i in range(stores)
+    ]
+    session.add_all(product_rows + store_rows)
+    session.commit()
+    
+    observed = datetime(2025, 6, 1).strftime(SQLITE_DATETIME_FORMAT)
+    session.connection().exec_driver_sql(INSERT_PRICE_SQL, [
+        (product.id, store.id, rng.randint(100, 500) / 100, observed)
+        for product in product_rows for store in store_rows
+    ])
+    session.commit()
+    return [product.id for product in product_rows]  # type: ignore
+
+
+def main(products: int = DEFAULT_PRODUCTS, stores: int = DEFAULT_STORES) -> None:
+    """Time quote_basket with its default time limit, warning past QUOTE_TARGET_SECONDS."""
+    engine = create_engine("sqlite:///:memory:")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        items = [BasketItem(product_id=product_id) for product_id in make_market(session, products, stores)]
+        logger.info(f"Basket benchmark: {products} items across {stores} stores")
+        
+        for max_stores in (2, 3):
+            timings = []
+            for _ in range(RUNS):
+                started = time.perf_counter()
+                quote = quote_basket(session, items, max_stores=max_stores)
+                timings.append(time.perf_counter() - started)
+            
+            elapsed = min(timings)
+            split = quote.cheapest_split
+            logger.info(f"max_stores={max_stores}: {elapsed * 1000:.0f} ms, split {split.total} "  # type: ignore
+                        f"({'exact' if split.exact else 'unproven'}) vs single store {quote.cheapest_store.total}")  # type: ignore
+            if elapsed >= QUOTE_TARGET_SECONDS:
+                logger.warning(f"max_stores={max_stores}: quote took {elapsed:.3f}s, over the {QUOTE_TARGET_SECONDS}s target")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Benchmark the PLU commodity loaders on a scaled-up commodities file."""
+import csv
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+from webapp.products.etl import DEFAULT_PLU_CSV, load_plu_commodities, load_plu_rows
+
+logger = logging.getLogger(__name__)
+
+# Copies of data/commodities.csv concatenated into the benchmark input
+DEFAULT_SCALE = int(os.getenv("BENCH_PLU_SCALE", "1000"))
+
+
+def make_scaled_csv(source: Path, target: Path, scale: int) -> int:
+    """Write source's header followed by its rows repeated scale times.
+    
+    Returns:
+        Number of data rows written
+    """
+    header, *lines = source.read_text().splitlines(keepends=True)
+    with target.open("w") as f:
+        f.write(header)
+        for _ in range(scale):
+            f.writelines(lines)
+    with source.open(newline="") as f:
+        records = sum(1 for _ in csv.reader(f)) - 1
+    return records * scale
+
+
+def time_loader(name: str, load: Callable[[], int], rows: int) -> float:
+    """Run a loader once and log its wall time and throughput."""
+    started = time.perf_counter()
+    loaded = load()
+    elapsed = time.perf_counter() - started
+    logger.info(f"{name}: {loaded} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s)")
+    return elapsed
+
+
+def main(scale: int = DEFAULT_SCALE) -> None:
+    """Compare load_plu_commodities with the load_plu_rows fast path."""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / "commodities.csv"
+        rows = make_scaled_csv(DEFAULT_PLU_CSV, csv_path, scale)
+        logger.info(f"PLU loader benchmark: {rows} rows ({scale}x {DEFAULT_PLU_CSV})")
+        
+        fast = time_loader("load_plu_rows", lambda: sum(1 for _ in load_plu_rows(csv_path)), rows)
+        models = time_loader("load_plu_commodities", lambda: len(load_plu_commodities(csv_path)), rows)
+        logger.info(f"load_plu_rows speedup: {models / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
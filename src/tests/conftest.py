@@ -1,7 +1,18 @@
 """Test configuration and fixtures."""
+import os
+
 import pytest
 from sqlmodel import Session, SQLModel, create_engine
 
+from webapp.config import engine
+from webapp.migrations import apply_migrations
+
+# Fail tests on query budget violations, so N+1 regressions are caught before they ship
+os.environ.setdefault("QUERY_BUDGET_MODE", "raise")
+
+# The app only checks the schema version at import, so bring the test database up to date first
+apply_migrations(engine)
+
 
 @pytest.fixture
 def session():
@@ -0,0 +1,141 @@
+"""Tests for the shopping basket optimizer."""
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import combinations
+
+import pytest
+from sqlmodel import Session
+
+from webapp.database import SQLITE_DATETIME_FORMAT
+from webapp.products.basket import _UNSTOCKED, cheapest_split, quote_basket
+from webapp.products.models import BasketItem, Product, ProductPrice
+from webapp.products.prices import INSERT_PRICE_SQL
+from webapp.stores.models import Store
+
+START = datetime(2025, 6, 1)
+
+
+def split_total(costs, rows):
+    """Total of buying each item at the cheapest of the given rows."""
+    return sum(min(costs[row][column] for row in rows) for column in range(len(costs[0])))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_cheapest_split_matches_exhaustive_search(seed):
+    """Should find the same optimum as trying every combination."""
+    rng = random.Random(seed)
+    stores, items, max_stores = rng.randint(1, 8), rng.randint(1, 6), rng.randint(1, 3)
+    costs = [[rng.choice([_UNSTOCKED, *range(100, 110)]) for _ in range(items)] for _ in range(stores)]
+    
+    totals = [
+        split_total(costs, rows)
+        for size in range(1, max_stores + 1)
+        for rows in combinations(range(stores), size)
+    ]
+    expected = min((total for total in totals if total < _UNSTOCKED), default=None)
+    
+    rows, exact = cheapest_split(costs, max_stores)
+    assert exact, "Should finish small searches within budget"
+    if expected is None:
+        assert rows is None, "Should report baskets no split can cover"
+    else:
+        assert len(rows) <= max_stores, "Should respect the store limit"
+        assert split_total(costs, rows) == expected, "Should find the cheapest split"
+
+
+@pytest.fixture
+def market(session: Session):
+    """Three products priced at three stores, two of them in Chattanooga."""
+    products = [Product(name=name, upc=upc) for name, upc in [("Bananas", "4011"), ("Limes", "4048"), ("Kiwi", "4030")]]
+    stores = [
+        Store(name="Food City", address="1 Main St", city="Chattanooga", state="TN", zip_code="37402"),
+        Store(name="Publix", address="2 Main St", city="Chattanooga", state="TN", zip_code="37402"),
+        Store(name="Kroger", address="3 Main St", city="Knoxville", state="TN", zip_code="37902"),
+    ]
+    session.add_all(products + stores)
+    session.commit()
+    
+    prices = [
+        # (product, store, price, day)
+        (0, 0, "0.99", 0), (0, 0, "0.59", 1), (1, 0, "0.50", 0), (2, 0, "1.00", 0),
+        (0, 1, "0.79", 0), (1, 1, "0.25", 0), (2, 1, "1.25", 0),
+        (0, 2, "0.10", 0), (1, 2, "0.10", 0), (2, 2, "0.10", 0),
+    ]
+    session.add_all([
+        ProductPrice(product_id=products[p].id, store_id=stores[s].id, price=Decimal(price), observed_at=START + timedelta(days=day))
+        for p, s, price, day in prices
+    ])
+    session.commit()
+    return products, stores
+
+
+def test_quote_basket_single_store_and_split(session: Session, market):
+    """Should price the basket at latest prices within the city filter."""
+    products, stores = market
+    items = [BasketItem(product_id=products[0].id, quantity=2), BasketItem(product_id=products[1].id, quantity=4), BasketItem(product_id=products[2].id)]
+    
+    quote = quote_basket(session, items, max_stores=2, city="Chattanooga")
+    assert quote.cheapest_store.store_ids == [stores[1].id], "Should pick the cheapest single store"
+    assert quote.cheapest_store.total == Decimal("3.83"), "Should price the basket by quantity"
+    assert quote.cheapest_split.total == Decimal("3.18"), "Should buy bananas and kiwi at their latest cheaper price"
+    assert quote.cheapest_split.store_ids == sorted([stores[0].id, stores[1].id]), "Should split across both stores"
+    assert quote.cheapest_split.exact, "Should prove the split optimal"
+
+
+def test_quote_basket_reports_missing_products(session: Session, market):
+    """Should leave unpriced products out of both plans."""
+    products, stores = market
+    quote = quote_basket(session, [BasketItem(product_id=products[0].id), BasketItem(product_id=9999)], city="Knoxville")
+    assert quote.missing == [9999], "Should list products no store prices"
+    assert quote.cheapest_store.total == Decimal("0.10"), "Should price the rest of the basket"
+
+
+@pytest.fixture
+def random_market(session: Session):
+    """12 products priced independently at random at each of 30 stores, as cents by store row."""
+    rng = random.Random(0)
+    products = [Product(name=f"Product {i}", upc=f"{i:05d}") for i in range(12)]
+    stores = [
+        Store(name=f"Store {i}", address=f"{i} Main St", city="Chattanooga", state="TN", zip_code="37402")
+        for i in range(30)
+    ]
+    session.add_all(products + stores)
+    session.commit()
+    
+    costs = [[rng.randint(100, 500) for _ in products] for _ in stores]
+    observed = START.strftime(SQLITE_DATETIME_FORMAT)
+    session.connection().exec_driver_sql(INSERT_PRICE_SQL, [
+        (product.id, store.id, costs[row][column] / 100, observed)
+        for row, store in enumerate(stores) for column, product in enumerate(products)
+    ])
+    session.commit()
+    return products, costs
+
+
+@pytest.mark.parametrize("max_stores", [2, 3])
+def test_quote_basket_exact_split(session: Session, random_market, max_stores):
+    """Should prove the cheapest split when asked for an exact quote."""
+    products, costs = random_market
+    expected = min(
+        split_total(costs, rows)
+        for size in range(1, max_stores + 1)
+        for rows in combinations(range(len(costs)), size)
+    )
+    
+    quote = quote_basket(session, [BasketItem(product_id=product.id) for product in products], max_stores=max_stores, exact=True)
+    assert quote.cheapest_split.exact, "Should finish the search"
+    assert quote.cheapest_split.total == Decimal(expected) / 100, "Should find the cheapest split"
+    assert len(quote.cheapest_split.store_ids) <= max_stores, "Should respect the store limit"
+
+
+@pytest.mark.parametrize("max_stores", [2, 3])
+def test_cheapest_split_at_deadline_keeps_greedy_split(max_stores):
+    """Should return the greedy split, unproven, when the deadline has already passed."""
+    rng = random.Random(0)
+    costs = [[rng.randint(100, 500) for _ in range(50)] for _ in range(400)]
+    
+    rows, exact = cheapest_split(costs, max_stores, deadline=0)
+    assert not exact, "Should report the split as unproven"
+    assert len(rows) == max_stores, "Should complete the greedy split before stopping"
+    assert split_total(costs, rows) < min(map(sum, costs)), "Should beat the cheapest single store"
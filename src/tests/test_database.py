@@ -0,0 +1,78 @@
+"""Tests for database utilities."""
+import asyncio
+import contextvars
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from webapp.cache import PRODUCTS, STORES, bump_data_version
+from webapp.database import DB_POOL_SIZE, engine, run_in_db
+from webapp.main import app
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def _db_work(value: int) -> tuple:
+    """Report which thread ran and what context it saw."""
+    return threading.current_thread().name, request_id.get(), value * 2
+
+
+def test_run_in_db_uses_db_pool():
+    """Should run work off the event loop thread with the caller's context."""
+    async def run():
+        request_id.set("abc")
+        return await run_in_db(_db_work, 21)
+    
+    thread_name, seen_id, result = asyncio.run(run())
+    assert thread_name.startswith("db"), "Should run on a DB pool thread"
+    assert seen_id == "abc", "Should copy context variables into the worker"
+    assert result == 42, "Should return the function's result"
+
+
+def test_run_in_db_propagates_errors():
+    """Should raise the worker's exception in the awaiting coroutine."""
+    with pytest.raises(ZeroDivisionError):
+        asyncio.run(run_in_db(lambda: 1 / 0))
+
+
+def test_run_in_db_keeps_loop_responsive():
+    """Should let other coroutines run while blocking work waits."""
+    async def run():
+        release = threading.Event()
+        work = asyncio.ensure_future(run_in_db(release.wait, 5))
+        await asyncio.sleep(0)
+        release.set()
+        return await work
+    
+    assert asyncio.run(run()) is True, "Should complete once the loop releases the worker"
+    assert DB_POOL_SIZE >= 1, "Should configure at least one DB thread"
+
+
+@pytest.mark.parametrize("path", ["/stores/", "/products/", "/products/price-matrix"])
+def test_routes_query_through_db_pool(path):
+    """Should serve database-backed routes through the DB pool."""
+    client = TestClient(app)
+    response = client.get(path)
+    assert response.status_code == 200, f"Should serve {path}"
+
+
+def test_ingest_route_queries_off_the_loop():
+    """Should load the ingester's lookups on the DB pool, not the event loop."""
+    threads = []
+    
+    def record_thread(conn, cursor, statement, parameters, context, executemany):
+        threads.append(threading.current_thread().name)
+    
+    # Force the UPC and store lookups to be reloaded
+    bump_data_version(PRODUCTS)
+    bump_data_version(STORES)
+    event.listen(engine, "before_cursor_execute", record_thread)
+    try:
+        response = TestClient(app).post("/products/prices/ingest", content=b"", headers={"content-type": "application/x-ndjson"})
+    finally:
+        event.remove(engine, "before_cursor_execute", record_thread)
+    assert response.status_code == 200, "Should accept an empty feed"
+    assert threads, "Should load the lookups"
+    assert all(name.startswith("db") for name in threads), f"Should only query on DB threads, saw {set(threads)}"
@@ -0,0 +1,43 @@
+"""Tests for fake price generation."""
+from datetime import datetime
+from decimal import Decimal
+
+from sqlmodel import Session, func, select
+
+from webapp.products.fakeit import PRICE_POINTS, generate_price_history, save_price_history
+from webapp.products.models import BestPrice, Product, ProductPrice
+from webapp.stores.models import Store
+
+END = datetime(2025, 6, 30)
+
+
+def test_generate_price_history_is_seeded():
+    """Same seed should yield the same rows, one per product, store and day."""
+    first = list(generate_price_history([1, 2], [10, 20, 30], days=7, seed=42, end=END))
+    again = list(generate_price_history([1, 2], [10, 20, 30], days=7, seed=42, end=END))
+    assert first == again, "Should be reproducible from a seed"
+    assert len(first) == 2 * 3 * 7, "Should yield every product, store and day"
+    assert {round(row[2] * 100) for row in first} <= set(PRICE_POINTS), "Should only use retail price points"
+    assert first[-1][3].startswith("2025-06-30 00:00:00"), "Should end on the given day"
+
+
+def test_save_price_history_refreshes_best_prices(session: Session):
+    """Bulk saved rows should read back as Decimals and set best prices."""
+    product = Product(name="Bananas", upc="4011")
+    stores = [
+        Store(name=f"Store {i}", address=f"{i} Main St", city="Chattanooga", state="TN", zip_code="37402")
+        for i in range(2)
+    ]
+    session.add(product)
+    session.add_all(stores)
+    session.commit()
+    
+    rows = list(generate_price_history([product.id], [store.id for store in stores], days=30, seed=7, end=END))
+    written = save_price_history(session, rows, batch_size=25)
+    assert written == 60, "Should write every generated row"
+    assert session.scalar(select(func.count()).select_from(ProductPrice)) == 60, "Should store every row"
+    
+    latest = {row[1]: row[2] for row in rows if row[3].startswith("2025-06-30")}
+    best = session.get(BestPrice, product.id)
+    assert best is not None, "Should record a best price"
+    assert best.price == Decimal(str(min(latest.values()))).quantize(Decimal(".01")), "Should pick the lowest latest price"
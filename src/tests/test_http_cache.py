@@ -0,0 +1,70 @@
+"""Tests for whole-response caching with ETags."""
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from webapp.cache import PRICES, STORES, SharedVersions, bump_data_version
+from webapp.database import engine
+from webapp.http_cache import _etag_matches
+from webapp.main import app
+from webapp.stores.etl import save_stores_to_db
+from webapp.stores.models import Store
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def zephyr_store():
+    """Remove the test store once the test is done."""
+    yield "Zephyr Market"
+    with Session(engine) as session:
+        for store in session.exec(select(Store).where(Store.name == "Zephyr Market")):
+            session.delete(store)
+        session.commit()
+    bump_data_version(STORES)
+
+
+def test_conditional_request_gets_304():
+    """Should answer a request naming the current ETag with 304 and no body."""
+    first = client.get("/stores/")
+    etag = first.headers["etag"]
+    assert etag.startswith('"'), "Should send a strong ETag"
+    assert client.get("/stores/").headers["etag"] == etag, "Should serve the same page again"
+    
+    cached = client.get("/stores/", headers={"If-None-Match": etag})
+    assert cached.status_code == 304, "Should confirm the client's copy is current"
+    assert cached.content == b"", "Should not resend the body"
+
+
+def test_write_invalidates_cached_page(zephyr_store):
+    """Should re-render a cached page once a write bumps its data scope."""
+    before = client.get("/stores/", params={"q": "zephyr"})
+    assert zephyr_store not in before.text, "Should not list the store before it exists"
+    
+    save_stores_to_db(iter([Store(name=zephyr_store, address="1 Wind St", city="Springfield", state="MA", zip_code="01234")]))
+    after = client.get("/stores/", params={"q": "zephyr"}, headers={"If-None-Match": before.headers["etag"]})
+    assert after.status_code == 200, "Should not confirm a stale ETag"
+    assert zephyr_store in after.text, "Should list the new store"
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ('"abc"', True),
+    ('"xyz", "abc"', True),
+    ("*", True),
+    ('W/"abc"', True),
+    ('"xyz", W/"abc"', True),
+    ('W/"xyz"', False),
+])
+def test_etag_matches(header, expected):
+    """Should match If-None-Match lists weakly."""
+    assert _etag_matches(header, '"abc"') is expected, f"{header} should match: {expected}"
+
+
+def test_shared_versions_cross_processes(tmp_path):
+    """Should let every mapping of the version file see a bump."""
+    path = tmp_path / "versions"
+    worker_a, worker_b = SharedVersions(path), SharedVersions(path)
+    worker_a.bump(STORES)
+    assert worker_b.get(STORES) == 1, "Should see a bump made through another mapping"
+    assert worker_b.get(PRICES) == 0, "Should leave other scopes alone"
@@ -0,0 +1,119 @@
+"""Tests for streaming price ingestion."""
+import asyncio
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from webapp.cache import PRODUCTS, STORES, bump_data_version
+from webapp.main import app
+from webapp.products.ingest import IngestFormatError, PriceIngester, aiter_lines, ingest_format
+from webapp.products.models import CurrentPrice, Product, ProductPrice
+from webapp.stores.models import Store
+
+
+@pytest.fixture
+def catalog(session: Session):
+    """One product with a UPC and one store."""
+    product = Product(name="Bananas", upc="4011")
+    store = Store(name="Food City", address="1 Main St", city="Chattanooga", state="TN", zip_code="37402")
+    session.add_all([product, store])
+    session.commit()
+    bump_data_version(PRODUCTS, STORES)
+    return product, store
+
+
+def ingest(session: Session, format: str, lines, batch_size: int = 2):
+    """Feed lines through an ingester and return its result."""
+    ingester = PriceIngester(session, format, batch_size=batch_size)
+    for line in lines:
+        ingester.feed(line)
+    return ingester.finish()
+
+
+def test_ingest_ndjson_batches_and_deduplicates(session: Session, catalog):
+    """Should resolve UPCs, skip repeats and reject bad rows, per batch."""
+    product, store = catalog
+    lines = [
+        f'{{"upc": "4011", "store_id": {store.id}, "price": "0.59", "observed_at": "2025-06-01T09:00:00Z"}}',
+        f'{{"product_id": {product.id}, "store_id": {store.id}, "price": 0.59, "observed_at": "2025-06-01T09:00:00"}}',
+        f'{{"upc": "9999", "store_id": {store.id}, "price": "0.59"}}',
+        f'{{"upc": "4011", "store_id": {store.id}, "price": "0.49", "observed_at": "2025-06-02T09:00:00"}}',
+        "not json",
+    ]
+    result = ingest(session, "ndjson", lines)
+    assert [batch.received for batch in result.batches] == [2, 2, 1], "Should commit every batch_size rows"
+    assert result.accepted == 2, "Should write each distinct observation once"
+    assert result.duplicates == 1, "Should count the repeated observation"
+    assert result.rejected == 2, "Should reject unknown UPCs and malformed lines"
+    assert "unknown upc 9999" in result.batches[1].errors[0], "Should explain rejections"
+    
+    again = ingest(session, "ndjson", lines[:1])
+    assert again.duplicates == 1, "Should skip observations already stored"
+    current = session.get(CurrentPrice, (product.id, store.id))
+    assert current.price == Decimal("0.49"), "Should update current prices"
+
+
+def test_ingest_csv(session: Session, catalog):
+    """Should read CSV rows by header name."""
+    product, store = catalog
+    result = ingest(session, "csv", ["upc,store_id,price,observed_at", f"4011,{store.id},1.25,2025-06-01 08:00:00", f"4011,{store.id}"])
+    assert (result.accepted, result.rejected) == (1, 1), "Should accept complete rows only"
+    price = session.exec(select(ProductPrice)).one()
+    assert (price.price, price.observed_at) == (Decimal("1.25"), datetime(2025, 6, 1, 8)), "Should store the row"
+
+
+def test_ingest_rejects_unknown_product_id(session: Session, catalog):
+    """Should reject product ids that name no product rather than write orphan prices."""
+    product, store = catalog
+    result = ingest(session, "ndjson", [
+        f'{{"product_id": {product.id + 1}, "store_id": {store.id}, "price": "0.59"}}',
+        f'{{"product_id": {product.id}, "store_id": {store.id}, "price": "0.59"}}',
+    ])
+    assert (result.accepted, result.rejected) == (1, 1), "Should only accept the known product"
+    assert f"unknown product_id {product.id + 1}" in result.batches[0].errors[0], "Should explain the rejection"
+    assert session.exec(select(ProductPrice.product_id)).all() == [product.id], "Should not store the unknown product's price"
+    assert session.get(CurrentPrice, (product.id + 1, store.id)) is None, "Should not derive a current price for it"
+
+
+def test_ingest_route_rejects_unknown_product_id():
+    """Should report a posted unknown product id in the batch stats."""
+    response = TestClient(app).post(
+        "/products/prices/ingest",
+        content=b'{"product_id": -1, "store_id": 1, "price": "1.00"}\n',
+        headers={"content-type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200, "Should accept the feed"
+    body = response.json()
+    assert (body["accepted"], body["rejected"]) == (0, 1), "Should reject the row"
+    assert body["batches"][0]["errors"] == ["line 1: unknown product_id -1"], "Should name the unknown product id"
+
+
+def test_aiter_lines_splits_across_chunks():
+    """Should reassemble lines split across body chunks."""
+    async def chunks():
+        for chunk in [b'{"a": 1}\n{"b"', b': 2}\r\n', b'{"c": 3}']:
+            yield chunk
+    
+    async def collect():
+        return [line async for line in aiter_lines(chunks())]
+    
+    assert asyncio.run(collect()) == ['{"a": 1}', '{"b": 2}', '{"c": 3}'], "Should yield whole lines"
+
+
+@pytest.mark.parametrize("content_type,override,expected", [
+    ("application/x-ndjson", None, "ndjson"),
+    ("text/csv; charset=utf-8", None, "csv"),
+    ("application/octet-stream", "csv", "csv"),
+])
+def test_ingest_format(content_type, override, expected):
+    """Should pick the format from the parameter or Content-Type."""
+    assert ingest_format(content_type, override) == expected
+
+
+def test_ingest_format_rejects_unknown():
+    """Should reject bodies in unsupported formats."""
+    with pytest.raises(IngestFormatError):
+        ingest_format("application/xml")
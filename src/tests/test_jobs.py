@@ -0,0 +1,158 @@
+"""Tests for the background job runner."""
+import os
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+from sqlmodel import Session, col
+
+from webapp.database import engine
+from webapp.jobs.models import FAILED, RUNNING, SUCCEEDED, Job
+from webapp.jobs import runner
+from webapp.jobs.runner import (
+    fail_abandoned_jobs,
+    fail_interrupted_jobs,
+    get_job_status,
+    report_progress,
+    submit_job,
+    wait_for_job,
+)
+from webapp.main import app
+from webapp.writer import get_writer
+
+
+def _counting_job(session: Session) -> str:
+    """Job reporting progress over three batches."""
+    for _ in range(3):
+        report_progress(rows_read=10, rows_written=7)
+    return "done"
+
+
+def _failing_job(session: Session) -> str:
+    """Job that fails partway through."""
+    report_progress(rows_read=5)
+    raise ValueError("bad row")
+
+
+@pytest.mark.parametrize("func, status, message, rows_read, rows_written", [
+    (_counting_job, SUCCEEDED, "done", 30, 21),
+    (_failing_job, FAILED, "bad row", 5, 0),
+])
+def test_job_records_outcome(func, status, message, rows_read, rows_written):
+    """Should persist the job's outcome and final progress counters."""
+    job_id = submit_job("test", func)
+    wait_for_job(job_id, timeout=30)
+    
+    with Session(engine) as session:
+        job = get_job_status(session, job_id)
+    assert job is not None, "Should find the submitted job"
+    assert job.status == status, f"Should record the job as {status}"
+    assert job.message == message, "Should record the summary or error"
+    assert (job.rows_read, job.rows_written) == (rows_read, rows_written), "Should persist progress counters"
+    assert job.finished, "Should report the job as finished"
+
+
+def test_report_progress_outside_job():
+    """Should ignore progress reports from code not running in a job."""
+    report_progress(rows_read=1, rows_written=1)
+
+
+def test_fail_interrupted_jobs():
+    """Should fail jobs a previous process left running."""
+    with Session(engine) as session:
+        job = Job(kind="test", status=RUNNING)
+        session.add(job)
+        session.commit()
+        job_id = job.id
+    
+    assert fail_interrupted_jobs(engine) >= 1, "Should mark the orphaned job"
+    with Session(engine) as session:
+        assert session.get(Job, job_id).status == FAILED, "Should fail the orphaned job"
+
+
+@pytest.fixture(scope="module")
+def exited_pid() -> int:
+    """PID of a process that has already exited."""
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+@pytest.mark.parametrize("owner_exited, status", [
+    (False, RUNNING),
+    (True, FAILED),
+])
+def test_fail_abandoned_jobs(exited_pid, owner_exited, status):
+    """Should fail a running job once its owner has exited, however stale its heartbeat."""
+    with Session(engine) as session:
+        job = Job(
+            kind="test",
+            status=RUNNING,
+            owner_pid=exited_pid if owner_exited else os.getpid(),
+            heartbeat_at=datetime.utcnow() - timedelta(days=1)
+        )
+        session.add(job)
+        session.commit()
+        job_id = job.id
+        assert get_job_status(session, job_id).status == RUNNING, "Should only read on a status read"
+    
+    with Session(engine) as session:
+        assert session.get(Job, job_id).status == RUNNING, "Should not write on a status read"
+    fail_abandoned_jobs()
+    with Session(engine) as session:
+        assert session.get(Job, job_id).status == status, f"Should persist the job as {status}"
+
+
+def test_heartbeat_runs_without_progress(monkeypatch):
+    """Should stamp a running job that never reports progress."""
+    monkeypatch.setattr(runner, "JOB_HEARTBEAT_INTERVAL", 0.01)
+    
+    def quiet_job(session: Session) -> str:
+        time.sleep(0.2)
+        return "done"
+    
+    job_id = submit_job("test", quiet_job)
+    wait_for_job(job_id, timeout=30)
+    with Session(engine) as session:
+        job = session.get(Job, job_id)
+        assert job.heartbeat_at > job.started_at, "Should heartbeat while the body runs"
+
+
+def test_job_outcome_keeps_failure():
+    """Should not overwrite a job failed while its body was still running."""
+    kind = f"reaped-{uuid.uuid4()}"
+    
+    def reaped_job(session: Session) -> str:
+        get_writer(engine).submit(lambda writer: writer.connection().execute(
+            update(Job).where(col(Job.kind) == kind).values(status=FAILED, message="Interrupted")
+        )).result()
+        return "done"
+    
+    job_id = submit_job(kind, reaped_job)
+    wait_for_job(job_id, timeout=30)
+    with Session(engine) as session:
+        job = session.get(Job, job_id)
+        assert (job.status, job.message) == (FAILED, "Interrupted"), "Should keep the failure"
+
+
+def test_import_route_runs_as_job():
+    """Should answer an import request immediately and expose the job's status."""
+    client = TestClient(app)
+    response = client.post("/products/fake-prices", follow_redirects=False)
+    assert response.status_code == 303, "Should redirect without waiting for the import"
+    job_id = int(response.headers["location"].split("job=")[1])
+    
+    wait_for_job(job_id, timeout=60)
+    status = client.get(f"/jobs/{job_id}").json()
+    assert status["kind"] == "fake-prices", "Should report the job kind"
+    assert status["status"] == SUCCEEDED, "Should complete the job"
+    
+    fragment = client.get(f"/jobs/{job_id}", headers={"HX-Request": "true"})
+    assert f"Job #{job_id}" in fragment.text, "Should render the HTMX status fragment"
+    assert "hx-trigger" not in fragment.text, "Should stop polling a finished job"
+    assert client.get("/jobs/999999").status_code == 404, "Should 404 on unknown jobs"
@@ -1,7 +1,9 @@
+import os
+
 import pytest
 from fastapi.testclient import TestClient
 
-from webapp.main import app
+from webapp.main import UnknownServerModeError, app, main, server_workers
 
 client = TestClient(app)
 
@@ -14,3 +16,26 @@ def test_root():
     response = client.get("/")
     assert response.status_code == 200, "Root endpoint should return 200"
     assert "text/html" in response.headers["content-type"], "Root should return HTML"
+
+
+@pytest.mark.parametrize("path", ["/stores/", "/products/"])
+def test_list_pages(path):
+    """List pages should render and reject malformed cursors."""
+    response = client.get(path)
+    assert response.status_code == 200, f"{path} should return 200"
+    response = client.get(path, params={"after": "not-a-cursor"})
+    assert response.status_code == 400, f"{path} should reject a malformed cursor"
+
+
+@pytest.mark.parametrize("value, expected", [("3", 3), ("0", os.cpu_count() or 1)])
+def test_server_workers(monkeypatch, value, expected):
+    """Production worker count should come from SERVER_WORKERS, defaulting to the cores."""
+    monkeypatch.setenv("SERVER_WORKERS", value)
+    assert server_workers() == expected, f"SERVER_WORKERS={value} should give {expected} workers"
+
+
+def test_main_rejects_unknown_mode(monkeypatch):
+    """Startup should refuse a server mode it does not know."""
+    monkeypatch.setenv("SERVER_MODE", "staging")
+    with pytest.raises(UnknownServerModeError):
+        main()
@@ -0,0 +1,73 @@
+"""Tests for product by store price matrices."""
+import json
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from sqlmodel import Session
+
+from webapp.cache import PRICES, bump_data_version
+from webapp.products.matrix import build_price_matrix, price_matrix_json
+from webapp.products.models import PluCommodity, Product, ProductPrice
+from webapp.stores.models import Store
+
+
+@pytest.fixture
+def market(session: Session):
+    """Two fruits and a vegetable priced at stores in two cities."""
+    plus = [
+        PluCommodity(plu=plu, type="Global", category=category, commodity=name, variety="", size="All", status="Approved", updated_by="test")
+        for plu, category, name in [("4011", "Fruits", "Bananas"), ("4048", "Fruits", "Limes"), ("4062", "Vegetables", "Cucumbers")]
+    ]
+    products = [Product(name=plu.commodity, upc=plu.plu) for plu in plus]
+    stores = [
+        Store(name="Food City", address="1 Main St", city="Chattanooga", state="TN", zip_code="37402"),
+        Store(name="Publix", address="2 Main St", city="Chattanooga", state="TN", zip_code="37402"),
+        Store(name="Kroger", address="3 Main St", city="Knoxville", state="TN", zip_code="37902"),
+    ]
+    session.add_all(plus + products + stores)
+    session.commit()
+    session.add_all([
+        ProductPrice(product_id=products[p].id, store_id=stores[s].id, price=Decimal(price), observed_at=datetime(2025, 6, day))
+        for p, s, price, day in [(0, 0, "0.99", 1), (0, 0, "0.59", 2), (0, 1, "0.79", 1), (1, 1, "0.25", 1), (2, 0, "1.00", 1), (0, 2, "0.10", 1)]
+    ])
+    session.commit()
+    return products, stores
+
+
+def test_build_price_matrix_pivots_current_prices(session: Session, market):
+    """Should lay out current prices by product name and store name."""
+    matrix = build_price_matrix(session, category="Fruits", city="Chattanooga")
+    assert [product.name for product in matrix.products] == ["Bananas", "Limes"], "Should filter products by PLU category"
+    assert [store.name for store in matrix.stores] == ["Food City", "Publix"], "Should filter stores by city"
+    assert matrix.prices == [
+        [Decimal("0.59"), Decimal("0.79")],
+        [None, Decimal("0.25")],
+    ], "Should hold each store's latest price and None where unpriced"
+    assert not matrix.truncated, "Should not flag a matrix holding every match"
+
+
+@pytest.mark.parametrize("max_products, max_stores, truncated", [
+    (3, 3, False),
+    (2, 3, True),
+    (3, 2, True),
+])
+def test_build_price_matrix_flags_truncation(session: Session, market, max_products, max_stores, truncated):
+    """Should flag a matrix cut at either axis's maximum."""
+    matrix = build_price_matrix(session, max_products=max_products, max_stores=max_stores)
+    assert len(matrix.products) == min(max_products, 3), "Should hold at most max_products rows"
+    assert len(matrix.stores) == min(max_stores, 3), "Should hold at most max_stores columns"
+    assert matrix.truncated == truncated, "Should flag whether more products or stores matched"
+
+
+def test_price_matrix_json_is_cached_until_prices_change(session: Session, market):
+    """Should serve the cached matrix until a price write bumps the version."""
+    products, stores = market
+    first = price_matrix_json(session, city="Knoxville")
+    session.add(ProductPrice(product_id=products[0].id, store_id=stores[2].id, price=Decimal("0.20"), observed_at=datetime(2025, 6, 3)))
+    session.commit()
+    assert price_matrix_json(session, city="Knoxville") == first, "Should serve the cached matrix"
+    
+    bump_data_version(PRICES)
+    body = json.loads(price_matrix_json(session, city="Knoxville"))
+    assert body["prices"][0] == ["0.20"], "Should rebuild the matrix after a price write"
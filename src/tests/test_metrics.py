@@ -0,0 +1,73 @@
+"""Tests for request metrics and the Prometheus endpoint."""
+import logging
+
+import pytest
+from fastapi.testclient import TestClient
+
+from webapp import metrics
+from webapp.metrics import Counter, Histogram, render_metrics
+from webapp.main import app
+
+client = TestClient(app)
+
+
+def _sample(name: str, **labels: str) -> float:
+    """Current value of one sample in the rendered metrics, 0 if absent."""
+    wanted = "{" + ",".join(f'{key}="{value}"' for key, value in sorted(labels.items())) + "}"
+    for line in render_metrics().splitlines():
+        if line.startswith(name + wanted + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_metrics_endpoint_serves_prometheus_text():
+    """Should expose metrics in the Prometheus text format."""
+    client.get("/stores/")
+    response = client.get("/api/metrics")
+    assert response.status_code == 200, "Should serve metrics"
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4"), "Should use the text format"
+    assert "# TYPE http_request_duration_seconds histogram" in response.text, "Should describe the latency histogram"
+    assert 'route="/stores/"' in response.text, "Should label requests by route template"
+
+
+def test_requests_count_queries_per_route():
+    """Should count requests by route template and the SQL they ran."""
+    before = _sample("http_requests_total", method="GET", route="/products/", status="200")
+    queries_before = _sample("db_queries_total", route="/products/")
+    
+    client.get("/products/", params={"q": "metrics-test"})
+    
+    after = _sample("http_requests_total", method="GET", route="/products/", status="200")
+    assert after == before + 1, "Should count the request under its route"
+    assert _sample("db_queries_total", route="/products/") > queries_before, "Should count queries run on the DB pool"
+    assert _sample("http_requests_in_flight") == 0, "Should finish with no requests in flight"
+
+
+def test_slow_requests_log_their_sql(monkeypatch, caplog):
+    """Should log the SQL run by requests over the slow threshold."""
+    monkeypatch.setattr(metrics, "SLOW_REQUEST_SECONDS", 0.0)
+    with caplog.at_level(logging.WARNING, logger="webapp.metrics"):
+        client.get("/products/", params={"q": "slow-test"})
+    assert "Slow request GET /products/" in caplog.text, "Should log the slow request"
+    assert "SELECT" in caplog.text, "Should include the SQL it executed"
+
+
+@pytest.mark.parametrize("value, buckets", [
+    (0.001, [1, 1, 1]),
+    (0.05, [0, 1, 1]),
+    (5.0, [0, 0, 1]),
+])
+def test_histogram_buckets_are_cumulative(value, buckets):
+    """Should count an observation in every bucket at or above it."""
+    histogram = Histogram("test_seconds", "Test histogram", buckets=(0.01, 0.1))
+    histogram.observe(value, route="/x")
+    counts = [count for name, _, count in histogram.samples() if name == "test_seconds_bucket"]
+    assert counts == buckets, f"{value} should land in buckets {buckets}"
+
+
+def test_label_values_are_escaped():
+    """Should escape quotes, backslashes and newlines in label values."""
+    counter = Counter("test_total", "Test counter")
+    counter.inc(route='a"b\\c\nd')
+    name, labels, _ = counter.samples()[0]
+    assert metrics._format_labels(labels) == '{route="a\\"b\\\\c\\nd"}', "Should escape the label value"
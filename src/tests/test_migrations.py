@@ -0,0 +1,91 @@
+"""Tests for the versioned migration runner."""
+import importlib
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import text
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from webapp.migrations import (
+    SchemaOutOfDateError,
+    apply_migrations,
+    available_migrations,
+    check_schema,
+    current_version,
+)
+from webapp.products.models import BestPrice, CurrentPrice, Product, ProductPrice, ProductPriceSnapshot
+from webapp.products.snapshots import OPEN_ENDED, compact_price_snapshots
+from webapp.stores.models import Store
+
+
+@pytest.fixture
+def fresh_engine(tmp_path):
+    """Engine on an empty database file."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.sqlite'}")
+    yield engine
+    engine.dispose()
+
+
+def test_available_migrations_are_ordered():
+    """Should list numbered migration modules in version order."""
+    versions = [version for version, _ in available_migrations()]
+    assert versions == sorted(versions) and versions[0] == 1, "Should start at 1 and ascend"
+    assert len(set(versions)) == len(versions), "Should not reuse a version number"
+
+
+def test_apply_migrations_runs_each_once(fresh_engine):
+    """Should apply every migration to a new database and skip them afterwards."""
+    latest = available_migrations()[-1][0]
+    with pytest.raises(SchemaOutOfDateError):
+        check_schema(fresh_engine)
+    
+    applied = apply_migrations(fresh_engine)
+    assert applied == [version for version, _ in available_migrations()], "Should apply every migration in order"
+    assert current_version(fresh_engine) == latest, "Should record the latest version"
+    assert check_schema(fresh_engine) == latest, "Should pass the startup check"
+    assert apply_migrations(fresh_engine) == [], "Should skip migrations already applied"
+
+
+def test_store_dedupe_keeps_prices(fresh_engine):
+    """Should move prices of duplicate stores to the kept store before deleting duplicates."""
+    SQLModel.metadata.create_all(fresh_engine)
+    with fresh_engine.begin() as conn:
+        # A database from before stores were unique on (name, address)
+        conn.execute(text("DROP INDEX ix_store_name_address"))
+    
+    observed = datetime(2025, 6, 1)
+    with Session(fresh_engine) as session:
+        product = Product(name="Bananas", upc="4011")
+        kept, duplicate = (
+            Store(name="Food City", address="1375 Broad St", city="Chattanooga", state="TN", zip_code="37402")
+            for _ in range(2)
+        )
+        session.add_all([product, kept, duplicate])
+        session.commit()
+        session.add_all([
+            ProductPrice(product_id=product.id, store_id=kept.id, price=Decimal("1.99"), observed_at=observed),
+            ProductPrice(product_id=product.id, store_id=duplicate.id, price=Decimal("0.99"), observed_at=observed + timedelta(days=1)),
+            BestPrice(product_id=product.id, store_id=duplicate.id, price=Decimal("0.99"), observed_at=observed + timedelta(days=1)),
+        ])
+        session.commit()
+        compact_price_snapshots(session)
+        kept_id, duplicate_id, product_id = kept.id, duplicate.id, product.id
+    
+    importlib.import_module("webapp.migrations.002_store_name_address_unique").run_migration(fresh_engine)
+    
+    with Session(fresh_engine) as session:
+        assert session.get(Store, duplicate_id) is None, "Should delete the duplicate store"
+        prices = session.exec(select(ProductPrice.store_id, ProductPrice.price).order_by(ProductPrice.observed_at)).all()
+        assert prices == [(kept_id, Decimal("1.99")), (kept_id, Decimal("0.99"))], "Should keep every price on the kept store"
+        assert session.get(BestPrice, product_id).store_id == kept_id, "Should repoint the best price"
+        current = session.exec(select(CurrentPrice)).all()
+        assert [(c.store_id, c.price) for c in current] == [(kept_id, Decimal("0.99"))], "Should rebuild current prices"
+        snapshots = session.exec(
+            select(ProductPriceSnapshot.store_id, ProductPriceSnapshot.price, ProductPriceSnapshot.valid_until)
+            .order_by(ProductPriceSnapshot.valid_from)
+        ).all()
+        assert snapshots == [
+            (kept_id, Decimal("1.99"), observed + timedelta(days=1)),
+            (kept_id, Decimal("0.99"), OPEN_ENDED),
+        ], "Should recompact merged history"
@@ -0,0 +1,96 @@
+"""Tests for keyset and ranked pagination and versioned caches."""
+import pytest
+from sqlmodel import Session, select
+
+from webapp.cache import VersionedCache, bump_data_version
+from webapp.pagination import InvalidCursorError, decode_cursor, encode_cursor, keyset_page, ranked_page
+from webapp.stores.models import Store
+
+
+@pytest.fixture
+def stores(session: Session):
+    """Seven stores, two sharing a name to exercise the id tiebreak."""
+    names = ["Aldi", "Kroger", "Kroger", "Publix", "Food City", "Walmart", "Whole Foods"]
+    for i, name in enumerate(names):
+        session.add(Store(name=name, address=f"{i} Main St", city="Chattanooga", state="TN", zip_code="37402"))
+    session.commit()
+    return sorted(session.exec(select(Store)).all(), key=lambda store: (store.name, store.id))
+
+
+def test_keyset_page_walks_forward_and_back(session: Session, stores):
+    """Following next then prev cursors should visit every store once, in order."""
+    keys = [Store.name, Store.id]
+    seen = []
+    page = keyset_page(session, select(Store), keys, per_page=3)
+    assert page.prev_cursor is None, "First page should have no previous page"
+    pages = [page]
+    while page.next_cursor:
+        page = keyset_page(session, select(Store), keys, per_page=3, after=page.next_cursor)
+        pages.append(page)
+    for page in pages:
+        seen.extend(page.items)
+    assert [store.id for store in seen] == [store.id for store in stores], "Should list stores by (name, id)"
+    assert [len(page.items) for page in pages] == [3, 3, 1], "Should split into pages of three"
+    
+    back = keyset_page(session, select(Store), keys, per_page=3, before=pages[-1].prev_cursor)
+    assert [store.id for store in back.items] == [store.id for store in pages[1].items], "Should return previous page"
+    assert back.next_cursor is not None, "Previous page should link forward"
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", encode_cursor(["Aldi"])[:-2], "e30="])
+def test_keyset_page_rejects_bad_cursor(session: Session, cursor: str):
+    """Garbage and wrong-shaped cursors should raise InvalidCursorError."""
+    with pytest.raises(InvalidCursorError):
+        keyset_page(session, select(Store), [Store.name, Store.id], per_page=3, after=cursor)
+
+
+def test_ranked_page_walks_forward_and_back(session: Session, stores):
+    """Following next then prev cursors should visit every ranked store once, in rank order."""
+    order = [Store.name.desc(), Store.id]
+    page = ranked_page(session, select(Store), order, per_page=3)
+    assert page.prev_cursor is None, "First page should have no previous page"
+    pages = [page]
+    while page.next_cursor:
+        page = ranked_page(session, select(Store), order, per_page=3, after=page.next_cursor)
+        pages.append(page)
+    
+    ranked = sorted(stores, key=lambda store: store.id)
+    ranked.sort(key=lambda store: store.name, reverse=True)
+    assert [store.id for page in pages for store in page.items] == [store.id for store in ranked], "Should list stores in rank order"
+    assert [len(page.items) for page in pages] == [3, 3, 1], "Should split into pages of three"
+    
+    back = ranked_page(session, select(Store), order, per_page=3, before=pages[-1].prev_cursor)
+    assert [store.id for store in back.items] == [store.id for store in pages[1].items], "Should return previous page"
+    assert back.next_cursor is not None, "Previous page should link forward"
+
+
+def test_ranked_page_stops_at_max_results(session: Session, stores):
+    """Should serve only the first max_results positions."""
+    order = [Store.name, Store.id]
+    first = ranked_page(session, select(Store), order, per_page=3, max_results=5)
+    second = ranked_page(session, select(Store), order, per_page=3, after=first.next_cursor, max_results=5)
+    assert [len(first.items), len(second.items)] == [3, 2], "Should cut the last page at max_results"
+    assert second.next_cursor is None, "Should not link past max_results"
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", encode_cursor(["Aldi"]), encode_cursor([-1]), encode_cursor([1.5]), encode_cursor([3, 4])])
+def test_ranked_page_rejects_bad_cursor(session: Session, cursor: str):
+    """Cursors that are not a single position should raise InvalidCursorError."""
+    with pytest.raises(InvalidCursorError):
+        ranked_page(session, select(Store), [Store.name, Store.id], per_page=3, after=cursor)
+
+
+def test_cursor_round_trip():
+    """Cursors should decode to the values they encode."""
+    assert decode_cursor(encode_cursor(["Kroger", 3])) == ["Kroger", 3], "Should round-trip key values"
+
+
+def test_versioned_cache_invalidates_on_bump():
+    """Bumping a scope should force recomputation of values derived from it."""
+    cache = VersionedCache(max_size=2)
+    calls = []
+    compute = lambda: calls.append(1) or len(calls)
+    assert cache.get_or_compute("total", ["test-scope"], compute) == 1, "Should compute on miss"
+    assert cache.get_or_compute("total", ["test-scope"], compute) == 1, "Should reuse cached value"
+    bump_data_version("test-scope")
+    assert cache.get_or_compute("total", ["test-scope"], compute) == 2, "Should recompute after bump"
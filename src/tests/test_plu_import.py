@@ -43,18 +43,22 @@ def test_save_plu_commodities_handles_duplicates(session: Session):
     )
     
     # Save first PLU
-    saved = save_plu_commodities(session, [plu1])
-    assert len(saved) == 1
-    assert saved[0].plu == "4014"
-    assert saved[0].measures_na == "113 size and smaller"
+    result = save_plu_commodities(session, [plu1])
+    assert result.inserted == 1, "Should insert new PLU"
+    stored = session.exec(select(PluCommodity).where(PluCommodity.plu == "4014")).one()
+    assert stored.measures_na == "113 size and smaller", "Should store original measure"
     
     # Try to save duplicate PLU
-    saved = save_plu_commodities(session, [plu2])
-    assert len(saved) == 1
-    assert saved[0].plu == "4014"
-    assert saved[0].measures_na == "Updated measure"  # Should be updated
+    result = save_plu_commodities(session, [plu2])
+    assert result.updated == 1, "Should update existing PLU"
+    session.refresh(stored)
+    assert stored.measures_na == "Updated measure", "Should store updated measure"
+    
+    # Saving identical data should not rewrite the row
+    result = save_plu_commodities(session, [plu2])
+    assert result.unchanged == 1, "Should leave identical PLU untouched"
     
     # Verify only one record exists
     stmt = select(PluCommodity).where(PluCommodity.plu == "4014")
     results = session.exec(stmt).all()
-    assert len(results) == 1
+    assert len(results) == 1, "Should keep a single row per PLU"
@@ -0,0 +1,91 @@
+"""Tests for current and best price maintenance."""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlmodel import Session, select
+
+from webapp.products.models import BestPrice, CurrentPrice, Product, ProductPrice
+from webapp.products.prices import refresh_best_prices, refresh_current_prices
+from webapp.stores.models import Store
+
+START = datetime(2025, 6, 1)
+
+
+@pytest.fixture
+def catalog(session: Session):
+    """One product and three stores."""
+    product = Product(name="Bananas", upc="4011")
+    stores = [
+        Store(name=f"Store {i}", address=f"{i} Main St", city="Chattanooga", state="TN", zip_code="37402")
+        for i in range(3)
+    ]
+    session.add(product)
+    session.add_all(stores)
+    session.commit()
+    return product, stores
+
+
+def write_prices(session: Session, product: Product, observations) -> None:
+    """Insert (store, price, day) observations, leaving current and best prices to the triggers."""
+    rows = [
+        ProductPrice(product_id=product.id, store_id=store.id, price=Decimal(price), observed_at=START + timedelta(days=day))
+        for store, price, day in observations
+    ]
+    session.add_all(rows)
+    session.commit()
+
+
+def best(session: Session, product: Product):
+    """(store_id, price) of the stored best price."""
+    row = session.get(BestPrice, product.id)
+    session.expire_all()
+    return (row.store_id, row.price) if row else None
+
+
+def test_best_price_triggers_track_current_minimum(session: Session, catalog):
+    """Best price should follow each store's latest observation."""
+    product, (a, b, c) = catalog
+    write_prices(session, product, [(a, "2.99", 0), (b, "1.99", 0), (c, "3.49", 0)])
+    assert best(session, product) == (b.id, Decimal("1.99")), "Should pick the cheapest store"
+    
+    write_prices(session, product, [(c, "0.99", 1)])
+    assert best(session, product) == (c.id, Decimal("0.99")), "Should take a new undercutting price"
+    
+    write_prices(session, product, [(c, "3.99", 2)])
+    assert best(session, product) == (b.id, Decimal("1.99")), "Should recompute when the best store raises its price"
+    
+    write_prices(session, product, [(a, "0.49", -5)])
+    assert best(session, product) == (b.id, Decimal("1.99")), "Should ignore backfilled older observations"
+    
+    write_prices(session, product, [(b, "2.49", 3), (a, "2.49", 4)])
+    assert best(session, product) == (a.id, Decimal("2.49")), "Should prefer the fresher of equal prices"
+
+
+def test_refresh_best_prices_matches_triggers(session: Session, catalog):
+    """A full rebuild should agree with the triggers."""
+    product, (a, b, c) = catalog
+    write_prices(session, product, [(a, "2.49", 0), (b, "1.49", 0), (b, "2.99", 1), (c, "1.99", 1)])
+    incremental = best(session, product)
+    
+    refresh_best_prices(session.connection())
+    session.commit()
+    assert best(session, product) == incremental == (c.id, Decimal("1.99")), "Should agree after rebuild"
+
+
+def test_current_price_trigger_keeps_latest(session: Session, catalog):
+    """Should track each store's latest observation, whatever the insert order."""
+    product, stores = catalog
+    write_prices(session, product, [(stores[0], "2.00", 2), (stores[0], "3.00", 1), (stores[1], "1.50", 0)])
+    
+    def current():
+        rows = session.exec(select(CurrentPrice).order_by(CurrentPrice.store_id)).all()
+        session.expire_all()
+        return [(row.store_id, row.price) for row in rows]
+    
+    expected = [(stores[0].id, Decimal("2.00")), (stores[1].id, Decimal("1.50"))]
+    assert current() == expected, "Should ignore observations older than the current one"
+    
+    refresh_current_prices(session.connection())
+    session.commit()
+    assert current() == expected, "Rebuild should agree with the trigger"
@@ -1,8 +1,16 @@
 from pathlib import Path
-from sqlmodel import Session, SQLModel, create_engine
+import pytest
+from sqlmodel import Session, SQLModel, create_engine, select
 
-from webapp.products.etl import import_plu_commodities
-from webapp.products.models import PluCommodity
+from webapp.products.etl import (
+    PLU_COLUMNS,
+    PluSchemaError,
+    import_all_plu_to_products,
+    import_plu_commodities,
+    load_plu_commodities,
+    load_plu_rows,
+)
+from webapp.products.models import PluCommodity, Product
 
 def test_import_plu_commodities():
     """Test importing PLU commodities from test CSV file."""
@@ -11,9 +19,9 @@ def test_import_plu_commodities():
     
     with Session(engine) as session:
         test_csv = Path("data/commodities.test.csv")
-        commodities = import_plu_commodities(session, test_csv)
+        result = import_plu_commodities(session, test_csv)
         
-        assert len(commodities) == 2, "Should import 2 test commodities"
+        assert result.inserted == 2, "Should import 2 test commodities"
         
         apple = session.get(PluCommodity, 1)
         assert apple is not None, "Should find apple with id 1"
@@ -32,3 +40,61 @@ def test_import_plu_commodities():
         assert apple.created_at.strftime("%Y-%m-%d %H:%M:%S") == "1999-12-30 23:00:00", "Should have correct creation time"
         assert apple.deleted_at is None, "Should have no deletion time"
         assert apple.language == "EN", "Should have correct language"
+
+
+def test_import_plu_commodities_skips_unchanged(session: Session, tmp_path: Path):
+    """Re-importing an unchanged file should do no work."""
+    csv_path = tmp_path / "commodities.csv"
+    csv_path.write_text(Path("data/commodities.test.csv").read_text())
+    
+    assert import_plu_commodities(session, csv_path).inserted == 2, "Should import both commodities"
+    again = import_plu_commodities(session, csv_path)
+    assert again.unchanged == 2 and again.total == 2, "Should skip an unchanged file"
+    
+    csv_path.write_text(csv_path.read_text().replace("Wendy Logan", "Wendy Logan-Smith"))
+    changed = import_plu_commodities(session, csv_path)
+    assert changed.updated == 1 and changed.unchanged == 1, "Should only save the changed row"
+    aurora = session.exec(select(PluCommodity).where(PluCommodity.plu == "3001")).one()
+    assert aurora.updated_by == "Wendy Logan-Smith", "Should save the new value"
+
+
+def test_import_all_plu_to_products(session: Session):
+    """Converting PLUs should create one product per PLU, once."""
+    import_plu_commodities(session, Path("data/commodities.test.csv"))
+    
+    result = import_all_plu_to_products(session)
+    assert result.inserted == 2, "Should create a product per PLU"
+    
+    products = {p.upc: p for p in session.exec(select(Product)).all()}
+    assert products["3000"].name == "Apples - Alkmene", "Should title-case commodity and variety"
+    assert products["3000"].unit == "each", "Should default unit without NA measures"
+    assert products["3001"].unit == "lb", "Should sell by weight with NA measures"
+    assert products["3001"].is_active, "Should be active when PLU is not deleted"
+    
+    again = import_all_plu_to_products(session)
+    assert again.inserted == 0 and again.unchanged == 2, "Should skip PLUs with existing products"
+
+
+def test_load_plu_rows_matches_model_loader():
+    """The tuple fast path should yield what the model loader would store."""
+    csv_path = Path("data/commodities.csv")
+    expected = [
+        tuple(
+            value.strftime("%Y-%m-%d %H:%M:%S.%f") if hasattr(value, "strftime") else value
+            for value in (getattr(plu, column) for column in PLU_COLUMNS)
+        )
+        for plu in load_plu_commodities(csv_path)
+    ]
+    assert list(load_plu_rows(csv_path)) == expected, "Should match the validated loader row for row"
+
+
+@pytest.mark.parametrize("content", [
+    '"Plu","Type"\n"3000","Global"\n',
+    Path("data/commodities.test.csv").read_text().replace("2024-02-02 19:50:24", "02/02/2024"),
+])
+def test_load_plu_rows_rejects_bad_schema(tmp_path: Path, content: str):
+    """Missing columns and malformed timestamps should raise PluSchemaError."""
+    csv_path = tmp_path / "commodities.csv"
+    csv_path.write_text(content)
+    with pytest.raises(PluSchemaError):
+        list(load_plu_rows(csv_path))
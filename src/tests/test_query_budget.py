@@ -0,0 +1,110 @@
+"""Tests for query budgets and N+1 detection."""
+import asyncio
+import logging
+
+import pytest
+from sqlmodel import select
+
+from webapp.products.etl import import_plu_to_product
+from webapp.products.models import PluCommodity, Product
+from webapp.query_budget import (
+    QueryBudgetExceededError,
+    UnknownQueryBudgetModeError,
+    query_budget,
+    statement_shape,
+)
+
+
+@pytest.fixture
+def plus(session):
+    """Session holding a dozen PLU commodities."""
+    for i in range(12):
+        session.add(PluCommodity(
+            plu=str(4000 + i), type="Global", category="Fruits", commodity="APPLES",
+            variety=f"Variety {i}", size="All", status="Approved", updated_by="test"
+        ))
+    session.commit()
+    return [plu.id for plu in session.exec(select(PluCommodity))]
+
+
+def test_counts_queries_within_budget(session, plus):
+    """Should count statements and pass code that stays within budget."""
+    with query_budget(2) as budget:
+        session.exec(select(PluCommodity)).all()
+        session.exec(select(Product)).all()
+    assert budget.queries == 2, "Should count both statements"
+    assert budget.violations() == [], "Should report nothing within budget"
+
+
+def test_flags_n_plus_one_with_location(session, plus):
+    """Should report a statement repeated per row, with where it ran."""
+    with pytest.raises(QueryBudgetExceededError) as excinfo:
+        with query_budget(max_repeats=10, name="per-row import"):
+            for plu_id in plus:
+                import_plu_to_product(session, plu_id)
+    
+    message = str(excinfo.value)
+    assert "per-row import" in message, "Should name the budget"
+    assert "possible N+1: 12x" in message, "Should count the repeated statement shape"
+    assert "webapp/products/etl.py" in message and "in import_plu_to_product" in message, "Should point at the code"
+
+
+def test_exceeding_total_lists_top_shapes(session, plus):
+    """Should report the total and the statements that used it up."""
+    budget = query_budget(1, max_repeats=None)
+    with pytest.raises(QueryBudgetExceededError, match="ran 2 queries, budget is 1"):
+        with budget:
+            session.exec(select(PluCommodity)).all()
+            session.exec(select(Product)).all()
+
+
+def test_log_mode_warns_instead_of_raising(monkeypatch, caplog, session, plus):
+    """Should only log violations in log mode."""
+    monkeypatch.setenv("QUERY_BUDGET_MODE", "log")
+    with caplog.at_level(logging.WARNING, logger="webapp.query_budget"):
+        with query_budget(0):
+            session.exec(select(PluCommodity)).all()
+    assert "Query budget exceeded" in caplog.text, "Should log the violation"
+
+
+def test_off_mode_counts_nothing(monkeypatch, session, plus):
+    """Should not track queries when turned off."""
+    monkeypatch.setenv("QUERY_BUDGET_MODE", "off")
+    with query_budget(0) as budget:
+        session.exec(select(PluCommodity)).all()
+    assert budget.queries == 0, "Should not count queries"
+
+
+def test_unknown_mode(monkeypatch):
+    """Should reject unknown modes."""
+    monkeypatch.setenv("QUERY_BUDGET_MODE", "strict")
+    with pytest.raises(UnknownQueryBudgetModeError):
+        with query_budget(0):
+            pass
+
+
+def test_decorates_sync_and_async_functions(session, plus):
+    """Should give every call of a decorated function its own budget."""
+    @query_budget(1)
+    def one_query():
+        return session.exec(select(PluCommodity)).all()
+    
+    @query_budget(1)
+    async def two_queries():
+        session.exec(select(PluCommodity)).all()
+        return session.exec(select(Product)).all()
+    
+    one_query()
+    one_query()
+    with pytest.raises(QueryBudgetExceededError, match="two_queries"):
+        asyncio.run(two_queries())
+
+
+@pytest.mark.parametrize("statement, shape", [
+    ("SELECT *\n  FROM product WHERE id = ?", "SELECT * FROM product WHERE id = ?"),
+    ("SELECT * FROM product WHERE id IN (?, ?, ?)", "SELECT * FROM product WHERE id IN (?, ...)"),
+    ("INSERT INTO t (a) VALUES (?), (?), (?)", "INSERT INTO t (a) VALUES (?), ..."),
+])
+def test_statement_shape(statement, shape):
+    """Should collapse whitespace and parameter lists."""
+    assert statement_shape(statement) == shape, f"{statement!r} should have shape {shape!r}"
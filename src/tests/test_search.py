@@ -0,0 +1,64 @@
+"""Tests for FTS5 product and store search."""
+import pytest
+from sqlmodel import Session, select
+
+from webapp.products.models import PluCommodity, Product
+from webapp.search import PRODUCT_SEARCH, STORE_SEARCH, match_query, matches
+from webapp.stores.models import Store
+
+
+def search_ids(session: Session, model, index, q: str) -> list:
+    """Ids of model rows matching q, best match first."""
+    stmt = (
+        select(model.id)
+        .join(index, index.c.rowid == model.id)
+        .where(matches(index, match_query(q)))
+        .order_by(index.c.rank)
+    )
+    return list(session.exec(stmt).all())
+
+
+@pytest.mark.parametrize("q, expected", [
+    ("", None),
+    ("  -- ", None),
+    ("gala", '"gala"*'),
+    ("red del", '"red"* "del"*'),
+])
+def test_match_query(q, expected):
+    """Should quote each word as a prefix term and ignore punctuation."""
+    assert match_query(q) == expected, f"Unexpected FTS query for {q!r}"
+
+
+def test_product_search_ranks_and_tracks_plu(session: Session):
+    """Should rank name matches first and follow PLU changes via triggers."""
+    apples = Product(name="Apples - Gala", upc="4133")
+    bananas = Product(name="Bananas", brand="Appleton Farms", upc="4011")
+    session.add_all([apples, bananas])
+    session.commit()
+    assert search_ids(session, Product, PRODUCT_SEARCH, "appl") == [apples.id, bananas.id], \
+        "Should prefix-match and rank names above brands"
+    
+    session.add(PluCommodity(
+        plu="4011", type="Global", category="Fruits", commodity="BANANAS",
+        variety="Cavendish", size="All Sizes", botanical="Musa", status="Approved", updated_by="Test"
+    ))
+    session.commit()
+    assert search_ids(session, Product, PRODUCT_SEARCH, "cavend") == [bananas.id], "Should index PLU variety"
+    
+    session.delete(bananas)
+    session.commit()
+    assert search_ids(session, Product, PRODUCT_SEARCH, "cavend") == [], "Should drop deleted products"
+
+
+def test_store_search_tracks_updates(session: Session):
+    """Should match store name, address and city, and follow updates."""
+    store = Store(name="Food City", address="1375 Broad St", city="Chattanooga", state="TN", zip_code="37402")
+    session.add(store)
+    session.commit()
+    assert search_ids(session, Store, STORE_SEARCH, "broad chat") == [store.id], "Should match address and city"
+    
+    store.city = "Hixson"
+    session.add(store)
+    session.commit()
+    assert search_ids(session, Store, STORE_SEARCH, "chat") == [], "Should forget the old city"
+    assert search_ids(session, Store, STORE_SEARCH, "hix") == [store.id], "Should index the new city"
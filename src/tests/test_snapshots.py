@@ -0,0 +1,168 @@
+"""Tests for price snapshot compaction."""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, delete, select
+
+from webapp.database import engine
+from webapp.main import app
+from webapp.products.models import PriceLookup, Product, ProductPrice, ProductPriceSnapshot
+from webapp.products.snapshots import OPEN_ENDED, compact_price_snapshots, price_at, prices_at
+from webapp.stores.models import Store
+
+START = datetime(2025, 6, 1)
+
+
+@pytest.fixture
+def key(session: Session):
+    """(product_id, store_id) of a fresh product and store."""
+    product = Product(name="Bananas", upc="4011")
+    store = Store(name="Food City", address="1375 Broad St", city="Chattanooga", state="TN", zip_code="37402")
+    session.add_all([product, store])
+    session.commit()
+    return product.id, store.id
+
+
+def observe(session: Session, key, prices) -> None:
+    """Record one observation per day for the given prices, starting at day offset."""
+    for day, price in prices:
+        session.add(ProductPrice(product_id=key[0], store_id=key[1], price=Decimal(price), observed_at=START + timedelta(days=day)))
+    session.commit()
+
+
+def runs(session: Session):
+    """(price, first day, last day or None) per snapshot, oldest first."""
+    snapshots = session.exec(select(ProductPriceSnapshot).order_by(ProductPriceSnapshot.valid_from)).all()
+    session.expire_all()
+    return [
+        (str(s.price), (s.valid_from - START).days, None if s.valid_until == OPEN_ENDED else (s.valid_until - START).days)
+        for s in snapshots
+    ]
+
+
+def test_compaction_run_length_encodes_prices(session: Session, key):
+    """Equal consecutive prices should collapse into one snapshot."""
+    observe(session, key, [(0, "1.99"), (1, "1.99"), (2, "1.99"), (3, "2.49"), (4, "2.49"), (5, "1.99")])
+    result = compact_price_snapshots(session, batch_size=4)
+    assert result.observations == 6, "Should read every observation"
+    assert runs(session) == [("1.99", 0, 3), ("2.49", 3, 5), ("1.99", 5, None)], "Should keep one snapshot per price run"
+
+
+def test_compaction_is_incremental(session: Session, key):
+    """Later runs should extend, close and rebuild only what changed."""
+    observe(session, key, [(0, "1.99"), (1, "1.99")])
+    compact_price_snapshots(session)
+    
+    observe(session, key, [(2, "1.99"), (3, "0.99")])
+    result = compact_price_snapshots(session)
+    assert result.observations == 2, "Should only read observations above the watermark"
+    assert runs(session) == [("1.99", 0, 3), ("0.99", 3, None)], "Should close the open run on a price change"
+    
+    observe(session, key, [(1, "1.49")])
+    result = compact_price_snapshots(session)
+    assert result.keys_rebuilt == 1, "Should rebuild a key with a late observation"
+    assert runs(session) == [("1.99", 0, 1), ("1.49", 1, 2), ("1.99", 2, 3), ("0.99", 3, None)], \
+        "Should slot the late observation into history"
+    
+    incremental = runs(session)
+    compact_price_snapshots(session, rebuild=True)
+    assert runs(session) == incremental, "Rebuild should agree with incremental compaction"
+
+
+def test_late_observation_inside_open_run_rebuilds(session: Session, key):
+    """A late observation inside an already compacted run should match a full rebuild."""
+    observe(session, key, [(0, "1.99"), (1, "1.99"), (2, "1.99")])
+    compact_price_snapshots(session)
+    assert runs(session) == [("1.99", 0, None)], "Should compact the days into one open run"
+    
+    observe(session, key, [(1, "0.99")])
+    result = compact_price_snapshots(session)
+    assert result.keys_rebuilt == 1, "Should treat an observation inside the open run as late"
+    incremental = runs(session)
+    assert incremental == [("1.99", 0, 1), ("0.99", 1, 2), ("1.99", 2, None)], "Should restore the later price"
+    
+    compact_price_snapshots(session, rebuild=True)
+    assert runs(session) == incremental, "Rebuild should agree with incremental compaction"
+
+
+def test_price_at_finds_covering_snapshot(session: Session, key):
+    """Should answer from the run covering the moment."""
+    observe(session, key, [(0, "1.99"), (3, "2.49")])
+    compact_price_snapshots(session)
+    
+    assert price_at(session, *key, START - timedelta(days=1)) is None, "Should know no price before the first observation"
+    assert price_at(session, *key, START).price == Decimal("1.99"), "Should include valid_from"
+    assert price_at(session, *key, START + timedelta(days=3)).price == Decimal("2.49"), "Should exclude valid_until"
+    assert price_at(session, *key, START + timedelta(days=300)).price == Decimal("2.49"), "Should extend the open run"
+
+
+def test_prices_at_matches_single_lookups(session: Session, key):
+    """Batch lookups should agree with price_at, in input order."""
+    observe(session, key, [(0, "1.99"), (2, "2.49"), (4, "0.99")])
+    compact_price_snapshots(session)
+    
+    lookups = [
+        PriceLookup(product_id=product_id, store_id=key[1], at=START + timedelta(hours=hours))
+        for hours in (100, -5, 0, 48, 47, 1000)
+        for product_id in (key[0], key[0] + 1)
+    ]
+    points = prices_at(session, lookups, batch_size=5)
+    assert len(points) == len(lookups), "Should answer every lookup"
+    for lookup, point in zip(lookups, points):
+        snapshot = price_at(session, lookup.product_id, lookup.store_id, lookup.at)
+        assert point.at == lookup.at, "Should answer lookups in input order"
+        assert point.price == (snapshot.price if snapshot else None), f"Should agree with price_at at {lookup.at}"
+
+
+@pytest.mark.parametrize("at, expected", [
+    ("2025-06-03T00:00:00", datetime(2025, 6, 3)),
+    ("2025-06-03T00:00:00Z", datetime(2025, 6, 3)),
+    ("2025-06-02T19:00:00-05:00", datetime(2025, 6, 3)),
+])
+def test_price_lookup_normalizes_to_naive_utc(at, expected):
+    """Should store lookup moments as naive UTC, like the database."""
+    assert PriceLookup(product_id=1, store_id=1, at=at).at == expected, f"{at} should mean {expected} UTC"
+
+
+def test_prices_at_honors_offsets(session: Session, key):
+    """A lookup with an offset should be answered at the moment it names."""
+    observe(session, key, [(0, "1.99"), (2, "2.49")])
+    compact_price_snapshots(session)
+    
+    # 21:00 at -05:00 on day 1 is 02:00 UTC on day 2, after the price change
+    lookup = PriceLookup(product_id=key[0], store_id=key[1], at="2025-06-02T21:00:00-05:00")
+    assert prices_at(session, [lookup])[0].price == Decimal("2.49"), "Should convert the offset to UTC"
+
+
+@pytest.fixture(scope="module")
+def stored_key():
+    """A compacted product and store price history in the application database."""
+    with Session(engine) as session:
+        product = Product(name="Offset Plums", upc="offset-plums")
+        store = Store(name="Offset Market", address="5 Zone St", city="Chattanooga", state="TN", zip_code="37402")
+        session.add_all([product, store])
+        session.commit()
+        key = (product.id, store.id)
+        observe(session, key, [(0, "1.99"), (2, "2.49")])
+        compact_price_snapshots(session)
+    yield key
+    with Session(engine) as session:
+        for model in (ProductPriceSnapshot, ProductPrice):
+            session.exec(delete(model).where(model.product_id == key[0]))
+        session.exec(delete(Product).where(Product.id == key[0]))
+        session.exec(delete(Store).where(Store.id == key[1]))
+        session.commit()
+
+
+@pytest.mark.parametrize("at, price", [
+    ("2025-06-03T00:00:00Z", "2.49"),
+    ("2025-06-02T21:00:00-05:00", "2.49"),
+    ("2025-06-02T18:00:00-05:00", "1.99"),
+])
+def test_price_route_accepts_offsets(stored_key, at, price):
+    """Should answer tz-aware moments instead of failing to compare them."""
+    response = TestClient(app).get(f"/products/{stored_key[0]}/price", params={"store_id": stored_key[1], "at": at})
+    assert response.status_code == 200, f"Should price {at}"
+    assert Decimal(response.json()["price"]) == Decimal(price), f"Should price {at} in UTC"
@@ -1,14 +1,21 @@
 """Tests for store ETL functions."""
+import gzip
+import shutil
 from pathlib import Path
 
 import pytest
 from sqlmodel import Session, select
 
 from webapp.database import engine
+from webapp.imports.models import ImportFile, ImportRowFingerprint
 from webapp.stores.etl import (
     load_gmaps_stores_from_csv,
     convert_gmaps_stores_to_store,
+    import_store_directory,
+    import_store_files,
+    import_stores,
     save_stores_to_db,
+    UnknownStoreFormatError,
 )
 from webapp.stores.models import Store
 
@@ -25,8 +32,9 @@ def db_session():
     with Session(engine) as session:
         yield session
         # Cleanup
-        for store in session.exec(select(Store)):
-            session.delete(store)
+        for model in (Store, ImportFile, ImportRowFingerprint):
+            for row in session.exec(select(model)):
+                session.delete(row)
         session.commit()
 
 
@@ -69,7 +77,8 @@ def test_save_stores_upsert(db_session):
     )
     
     # Initial save
-    save_stores_to_db(iter([store1]))
+    result = save_stores_to_db(iter([store1]))
+    assert result.inserted == 1, "Should report one inserted store"
     saved = db_session.exec(
         select(Store).where(Store.name == "Test Store")
     ).first()
@@ -84,10 +93,132 @@ def test_save_stores_upsert(db_session):
         state="MA",
         zip_code="01234"
     )
-    save_stores_to_db(iter([store2]))
+    result = save_stores_to_db(iter([store2]))
+    assert result.updated == 1, "Should report one updated store"
     
     # Verify update
     db_session.refresh(saved)
     updated = saved
     assert updated.id == saved.id, "Should keep same ID"
     assert updated.city == "New City", "Should update city"
+
+
+def test_save_stores_reports_unchanged(db_session):
+    """Should count re-imported identical stores as unchanged."""
+    stores = [
+        Store(name=f"Batch Store {i}", address=f"{i} Main St", city="Springfield", state="MA", zip_code="01234")
+        for i in range(5)
+    ]
+    first = save_stores_to_db(iter(stores), batch_size=2)
+    assert first.inserted == 5, "Should insert every new store across batches"
+    
+    second = save_stores_to_db(iter(stores), batch_size=2)
+    assert second.unchanged == 5, "Should leave identical stores untouched"
+    assert second.inserted == 0 and second.updated == 0, "Should not write identical stores"
+    
+    count = len(db_session.exec(select(Store).where(Store.city == "Springfield")).all())
+    assert count == 5, "Should not duplicate stores on re-import"
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_import_stores_streams_csv(db_session, test_csv_path, tmp_path, compressed):
+    """Should import plain and gzip-compressed Google Maps exports."""
+    csv_path = tmp_path / "stores.csv"
+    if compressed:
+        csv_path = tmp_path / "stores.csv.gz"
+        with open(test_csv_path, "rb") as src, gzip.open(csv_path, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+    else:
+        shutil.copyfile(test_csv_path, csv_path)
+    
+    result = import_stores(csv_path, format="gmaps", batch_size=1)
+    assert result.inserted == 2, "Should insert both stores from the export"
+    
+    store = db_session.exec(select(Store).where(Store.name == "Food City")).first()
+    assert store is not None, "Should find imported store"
+    assert store.zip_code == "37402", "Should parse zip from address"
+
+
+def test_import_stores_unknown_format(test_csv_path):
+    """Should reject unknown import formats."""
+    with pytest.raises(UnknownStoreFormatError):
+        import_stores(test_csv_path, format="yelp")
+
+
+def test_import_store_directory(db_session, tmp_path):
+    """Should import every metro file in a directory through one writer."""
+    for metro, state in [("Springfield", "MA"), ("Shelbyville", "IL")]:
+        with gzip.open(tmp_path / f"{metro.lower()}.csv.gz", "wt") as f:
+            f.write("name,address\n")
+            for i in range(3):
+                f.write(f'Metro Store {i},"{i} {metro} Ave, {metro}, {state} 01234, USA"\n')
+    
+    result = import_store_directory(tmp_path)
+    assert result.inserted == 6, "Should insert stores from every file"
+    
+    cities = {store.city for store in db_session.exec(select(Store).where(Store.name.startswith("Metro Store")))}
+    assert cities == {"Springfield", "Shelbyville"}, "Should import both metro areas"
+
+
+def test_import_store_files_refills_workers(db_session, tmp_path):
+    """Should import more files than workers, submitting each as another finishes."""
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"metro{i}.csv"
+        path.write_text(f'name,address\nWindow Store {i},"{i} Window Ave, Springfield, MA 01234, USA"\n')
+        paths.append(path)
+    
+    result = import_store_files(paths, max_workers=1)
+    assert result.inserted == 4, "Should import every file through one worker"
+
+
+def test_import_stores_skips_unchanged_rows(db_session, test_csv_path, tmp_path):
+    """Should short-circuit unchanged files and only touch changed rows."""
+    csv_path = tmp_path / "stores.csv"
+    shutil.copyfile(test_csv_path, csv_path)
+    first = import_stores(csv_path)
+    assert first.inserted == 2, "Should insert stores on first import"
+    
+    again = import_stores(csv_path)
+    assert again.unchanged == 2 and again.total == 2, "Should skip an unchanged file"
+    
+    csv_path.write_text(csv_path.read_text().replace("TN 37402", "TN 37403"))
+    changed = import_stores(csv_path)
+    assert changed.updated == 1, "Should update the changed row"
+    assert changed.unchanged == 1, "Should skip rows whose fingerprint is unchanged"
+    
+    forced = import_stores(csv_path, force=True)
+    assert forced.unchanged == 2 and forced.inserted == 0, "Should upsert every row when forced"
+
+
+def test_import_stores_force_refreshes_fingerprints(db_session, test_csv_path, tmp_path):
+    """Should fingerprint and count every row of a forced import, so a later revert is written."""
+    csv_path = tmp_path / "stores.csv"
+    shutil.copyfile(test_csv_path, csv_path)
+    original = csv_path.read_text()
+    import_stores(csv_path)
+    
+    csv_path.write_text(original.replace("TN 37402", "TN 37403"))
+    import_stores(csv_path, force=True)
+    again = import_stores(csv_path)
+    assert again.unchanged == 2 and again.total == 2, "Should record the forced import's row count"
+    
+    csv_path.write_text(original)
+    reverted = import_stores(csv_path)
+    assert reverted.updated == 1, "Should write the row reverted to its pre-force content"
+    assert reverted.unchanged == 1, "Should still skip the untouched row"
+    zip_codes = {store.zip_code for store in db_session.exec(select(Store))}
+    assert "37403" not in zip_codes, "Should store the reverted zip code"
+
+
+def test_import_stores_chattanooga_format(db_session, test_csv_path, tmp_path):
+    """Should import Chattanooga export rows through import_stores."""
+    csv_path = tmp_path / "stores.csv"
+    shutil.copyfile(test_csv_path, csv_path)
+    
+    result = import_stores(csv_path, format="chattanooga")
+    assert result.inserted == 2, "Should insert every row"
+    store = db_session.exec(select(Store).where(Store.name == "Food City")).one()
+    location = (store.address, store.city, store.state, store.zip_code)
+    assert location == ("1375 Broad St", "Chattanooga", "TN", "37402"), "Should take the zip code from the address"
+    assert store.is_active, "Should read is_active"
@@ -0,0 +1,34 @@
+"""Tests for the shared template environment."""
+from webapp.cache import PRICES, STORES, bump_data_version
+from webapp.config import TEMPLATE_CACHE_DIR
+from webapp.templating import clear_fragment_cache, environment, warm_templates
+
+FRAGMENTS = environment.from_string(
+    '{% for item in items %}'
+    '{% cache ("row", item.id), ["stores"] %}<{{ item.name }}>{% endcache %}'
+    '{% cache ("row", item.id), ["prices"] %}[{{ item.name }}]{% endcache %}'
+    '{% endfor %}'
+)
+
+
+def test_fragment_cache_reuses_until_scope_changes():
+    """Should serve cached fragments until one of their scopes is bumped."""
+    clear_fragment_cache()
+    first = FRAGMENTS.render(items=[{"id": 1, "name": "a&b"}])
+    assert first == "<a&amp;b>[a&amp;b]", "Should render and escape both fragments"
+    
+    cached = FRAGMENTS.render(items=[{"id": 1, "name": "renamed"}])
+    assert cached == first, "Should reuse both fragments for the same keys"
+    
+    bump_data_version(STORES)
+    assert FRAGMENTS.render(items=[{"id": 1, "name": "renamed"}]) == "<renamed>[a&amp;b]", \
+        "Should re-render only the fragment whose scope changed"
+    bump_data_version(PRICES)
+    assert FRAGMENTS.render(items=[{"id": 1, "name": "renamed"}]) == "<renamed>[renamed]", \
+        "Should re-render the other fragment once its scope changes"
+
+
+def test_warm_templates_fills_bytecode_cache():
+    """Should compile every page template into the on-disk bytecode cache."""
+    assert warm_templates() >= 5, "Should compile the page templates"
+    assert any(TEMPLATE_CACHE_DIR.iterdir()), "Should write compiled templates to the cache directory"
@@ -0,0 +1,85 @@
+"""Tests for the group-commit writer."""
+import asyncio
+
+import pytest
+from sqlmodel import Session, SQLModel, create_engine, func, select
+
+from webapp.stores.models import Store
+from webapp.writer import GroupCommitWriter, WriterClosedError, write
+
+
+@pytest.fixture
+def file_engine(tmp_path):
+    """Engine on a throwaway database file, which the writer thread can share."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'writer.sqlite'}")
+    SQLModel.metadata.create_all(engine, tables=[Store.__table__])  # type: ignore
+    yield engine
+    engine.dispose()
+
+
+def add_store(name: str):
+    """Write batch adding one store."""
+    def work(session: Session) -> str:
+        session.add(Store(name=name, address=f"{name} St", city="Springfield", state="MA", zip_code="01234"))
+        return name
+    return work
+
+
+def store_names(engine) -> set:
+    """Names of every committed store."""
+    with Session(engine) as session:
+        return set(session.exec(select(Store.name)).all())
+
+
+def test_writer_groups_queued_batches(file_engine):
+    """Should commit batches queued together in fewer commits than batches."""
+    writer = GroupCommitWriter(file_engine, max_delay=0.05)
+    futures = [writer.submit(add_store(f"Store {i}")) for i in range(10)]
+    results = [future.result(timeout=10) for future in futures]
+    writer.close()
+    
+    assert results == [f"Store {i}" for i in range(10)], "Should acknowledge each batch with its result"
+    assert store_names(file_engine) == set(results), "Should commit every batch"
+    assert writer.commits < writer.writes == 10, "Should share commits between batches"
+
+
+def test_writer_isolates_failed_batch(file_engine):
+    """Should roll back only the failing batch of a group."""
+    def fail(session: Session):
+        session.add(Store(name="Broken", address="1 Bad St", city="Springfield", state="MA", zip_code="01234"))
+        session.flush()
+        raise ValueError("bad batch")
+    
+    writer = GroupCommitWriter(file_engine, max_delay=0.05)
+    futures = [writer.submit(add_store("Before")), writer.submit(fail), writer.submit(add_store("After"))]
+    with pytest.raises(ValueError):
+        futures[1].result(timeout=10)
+    futures[2].result(timeout=10)
+    writer.close()
+    
+    assert store_names(file_engine) == {"Before", "After"}, "Should keep the other batches of the group"
+
+
+def test_writer_acknowledgements_are_awaitable(file_engine):
+    """Should let coroutines await their batch's commit."""
+    writer = GroupCommitWriter(file_engine)
+    
+    async def produce():
+        return await asyncio.gather(*(writer.write(add_store(f"Async {i}")) for i in range(3)))
+    
+    assert asyncio.run(produce()) == ["Async 0", "Async 1", "Async 2"], "Should resolve every awaited write"
+    writer.close()
+    with pytest.raises(WriterClosedError):
+        writer.submit(add_store("Late"))
+
+
+@pytest.mark.parametrize("in_memory", [False, True])
+def test_write_commits_before_returning(file_engine, in_memory):
+    """Should have committed a batch by the time write returns."""
+    engine = create_engine("sqlite:///:memory:") if in_memory else file_engine
+    SQLModel.metadata.create_all(engine, tables=[Store.__table__])  # type: ignore
+    with Session(engine) as session:
+        write(session, add_store("Committed"))
+        session.rollback()
+        count = session.scalar(select(func.count()).select_from(Store).where(Store.name == "Committed"))
+    assert count == 1, "Should survive a rollback of the caller's session"
@@ -4,8 +4,8 @@ from fastapi import Request
 from fastapi.templating import Jinja2Templates
 
 class RenderDecorator:
-    def __init__(self, templates_dir: str):
-        self.templates = Jinja2Templates(directory=templates_dir)
+    def __init__(self, templates: Jinja2Templates):
+        self.templates = templates
 
     def __call__(self, template_name: str, *, always: bool = False):
         def decorator(func):
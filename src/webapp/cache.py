@@ -0,0 +1,133 @@
+"""In-process caches invalidated by data version counters.
+
+Write paths call bump_data_version() for the data they change; cached
+values remember the versions they were computed from and are recomputed
+once any of them moves on.
+
+The counters of DATA_SCOPES live in a small memory-mapped file shared by
+every server worker, so a write in one worker invalidates the caches of
+all of them. Reading a version is a memory read, not a database query.
+"""
+import fcntl
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Sequence, Tuple, TypeVar
+
+from webapp.config import DATA_VERSION_FILE
+
+T = TypeVar("T")
+
+# Data scopes bumped by write paths
+STORES = "stores"
+PRODUCTS = "products"
+PRICES = "prices"
+
+# Scopes whose versions are shared across processes, in file slot order
+DATA_SCOPES = (STORES, PRODUCTS, PRICES)
+
+_SLOT = struct.Struct("q")
+_MISSING = object()
+
+
+class SharedVersions:
+    """Version counters in a memory-mapped file, one 8-byte slot per scope."""
+    
+    def __init__(self, path: Path, scopes: Sequence[str] = DATA_SCOPES):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._slots = {scope: i * _SLOT.size for i, scope in enumerate(scopes)}
+        size = _SLOT.size * len(scopes)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        self._lock = threading.Lock()
+    
+    def __contains__(self, scope: str) -> bool:
+        return scope in self._slots
+    
+    def get(self, scope: str) -> int:
+        """Current version of a shared scope."""
+        return _SLOT.unpack_from(self._map, self._slots[scope])[0]
+    
+    def bump(self, scope: str) -> None:
+        """Increment a shared scope, locked against other threads and processes."""
+        offset = self._slots[scope]
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                _SLOT.pack_into(self._map, offset, _SLOT.unpack_from(self._map, offset)[0] + 1)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+_shared = SharedVersions(DATA_VERSION_FILE)
+_versions: Dict[str, int] = {}
+_versions_lock = threading.Lock()
+
+
+def data_version(*scopes: str) -> Tuple[int, ...]:
+    """Current version of each scope."""
+    return tuple(_shared.get(scope) if scope in _shared else _versions.get(scope, 0) for scope in scopes)
+
+
+def bump_data_version(*scopes: str) -> None:
+    """Invalidate everything cached from the given scopes, in every worker."""
+    for scope in scopes:
+        if scope in _shared:
+            _shared.bump(scope)
+            continue
+        with _versions_lock:
+            _versions[scope] = _versions.get(scope, 0) + 1
+
+
+class VersionedCache:
+    """Bounded LRU cache whose entries expire when their data scopes change."""
+    
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries: OrderedDict[Hashable, Tuple[Tuple[int, ...], Any]] = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get_or_compute(self, key: Hashable, scopes: Sequence[str], compute: Callable[[], T]) -> T:
+        """Return the cached value for key, computing it if missing or stale.
+        
+        Args:
+            key: Cache key, without the data versions
+            scopes: Data scopes the value is derived from
+            compute: Produces the value on a miss
+            
+        Returns:
+            Cached or freshly computed value
+        """
+        version = data_version(*scopes)
+        value = self.get(key, version, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.put(key, version, value)
+        return value
+    
+    def get(self, key: Hashable, version: Tuple[int, ...], default: Any = None) -> Any:
+        """The value cached for key at exactly this data version, else default."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+    
+    def put(self, key: Hashable, version: Tuple[int, ...], value: Any) -> None:
+        """Cache a value computed at a data version, evicting the least recently used."""
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def clear(self) -> None:
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
@@ -1,4 +1,5 @@
 """Application configuration."""
+import os
 from pathlib import Path
 from sqlmodel import create_engine
 
@@ -6,3 +7,17 @@ from sqlmodel import create_engine
 DATA_DIR = Path(__file__).parent.parent.parent / 'data'
 DATABASE_URL = f"sqlite:///{DATA_DIR}/grocery_tracker.sqlite"
 engine = create_engine(DATABASE_URL, echo=False)
+
+# Server modes selectable with SERVER_MODE or `build.py run --mode`
+DEVELOPMENT = "development"
+PRODUCTION = "production"
+SERVER_MODES = (DEVELOPMENT, PRODUCTION)
+
+# Data version counters shared by server workers for cache invalidation
+DATA_VERSION_FILE = Path(os.getenv('DATA_VERSION_FILE', str(DATA_DIR / 'data_versions')))
+
+# Compiled templates, shared by every worker so cold starts skip compilation
+TEMPLATE_CACHE_DIR = Path(os.getenv('TEMPLATE_CACHE_DIR', str(DATA_DIR / 'template_cache')))
+
+# One Google Maps export per metro area, imported by /stores/import-directory
+STORE_IMPORT_DIR = Path(os.getenv('STORE_IMPORT_DIR', str(DATA_DIR / 'stores')))
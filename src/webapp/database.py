@@ -1,9 +1,119 @@
 """Database configuration and utilities."""
+import asyncio
+import contextvars
+import functools
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from typing import AsyncIterator, Callable, Iterable, Iterator, List, Optional, TypeVar
+
+from sqlalchemy import Engine, event
 from sqlmodel import Session
 
 from webapp.config import engine
+from webapp.metrics import record_db_wait
+
+T = TypeVar("T")
+
+# Rows per write transaction for bulk ETL paths
+DEFAULT_BATCH_SIZE = 2000
+
+# How SQLAlchemy stores DateTime columns in SQLite, for raw executemany paths
+SQLITE_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+# Threads that run blocking database work on behalf of async route handlers
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+
+# Seconds a connection waits on another writer's lock before failing
+SQLITE_BUSY_TIMEOUT = 30
+
+_db_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
+
+
+@dataclass
+class UpsertResult:
+    """Counts reported by a bulk upsert."""
+
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+
+    @property
+    def total(self) -> int:
+        """Number of rows processed."""
+        return self.inserted + self.updated + self.unchanged
+
+    def __add__(self, other: "UpsertResult") -> "UpsertResult":
+        return UpsertResult(
+            inserted=self.inserted + other.inserted,
+            updated=self.updated + other.updated,
+            unchanged=self.unchanged + other.unchanged
+        )
+
+
+def batched(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Yield lists of at most size items from an iterable.
+    
+    Args:
+        items: Items to group
+        size: Maximum batch length
+        
+    Yields:
+        Lists of consecutive items
+    """
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _sql_title(value: Optional[str]) -> Optional[str]:
+    """SQL title(): Python's str.title so set-based SQL matches ORM code paths."""
+    return value.title() if value is not None else None
+
+
+@event.listens_for(Engine, "connect")
+def register_sqlite_functions(dbapi_connection, connection_record) -> None:
+    """Register application SQL functions on every new SQLite connection."""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    dbapi_connection.create_function("title", 1, _sql_title, deterministic=True)
+    # WAL lets readers on the DB pool run while another thread writes
+    dbapi_connection.execute("PRAGMA journal_mode=WAL")
+    dbapi_connection.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT * 1000}")
+
+
+async def run_in_db(func: Callable[..., T], *args, **kwargs) -> T:
+    """Run blocking database work on the DB thread pool.
+    
+    Keeps the event loop free while queries run; at most DB_POOL_SIZE calls
+    run at once and the rest queue for a thread.
+    
+    Args:
+        func: Synchronous function doing the database work
+        *args: Positional arguments for func
+        **kwargs: Keyword arguments for func
+        
+    Returns:
+        Whatever func returns
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    queued = time.perf_counter()
+    
+    def run() -> T:
+        record_db_wait(time.perf_counter() - queued)
+        return func(*args, **kwargs)
+    
+    return await loop.run_in_executor(_db_executor, functools.partial(context.run, run))
+
 
-def get_session():
-    """Get a database session."""
-    with Session(engine) as session:
+async def get_session() -> AsyncIterator[Session]:
+    """Get a database session for use through run_in_db."""
+    session = Session(engine)
+    try:
         yield session
+    finally:
+        await run_in_db(session.close)
@@ -0,0 +1,25 @@
+"""File helpers shared by the ETL modules."""
+import gzip
+from pathlib import Path
+from typing import TextIO
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def open_csv(csv_path: Path) -> TextIO:
+    """Open a CSV file for reading, transparently decompressing gzip input.
+    
+    Compression is detected from the file's magic bytes rather than its
+    suffix, so both `stores.csv.gz` and mislabelled exports are handled.
+    
+    Args:
+        csv_path: Path to a plain or gzip-compressed CSV file
+        
+    Returns:
+        Text stream suitable for csv.reader
+    """
+    with open(csv_path, "rb") as f:
+        compressed = f.read(2) == GZIP_MAGIC
+    if compressed:
+        return gzip.open(csv_path, "rt", newline="")
+    return open(csv_path, newline="")
@@ -0,0 +1,86 @@
+"""Whole-response caching for read-mostly pages, with strong ETags.
+
+A cached page is keyed on its path and query string and stays valid until
+one of its data scopes is bumped, so repeated browsing is answered from
+memory without running the handler or touching SQLite. Every response
+carries a strong ETag of its body. A request whose If-None-Match names it
+gets 304 Not Modified, whether the page came from the cache or was just
+rendered.
+"""
+import hashlib
+from functools import wraps
+from typing import Optional, Tuple
+
+from fastapi import Request, Response
+
+from webapp.cache import VersionedCache, data_version
+
+# Cached responses kept per route
+RESPONSE_CACHE_SIZE = 512
+
+
+class _CachedPage:
+    """Body and headers of a rendered 200 response."""
+    
+    def __init__(self, response: Response):
+        self.body = bytes(response.body)
+        self.media_type = response.headers.get("content-type")
+        self.etag = f'"{hashlib.blake2b(self.body, digest_size=16).hexdigest()}"'
+    
+    def respond(self, request: Request) -> Response:
+        """This page, or 304 if the client already holds it."""
+        headers = {"ETag": self.etag, "Cache-Control": "no-cache"}
+        if _etag_matches(request.headers.get("if-none-match"), self.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.body, headers={**headers, "Content-Type": self.media_type or "text/html"})
+
+
+def cached_response(*scopes: str, max_size: int = RESPONSE_CACHE_SIZE):
+    """Cache a GET handler's responses until one of the data scopes changes.
+    
+    Requests carrying a flash message are neither answered from nor stored
+    in the cache, since the page shows session state.
+    
+    Args:
+        *scopes: Data scopes the page is rendered from
+        max_size: Responses kept, least recently used evicted first
+    """
+    cache = VersionedCache(max_size)
+    
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(request: Request, *args, **kwargs):
+            if request.session.get("flash"):
+                return await func(request, *args, **kwargs)
+            
+            key = _cache_key(request)
+            version = data_version(*scopes)
+            page: Optional[_CachedPage] = cache.get(key, version)
+            if page is None:
+                response = await func(request, *args, **kwargs)
+                if response.status_code != 200 or not hasattr(response, "body"):
+                    return response
+                page = _CachedPage(response)
+                cache.put(key, version, page)
+            return page.respond(request)
+        
+        wrapper.cache = cache  # type: ignore[attr-defined]
+        return wrapper
+    return decorator
+
+
+def _cache_key(request: Request) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    """Path and sorted query parameters of a request."""
+    return request.url.path, tuple(sorted(request.query_params.multi_items()))
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header names this ETag.
+    
+    If-None-Match compares weakly (RFC 9110 13.1.2), so a W/ prefix on
+    either side is ignored.
+    """
+    if not if_none_match:
+        return False
+    candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    return "*" in candidates or etag.removeprefix("W/") in candidates
@@ -0,0 +1 @@
+"""Import bookkeeping shared by the ETL modules."""
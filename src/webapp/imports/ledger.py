@@ -0,0 +1,135 @@
+"""Change detection for re-imports of source files."""
+import hashlib
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, Optional, TypeVar, Union
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, col, select
+
+from webapp.database import DEFAULT_BATCH_SIZE, batched
+from webapp.imports.models import ImportFile, ImportRowFingerprint
+from webapp.jobs.runner import report_progress
+from webapp.writer import write
+
+FILE_READ_SIZE = 1024 * 1024
+
+# Parsed source rows, as DictReader dicts or positional tuples
+Row = TypeVar("Row", dict, tuple)
+
+
+def file_digest(path: Path) -> str:
+    """Hash the raw bytes of a file without loading it into memory."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while chunk := f.read(FILE_READ_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def row_digest(row: Union[dict, tuple]) -> str:
+    """Hash the values of a parsed CSV row, given as a dict or a tuple."""
+    values = row.values() if isinstance(row, dict) else row
+    payload = "\x1f".join(map(str, values))
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+class ImportLedger:
+    """Tracks what a feed last imported so re-imports only touch changes.
+    
+    Typical use:
+        ledger = ImportLedger(session, "plu", csv_path)
+        if ledger.unchanged():
+            return
+        save(ledger.changed_rows(rows, key=lambda row: row["Plu"]))
+        ledger.commit()
+    
+    Fingerprints are only persisted by commit(), so a failed import is
+    retried in full on the next run.
+    """
+    
+    def __init__(self, session: Session, feed: str, path: Path):
+        self.session = session
+        self.feed = feed
+        self.path = str(path.resolve())
+        self.content_hash = file_digest(path)
+        self.rows_read = 0
+        self.rows_skipped = 0
+        self._pending: Dict[str, str] = {}
+    
+    def last_import(self, session: Optional[Session] = None) -> Optional[ImportFile]:
+        """Ledger entry for the previous import of this file, if any."""
+        return (session or self.session).exec(
+            select(ImportFile).where(ImportFile.feed == self.feed, ImportFile.path == self.path)
+        ).first()
+    
+    def unchanged(self) -> bool:
+        """Whether the file content matches the last successful import."""
+        last = self.last_import()
+        return last is not None and last.content_hash == self.content_hash
+    
+    def changed_rows(
+        self,
+        rows: Iterable[Row],
+        key: Callable[[Row], str],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        force: bool = False
+    ) -> Iterator[Row]:
+        """Yield only rows whose fingerprint differs from the last import.
+        
+        Every row is counted and fingerprinted, so a forced import leaves the
+        ledger describing the file as it now is.
+        
+        Args:
+            rows: Parsed source rows
+            key: Natural key of a row within the feed
+            batch_size: Rows looked up per fingerprint query
+            force: Yield every row, changed or not
+            
+        Yields:
+            New or modified rows, or every row if forced
+        """
+        for batch in batched(rows, batch_size):
+            fingerprints = [(key(row), row_digest(row), row) for row in batch]
+            stored = {} if force else dict(self.session.exec(
+                select(ImportRowFingerprint.row_key, ImportRowFingerprint.row_hash).where(
+                    ImportRowFingerprint.feed == self.feed,
+                    col(ImportRowFingerprint.row_key).in_([row_key for row_key, _, _ in fingerprints])
+                )
+            ).all())
+            self.rows_read += len(batch)
+            skipped = 0
+            for row_key, row_hash, row in fingerprints:
+                if stored.get(row_key) == row_hash:
+                    skipped += 1
+                    continue
+                self._pending[row_key] = row_hash
+                yield row
+            # Rows that are written get reported by the writer
+            self.rows_skipped += skipped
+            report_progress(rows_read=skipped)
+    
+    def commit(self) -> None:
+        """Record the file hash and changed row fingerprints through the writer."""
+        table = ImportRowFingerprint.__table__  # type: ignore
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["feed", "row_key"],
+            set_={"row_hash": stmt.excluded.row_hash}
+        )
+        
+        def save(session: Session) -> None:
+            for batch in batched(self._pending.items(), DEFAULT_BATCH_SIZE):
+                session.connection().execute(stmt, [
+                    {"feed": self.feed, "row_key": row_key, "row_hash": row_hash}
+                    for row_key, row_hash in batch
+                ])
+            
+            last = self.last_import(session) or ImportFile(feed=self.feed, path=self.path, content_hash="")
+            last.content_hash = self.content_hash
+            last.row_count = self.rows_read
+            last.imported_at = datetime.utcnow()
+            session.add(last)
+        
+        write(self.session, save)
+        self._pending.clear()
@@ -0,0 +1,28 @@
+"""Import ledger models."""
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import Index
+from sqlmodel import Field, SQLModel
+
+
+class ImportFile(SQLModel, table=True):
+    """Content hash of the last successful import of a source file."""
+    
+    __table_args__ = (
+        Index("ix_importfile_feed_path", "feed", "path", unique=True),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    feed: str
+    path: str
+    content_hash: str
+    row_count: int = Field(default=0)
+    imported_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ImportRowFingerprint(SQLModel, table=True):
+    """Hash of the source row last imported for a natural key within a feed."""
+    
+    feed: str = Field(primary_key=True)
+    row_key: str = Field(primary_key=True)
+    row_hash: str
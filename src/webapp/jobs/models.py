@@ -0,0 +1,48 @@
+"""Background job models."""
+from datetime import datetime
+from typing import Optional
+from sqlmodel import Field, SQLModel
+
+# Job lifecycle states
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+FINISHED_STATES = (SUCCEEDED, FAILED)
+
+
+class Job(SQLModel, table=True):
+    """A unit of ETL work run off the request path, with its final counters."""
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str = Field(index=True)
+    status: str = Field(default=QUEUED, index=True)
+    rows_read: int = Field(default=0)
+    rows_written: int = Field(default=0)
+    message: Optional[str] = None  # result summary or error
+    owner_pid: Optional[int] = None  # server process whose job pool holds the job
+    heartbeat_at: Optional[datetime] = None  # last start or heartbeat while running
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class JobStatus(SQLModel):
+    """Progress of a job, live while it runs and from the job table after."""
+    
+    id: int
+    kind: str
+    status: str
+    rows_read: int
+    rows_written: int
+    rows_per_second: float
+    message: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    
+    @property
+    def finished(self) -> bool:
+        """Whether the job has stopped, successfully or not."""
+        return self.status in FINISHED_STATES
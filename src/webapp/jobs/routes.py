@@ -0,0 +1,35 @@
+"""Job status routes, polled by the HTMX list pages."""
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlmodel import Session
+
+from webapp.database import get_session, run_in_db
+from webapp.jobs.models import JobStatus
+from webapp.jobs.runner import get_job_status, recent_job_statuses
+from webapp.query_budget import query_budget
+from webapp.templating import templates
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+@router.get("/", response_model=List[JobStatus])
+@query_budget(1)
+async def list_jobs(session: Session = Depends(get_session)) -> List[JobStatus]:
+    """Most recent jobs, newest first."""
+    return await run_in_db(recent_job_statuses, session)
+
+
+@router.get("/{job_id}", response_model=JobStatus)
+async def job_status(
+    request: Request,
+    job_id: int,
+    session: Session = Depends(get_session)
+):
+    """Progress of one job, as JSON or as an HTMX status fragment."""
+    status = await run_in_db(get_job_status, session, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"No job {job_id}")
+    if request.headers.get("HX-Request") == "true":
+        return templates.TemplateResponse(request, "jobs/_status.html", {"job": status})
+    return status
@@ -0,0 +1,291 @@
+"""In-process job runner for long ETL work.
+
+Jobs run on their own bounded thread pool, separate from the DB pool that
+serves requests, so a large import never holds request-serving capacity.
+Each job is persisted in the job table when it is queued, started and
+finished. ETL code reports progress through report_progress(), which is a
+no-op outside a job. Counters live in memory while the job runs and are
+saved through the group-commit writer at most every JOB_PROGRESS_INTERVAL
+seconds, so server workers other than the job's can report them too.
+
+Each job records the PID of the server process that owns it, and a
+heartbeat thread stamps a running job every JOB_HEARTBEAT_INTERVAL seconds
+whether or not it reports progress. Status reads only read. Jobs are failed
+by fail_abandoned_jobs(), which each heartbeat runs, once it has seen their
+owner process exit, so a crashed worker does not leave its jobs running
+forever; a job's own final status never overwrites that failure.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import Engine, update
+from sqlmodel import Session, col, select
+
+from webapp.database import engine
+from webapp.jobs.models import FAILED, QUEUED, RUNNING, SUCCEEDED, Job, JobStatus
+from webapp.writer import get_writer, write
+
+logger = logging.getLogger(__name__)
+
+# Jobs that may run at once; further submissions wait in the queue
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+
+# Seconds between saves of a running job's counters to the job table
+JOB_PROGRESS_INTERVAL = 1.0
+
+# Seconds between heartbeats of a running job, which also look for abandoned jobs
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "30"))
+
+# Jobs that have not finished, and may still be failed
+UNFINISHED_STATES = (QUEUED, RUNNING)
+
+# A job body gets its own session and returns a summary of what it did
+JobFunc = Callable[[Session], str]
+
+_job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+
+
+@dataclass
+class JobProgress:
+    """Live counters of a running job."""
+    
+    job_id: int
+    rows_read: int = 0
+    rows_written: int = 0
+    started: float = field(default_factory=time.monotonic)
+    saved: float = field(default_factory=time.monotonic)
+    
+    @property
+    def rows_per_second(self) -> float:
+        """Rows read per second since the job started."""
+        elapsed = time.monotonic() - self.started
+        return self.rows_read / elapsed if elapsed > 0 else 0.0
+
+
+_current_progress: ContextVar[Optional[JobProgress]] = ContextVar("current_progress", default=None)
+_progress: Dict[int, JobProgress] = {}
+_futures: Dict[int, Future] = {}
+
+
+def report_progress(rows_read: int = 0, rows_written: int = 0) -> None:
+    """Add to the counters of the job running in this thread, if any.
+    
+    Args:
+        rows_read: Source rows consumed since the last report
+        rows_written: Rows inserted or updated since the last report
+    """
+    progress = _current_progress.get()
+    if progress is not None:
+        progress.rows_read += rows_read
+        progress.rows_written += rows_written
+        now = time.monotonic()
+        if now - progress.saved >= JOB_PROGRESS_INTERVAL:
+            progress.saved = now
+            values = {"rows_read": progress.rows_read, "rows_written": progress.rows_written}
+            get_writer(engine).submit(
+                lambda session: session.connection().execute(
+                    update(Job).where(col(Job.id) == progress.job_id).values(**values)
+                )
+            )
+
+
+def submit_job(kind: str, func: JobFunc) -> int:
+    """Record a queued job and hand it to the job pool.
+    
+    Args:
+        kind: Short name of the work, shown in status
+        func: Job body, called with a fresh session
+        
+    Returns:
+        ID of the new job
+    """
+    job = Job(kind=kind, owner_pid=os.getpid())
+    
+    def record(session: Session) -> int:
+        session.add(job)
+        session.flush()
+        return job.id  # type: ignore
+    
+    with Session(engine) as session:
+        job_id = write(session, record)
+    
+    future = _job_executor.submit(_run_job, job_id, func)
+    _futures[job_id] = future
+    future.add_done_callback(lambda _: _futures.pop(job_id, None))
+    logger.info(f"Queued job {job_id} ({kind})")
+    return job_id
+
+
+def wait_for_job(job_id: int, timeout: Optional[float] = None) -> None:
+    """Block until a job submitted by this process has finished.
+    
+    Args:
+        job_id: Job to wait for
+        timeout: Seconds to wait before raising TimeoutError
+    """
+    future = _futures.get(job_id)
+    if future is not None:
+        future.result(timeout)
+
+
+def get_job_status(session: Session, job_id: int) -> Optional[JobStatus]:
+    """Status of a job, with live counters if it is running.
+    
+    Args:
+        session: Database session
+        job_id: Job to report
+        
+    Returns:
+        The job's status, or None if there is no such job
+    """
+    job = session.get(Job, job_id)
+    return _job_status(job) if job is not None else None
+
+
+def recent_job_statuses(session: Session, limit: int = 20) -> List[JobStatus]:
+    """Status of the most recently created jobs, newest first."""
+    jobs = session.exec(select(Job).order_by(col(Job.id).desc()).limit(limit)).all()
+    return [_job_status(job) for job in jobs]
+
+
+def fail_interrupted_jobs(engine: Engine) -> int:
+    """Mark jobs left queued or running by a previous process as failed.
+    
+    Args:
+        engine: Database engine
+        
+    Returns:
+        Number of jobs marked failed
+    """
+    with Session(engine) as session:
+        return write(session, lambda session: session.connection().execute(
+            update(Job)
+            .where(col(Job.status).in_(UNFINISHED_STATES))
+            .values(status=FAILED, message="Interrupted by a server restart", finished_at=datetime.utcnow())
+        ).rowcount)
+
+
+def fail_abandoned_jobs() -> int:
+    """Fail unfinished jobs whose owner process has exited.
+    
+    Owners are checked by PID on this host; a job whose owner is alive is
+    left alone however long it runs.
+    
+    Returns:
+        Number of jobs marked failed
+    """
+    with Session(engine) as session:
+        owners = session.exec(
+            select(Job.id, Job.owner_pid)
+            .where(col(Job.status).in_(UNFINISHED_STATES), col(Job.owner_pid).is_not(None))
+        ).all()
+    failed = 0
+    for job_id, owner_pid in owners:
+        if _pid_alive(owner_pid):  # type: ignore
+            continue
+        message = f"Interrupted: owner process {owner_pid} exited"
+        if _update_job(job_id, status=FAILED, message=message, finished_at=datetime.utcnow()):
+            logger.warning(f"Job {job_id} failed: {message}")
+            failed += 1
+    return failed
+
+
+def _run_job(job_id: int, func: JobFunc) -> None:
+    """Run a job body on a job thread, recording its outcome."""
+    progress = JobProgress(job_id)
+    _progress[job_id] = progress
+    token = _current_progress.set(progress)
+    stopped = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job_id, stopped), name=f"job-{job_id}-heartbeat", daemon=True)
+    status, message = FAILED, None
+    try:
+        started = datetime.utcnow()
+        _update_job(job_id, status=RUNNING, started_at=started, heartbeat_at=started)
+        heartbeat.start()
+        with Session(engine) as session:
+            message = func(session)
+        status = SUCCEEDED
+        logger.info(f"Job {job_id} succeeded: {message}")
+    except Exception as e:
+        message = str(e)
+        logger.exception(f"Job {job_id} failed")
+    finally:
+        _current_progress.reset(token)
+        stopped.set()
+        if heartbeat.is_alive():
+            heartbeat.join()
+        _update_job(
+            job_id,
+            status=status,
+            message=message,
+            rows_read=progress.rows_read,
+            rows_written=progress.rows_written,
+            finished_at=datetime.utcnow()
+        )
+        _progress.pop(job_id, None)
+
+
+def _heartbeat(job_id: int, stopped: threading.Event) -> None:
+    """Stamp a running job until it stops, failing abandoned jobs along the way."""
+    while not stopped.wait(JOB_HEARTBEAT_INTERVAL):
+        try:
+            _update_job(job_id, heartbeat_at=datetime.utcnow())
+            fail_abandoned_jobs()
+        except Exception:
+            logger.exception(f"Heartbeat of job {job_id} failed")
+
+
+def _update_job(job_id: int, **values) -> bool:
+    """Write columns of an unfinished job through the writer, after any progress saves already queued.
+    
+    Returns:
+        Whether the job was still unfinished and so was updated
+    """
+    return bool(get_writer(engine).submit(
+        lambda session: session.connection().execute(
+            update(Job).where(col(Job.id) == job_id, col(Job.status).in_(UNFINISHED_STATES)).values(**values)
+        ).rowcount
+    ).result())
+
+
+def _pid_alive(pid: int) -> bool:
+    """Whether a process with this PID exists on this host."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, but belongs to another user
+        pass
+    return True
+
+def _job_status(job: Job) -> JobStatus:
+    """Merge a job row with its live counters."""
+    progress = _progress.get(job.id)
+    if progress is not None and job.status == RUNNING:
+        rows_read, rows_written, rate = progress.rows_read, progress.rows_written, progress.rows_per_second
+    else:
+        # Finished, or running in another server worker with counters saved periodically
+        rows_read, rows_written, rate = job.rows_read, job.rows_written, 0.0
+        if job.started_at:
+            elapsed = ((job.finished_at or datetime.utcnow()) - job.started_at).total_seconds()
+            rate = rows_read / elapsed if elapsed > 0 else 0.0
+    return JobStatus(
+        id=job.id,
+        kind=job.kind,
+        status=job.status,
+        rows_read=rows_read,
+        rows_written=rows_written,
+        rows_per_second=round(rate, 1),
+        message=job.message,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at
+    )
@@ -1,40 +1,31 @@
 from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
 import uvicorn
 from dotenv import load_dotenv
 import logging
 import os
 from pathlib import Path
-from sqlmodel import SQLModel
-import glob
 from webapp.adapters.render import RenderDecorator
 from webapp.stores.routes import router as stores_router
 from webapp.products.routes import router as products_router
+from webapp.jobs.routes import router as jobs_router
+from webapp.jobs.runner import fail_interrupted_jobs
+from webapp.metrics import MetricsMiddleware, render_metrics
+from webapp.migrations import check_schema
+from webapp.query_budget import QueryBudgetMiddleware
+from webapp.templating import templates, warm_templates
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 app = FastAPI()
 
-from webapp.config import engine
+from webapp.config import DEVELOPMENT, PRODUCTION, SERVER_MODES, engine
 
-def run_migrations():
-    """Run all migrations in order"""
-    migrations_dir = Path(__file__).parent / 'migrations'
-    migration_files = sorted(glob.glob(str(migrations_dir / '*.py')))
-    
-    for migration_file in migration_files:
-        if migration_file.endswith('__init__.py'):
-            continue
-        module_path = f"webapp.migrations.{Path(migration_file).stem}"
-        migration_module = __import__(module_path, fromlist=['run_migration'])
-        migration_module.run_migration(engine)
-        logger.info(f"Ran migration {module_path}")
-
-# Ensure database and tables exist
-run_migrations()
+# Migrations are applied by `python build.py migrate`; workers only check the version
+check_schema(engine)
 
 # Add session middleware
 app.add_middleware(
@@ -42,17 +33,21 @@ app.add_middleware(
     secret_key=os.getenv('SESSION_SECRET_KEY', 'dev-secret-key-do-not-use-in-production')
 )
 
+app.add_middleware(QueryBudgetMiddleware)
+
+# Outermost, so latency covers the session middleware too
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(stores_router)
 app.include_router(products_router)
+app.include_router(jobs_router)
 
 # Configure static files and templates
 BASE_DIR = Path(__file__).parent
-TEMPLATES_DIR = BASE_DIR / "templates"
 STATIC_DIR = BASE_DIR / "static"
 
-templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
-render = RenderDecorator(str(TEMPLATES_DIR))
+render = RenderDecorator(templates)
 app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
 
 
@@ -78,10 +73,59 @@ async def status(request: Request):
     }
 
 
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Request and SQL metrics for this worker, in Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+# Seconds production workers get to finish in-flight requests on shutdown
+GRACEFUL_SHUTDOWN_TIMEOUT = 30
+
+
+class UnknownServerModeError(ValueError):
+    """Raised when SERVER_MODE is not one of SERVER_MODES."""
+    
+    def __init__(self, mode: str):
+        self.mode = mode
+        super().__init__(f"Unknown server mode: {mode}. Expected one of {', '.join(SERVER_MODES)}")
+
+
+def server_workers() -> int:
+    """Worker processes for production, SERVER_WORKERS or one per core."""
+    return int(os.getenv('SERVER_WORKERS', '0')) or os.cpu_count() or 1
+
+
+def preload() -> None:
+    """One-time startup work, done in the supervisor before any worker starts."""
+    if interrupted := fail_interrupted_jobs(engine):
+        logger.warning(f"Marked {interrupted} jobs interrupted by the last shutdown as failed")
+    warm_templates()
+
+
 def main():
     host = os.getenv('SERVER_HOST', '127.0.0.1')
     port = int(os.getenv('SERVER_PORT', '8000'))
     protocol = os.getenv('SERVER_PROTOCOL', 'http')
+    mode = os.getenv('SERVER_MODE', DEVELOPMENT)
+    if mode not in SERVER_MODES:
+        raise UnknownServerModeError(mode)
+    
+    preload()
+    if mode == PRODUCTION:
+        workers = server_workers()
+        logger.info(f"Starting server at: {protocol}://{host}:{port} with {workers} workers")
+        uvicorn.run(
+            "webapp.main:app",
+            host=host,
+            port=port,
+            workers=workers,
+            timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_TIMEOUT,
+            log_config=None,
+            access_log=False
+        )
+        return
+    
     logger.info(f"Starting server at: {protocol}://{host}:{port}")
     uvicorn.run(
         "webapp.main:app",
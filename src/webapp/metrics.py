@@ -0,0 +1,242 @@
+"""Request and SQL metrics in Prometheus text format.
+
+MetricsMiddleware times every HTTP request per route and tracks requests
+in flight. SQLAlchemy cursor events add each statement's count, rows and
+time to the request that ran it, including work handed to the DB pool
+through run_in_db. Template rendering and DB pool queueing are timed too.
+Whatever latency is left over is Python and event loop time.
+
+Requests slower than SLOW_REQUEST_SECONDS are logged with the SQL they ran.
+Metrics are kept per process; each server worker reports its own.
+"""
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Engine, event
+
+logger = logging.getLogger(__name__)
+
+# Requests slower than this are logged with their SQL
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "1.0"))
+
+# Statements remembered per request for the slow request log
+MAX_LOGGED_STATEMENTS = 50
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Counter:
+    """Monotonic total per label set."""
+    
+    kind = "counter"
+    
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+    
+    def samples(self) -> List[Tuple[str, Labels, float]]:
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    """Value per label set that goes up and down."""
+    
+    kind = "gauge"
+    
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set."""
+    
+    kind = "histogram"
+    
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._values: Dict[Labels, List[float]] = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            # One count per bucket, then +Inf, sum
+            counts = self._values.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+    
+    def samples(self) -> List[Tuple[str, Labels, float]]:
+        samples = []
+        with self._lock:
+            for key, counts in self._values.items():
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((f"{self.name}_bucket", key + (("le", _format_value(bound)),), count))
+                samples.append((f"{self.name}_bucket", key + (("le", "+Inf"),), counts[-2]))
+                samples.append((f"{self.name}_count", key, counts[-2]))
+                samples.append((f"{self.name}_sum", key, counts[-1]))
+        return samples
+
+
+REQUESTS = Counter("http_requests_total", "HTTP requests by route and status")
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency by route")
+IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being served")
+REQUEST_DB_SECONDS = Histogram("http_request_db_seconds", "Time per request spent executing SQL")
+REQUEST_RENDER_SECONDS = Histogram("http_request_render_seconds", "Time per request spent rendering templates")
+REQUEST_DB_WAIT_SECONDS = Histogram("http_request_db_wait_seconds", "Time per request queued for a DB pool thread")
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed, by route")
+DB_ROWS = Counter("db_rows_total", "Rows written by SQL statements, by route")
+DB_SECONDS = Counter("db_query_seconds_total", "Time spent executing SQL, by route")
+
+METRICS = (
+    REQUESTS, REQUEST_SECONDS, IN_FLIGHT, REQUEST_DB_SECONDS, REQUEST_RENDER_SECONDS,
+    REQUEST_DB_WAIT_SECONDS, DB_QUERIES, DB_ROWS, DB_SECONDS
+)
+
+
+@dataclass
+class RequestStats:
+    """What one request spent its time on."""
+    
+    queries: int = 0
+    rows: int = 0
+    db_seconds: float = 0.0
+    db_wait_seconds: float = 0.0
+    render_seconds: float = 0.0
+    statements: List[Tuple[float, str]] = field(default_factory=list)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def record_render(seconds: float) -> None:
+    """Add template rendering time to the current request."""
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.render_seconds += seconds
+
+
+def record_db_wait(seconds: float) -> None:
+    """Add time spent waiting for a DB pool thread to the current request."""
+    stats = _request_stats.get()
+    if stats is not None:
+        with stats.lock:
+            stats.db_wait_seconds += seconds
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _record_query(conn, cursor, statement, parameters, context, executemany) -> None:
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    stats = _request_stats.get()
+    if stats is None:
+        return
+    with stats.lock:
+        stats.queries += 1
+        stats.rows += max(cursor.rowcount, 0)
+        stats.db_seconds += elapsed
+        if len(stats.statements) < MAX_LOGGED_STATEMENTS:
+            stats.statements.append((elapsed, statement))
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, in-flight requests and per-request SQL."""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        status = 500
+        
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            IN_FLIGHT.dec()
+            _request_stats.reset(token)
+            self._record(scope, status, elapsed, stats)
+    
+    def _record(self, scope, status: int, elapsed: float, stats: RequestStats) -> None:
+        route = getattr(scope.get("route"), "path", "unmatched")
+        method = scope["method"]
+        REQUESTS.inc(method=method, route=route, status=str(status))
+        REQUEST_SECONDS.observe(elapsed, method=method, route=route)
+        REQUEST_DB_SECONDS.observe(stats.db_seconds, route=route)
+        REQUEST_RENDER_SECONDS.observe(stats.render_seconds, route=route)
+        REQUEST_DB_WAIT_SECONDS.observe(stats.db_wait_seconds, route=route)
+        DB_QUERIES.inc(stats.queries, route=route)
+        DB_ROWS.inc(stats.rows, route=route)
+        DB_SECONDS.inc(stats.db_seconds, route=route)
+        
+        if elapsed >= SLOW_REQUEST_SECONDS:
+            statements = "\n".join(f"  {seconds * 1000:.1f} ms: {sql}" for seconds, sql in stats.statements)
+            logger.warning(
+                f"Slow request {method} {scope['path']} took {elapsed * 1000:.0f} ms: "
+                f"{stats.queries} queries in {stats.db_seconds * 1000:.0f} ms, "
+                f"{stats.db_wait_seconds * 1000:.0f} ms waiting for the DB pool, "
+                f"{stats.render_seconds * 1000:.0f} ms rendering\n{statements}"
+            )
+
+
+def render_metrics() -> str:
+    """Every metric in Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels) + "}"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
@@ -0,0 +1,102 @@
+from sqlalchemy import text
+
+# Tables whose store_id must follow a duplicate store to the one that is kept
+STORE_REFERENCES = ("productprice", "productpricesnapshot", "bestprice", "currentprice")
+
+# The store kept for each (name, address) is the oldest
+_KEPT_STORE = (
+    "(SELECT MIN(kept.id) FROM store AS kept JOIN store AS dup "
+    "ON kept.name = dup.name AND kept.address = dup.address WHERE dup.id = {table}.store_id)"
+)
+_DUPLICATE_STORES = "(SELECT id FROM store WHERE id NOT IN (SELECT MIN(id) FROM store GROUP BY name, address))"
+
+# Derived tables are rebuilt in plain SQL, as they were defined when this
+# migration was written, so it behaves the same whatever the app code becomes
+_REBUILD_CURRENT_PRICES = """
+INSERT INTO currentprice (product_id, store_id, price, observed_at)
+SELECT product_id, store_id, price, observed_at FROM (
+    SELECT product_id, store_id, price, observed_at,
+           ROW_NUMBER() OVER (PARTITION BY product_id, store_id ORDER BY observed_at DESC, id DESC) AS rn
+    FROM productprice
+)
+WHERE rn = 1
+"""
+
+_REBUILD_BEST_PRICES = """
+INSERT INTO bestprice (product_id, store_id, price, observed_at)
+SELECT product_id, store_id, price, observed_at FROM (
+    SELECT product_id, store_id, price, observed_at,
+           ROW_NUMBER() OVER (PARTITION BY product_id ORDER BY price, observed_at DESC, store_id) AS rn
+    FROM currentprice
+)
+WHERE rn = 1
+"""
+
+# One snapshot per run of equal consecutive prices, each open until the next run starts
+_RECOMPACT_MERGED_SNAPSHOTS = """
+INSERT INTO productpricesnapshot (product_id, store_id, price, valid_from, valid_until, created_at)
+SELECT product_id, store_id, price, observed_at,
+       COALESCE(
+           LEAD(observed_at) OVER (PARTITION BY product_id, store_id ORDER BY observed_at, id),
+           '9999-12-31 23:59:59.000000'
+       ),
+       strftime('%Y-%m-%d %H:%M:%f', 'now')
+FROM (
+    SELECT id, product_id, store_id, price, observed_at,
+           LAG(price) OVER (PARTITION BY product_id, store_id ORDER BY observed_at, id) AS previous
+    FROM productprice
+    WHERE (product_id, store_id) IN (SELECT product_id, store_id FROM temp.merged_snapshot_keys)
+)
+WHERE previous IS NULL OR previous != price
+"""
+
+
+def run_migration(engine):
+    """Enforce one store per (name, address) for bulk upserts, merging duplicates into the oldest"""
+    with engine.begin() as conn:
+        if conn.execute(text(f"SELECT EXISTS {_DUPLICATE_STORES}")).scalar():
+            _merge_duplicate_stores(conn)
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_store_name_address "
+            "ON store (name, address)"
+        ))
+
+
+def _merge_duplicate_stores(conn):
+    """Repoint prices of duplicate stores to the kept store, then delete the duplicates"""
+    tables = set(conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'")).scalars())
+    if "productpricesnapshot" in tables:
+        conn.execute(text(
+            f"CREATE TEMP TABLE merged_snapshot_keys AS "
+            f"SELECT DISTINCT product_id, {_KEPT_STORE.format(table='productpricesnapshot')} AS store_id "
+            f"FROM productpricesnapshot WHERE store_id IN {_DUPLICATE_STORES}"
+        ))
+    
+    for table in STORE_REFERENCES:
+        if table not in tables:
+            continue
+        # OR IGNORE: currentprice is keyed on (product_id, store_id) and is rebuilt below
+        conn.execute(text(
+            f"UPDATE OR IGNORE {table} SET store_id = {_KEPT_STORE.format(table=table)} "
+            f"WHERE store_id IN {_DUPLICATE_STORES}"
+        ))
+        conn.execute(text(f"DELETE FROM {table} WHERE store_id IN {_DUPLICATE_STORES}"))
+    
+    if "currentprice" in tables:
+        conn.execute(text("DELETE FROM currentprice"))
+        conn.execute(text(_REBUILD_CURRENT_PRICES))
+        if "bestprice" in tables:
+            conn.execute(text("DELETE FROM bestprice"))
+            conn.execute(text(_REBUILD_BEST_PRICES))
+    
+    if "productpricesnapshot" in tables:
+        # Snapshot runs of merged stores overlap, so recompact them from the merged observations
+        conn.execute(text(
+            "DELETE FROM productpricesnapshot WHERE (product_id, store_id) IN "
+            "(SELECT product_id, store_id FROM temp.merged_snapshot_keys)"
+        ))
+        conn.execute(text(_RECOMPACT_MERGED_SNAPSHOTS))
+        conn.execute(text("DROP TABLE temp.merged_snapshot_keys"))
+    
+    conn.execute(text(f"DELETE FROM store WHERE id IN {_DUPLICATE_STORES}"))
+
@@ -0,0 +1,9 @@
+from sqlmodel import SQLModel
+from webapp.imports.models import ImportFile, ImportRowFingerprint
+
+def run_migration(engine):
+    """Create import ledger tables"""
+    SQLModel.metadata.create_all(
+        engine,
+        tables=[ImportFile.__table__, ImportRowFingerprint.__table__]  # type: ignore
+    )
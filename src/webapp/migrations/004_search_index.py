@@ -0,0 +1,5 @@
+from webapp.search import create_search_index
+
+def run_migration(engine):
+    """Create FTS5 search indexes for products and stores"""
+    create_search_index(engine)
@@ -0,0 +1,16 @@
+from sqlalchemy import text
+from sqlmodel import Session, SQLModel
+from webapp.products.models import BestPrice
+
+def run_migration(engine):
+    """Create best prices, and index price history by (product, store, time)
+    
+    Best prices are derived from current prices, so migration 009 backfills them.
+    """
+    SQLModel.metadata.create_all(engine, tables=[BestPrice.__table__])  # type: ignore
+    with Session(engine) as session:
+        session.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_productprice_product_store_observed "
+            "ON productprice (product_id, store_id, observed_at)"
+        ))
+        session.commit()
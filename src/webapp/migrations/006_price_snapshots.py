@@ -0,0 +1,12 @@
+from sqlalchemy import text
+from sqlmodel import SQLModel
+from webapp.products.models import SnapshotWatermark
+
+def run_migration(engine):
+    """Create the snapshot compaction watermark and index snapshots by (product, store, valid_from)"""
+    SQLModel.metadata.create_all(engine, tables=[SnapshotWatermark.__table__])  # type: ignore
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_productpricesnapshot_product_store_valid_from "
+            "ON productpricesnapshot (product_id, store_id, valid_from)"
+        ))
@@ -0,0 +1,15 @@
+from sqlalchemy import text
+from sqlmodel import SQLModel
+from webapp.products.models import CurrentPrice
+from webapp.products.prices import CURRENT_PRICE_TRIGGER, refresh_current_prices
+
+def run_migration(engine):
+    """Create current prices per product and store, maintained by a trigger on productprice"""
+    SQLModel.metadata.create_all(engine, tables=[CurrentPrice.__table__])  # type: ignore
+    with engine.begin() as conn:
+        conn.execute(text(CURRENT_PRICE_TRIGGER))
+        backfill = conn.execute(text(
+            "SELECT NOT EXISTS (SELECT 1 FROM currentprice) AND EXISTS (SELECT 1 FROM productprice)"
+        )).scalar()
+        if backfill:
+            refresh_current_prices(conn)
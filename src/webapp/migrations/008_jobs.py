@@ -0,0 +1,6 @@
+from sqlmodel import SQLModel
+from webapp.jobs.models import Job
+
+def run_migration(engine):
+    """Create the background job table"""
+    SQLModel.metadata.create_all(engine, tables=[Job.__table__])  # type: ignore
@@ -0,0 +1,9 @@
+from sqlalchemy import text
+from webapp.products.prices import BEST_PRICE_TRIGGERS, refresh_best_prices
+
+def run_migration(engine):
+    """Maintain best prices by triggers on currentprice, rebuilding them from current prices"""
+    with engine.begin() as conn:
+        for trigger in BEST_PRICE_TRIGGERS:
+            conn.execute(text(trigger))
+        refresh_best_prices(conn)
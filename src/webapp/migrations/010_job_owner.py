@@ -0,0 +1,12 @@
+from sqlalchemy import text
+
+# Columns added to job, with their SQLite types
+JOB_COLUMNS = {"owner_pid": "INTEGER", "heartbeat_at": "DATETIME"}
+
+def run_migration(engine):
+    """Record the process owning each job and when it last saved progress"""
+    with engine.begin() as conn:
+        existing = {row[1] for row in conn.execute(text("PRAGMA table_info(job)"))}
+        for column, type_ in JOB_COLUMNS.items():
+            if column not in existing:
+                conn.execute(text(f"ALTER TABLE job ADD COLUMN {column} {type_}"))
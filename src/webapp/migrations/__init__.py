@@ -0,0 +1,106 @@
+"""Numbered schema migrations, each applied once and recorded in schema_version.
+
+Migration modules are named NNN_description.py and expose
+run_migration(engine). They are applied by `python build.py migrate`;
+application processes only check that the database is current.
+"""
+import importlib
+import logging
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import List, Tuple
+
+from sqlalchemy import Engine, text
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).parent
+
+_MIGRATION_FILE = re.compile(r"^(\d+)_\w+\.py$")
+
+
+class SchemaOutOfDateError(RuntimeError):
+    """Raised at startup when the database is behind the code's migrations."""
+    
+    def __init__(self, current: int, latest: int):
+        self.current = current
+        self.latest = latest
+        super().__init__(
+            f"Database schema is at version {current} but the code expects {latest}. "
+            "Run `python build.py migrate` first."
+        )
+
+
+def available_migrations() -> List[Tuple[int, str]]:
+    """Migrations shipped with the code, as (version, module name) in order."""
+    migrations = []
+    for path in MIGRATIONS_DIR.glob("*.py"):
+        if match := _MIGRATION_FILE.match(path.name):
+            migrations.append((int(match.group(1)), path.stem))
+    return sorted(migrations)
+
+
+def current_version(engine: Engine) -> int:
+    """Highest migration version applied to the database, 0 for a new one."""
+    with engine.connect() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+        )).first()
+        if exists is None:
+            return 0
+        return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar() or 0
+
+
+def apply_migrations(engine: Engine) -> List[int]:
+    """Run every migration newer than the database's version, in order.
+    
+    Each migration is recorded in schema_version as soon as it succeeds, so
+    a failed run resumes from the failing migration.
+    
+    Args:
+        engine: Database engine
+    
+    Returns:
+        Versions that were applied
+    """
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_version ("
+            "version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at DATETIME NOT NULL)"
+        ))
+    
+    current = current_version(engine)
+    applied = []
+    for version, name in available_migrations():
+        if version <= current:
+            continue
+        module = importlib.import_module(f"{__name__}.{name}")
+        module.run_migration(engine)
+        with engine.begin() as conn:
+            conn.execute(
+                text("INSERT INTO schema_version (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+                {"version": version, "name": name, "applied_at": datetime.utcnow()}
+            )
+        logger.info(f"Applied migration {name}")
+        applied.append(version)
+    return applied
+
+
+def check_schema(engine: Engine) -> int:
+    """Check that every shipped migration has been applied.
+    
+    Args:
+        engine: Database engine
+    
+    Returns:
+        The database's schema version
+    
+    Raises:
+        SchemaOutOfDateError: If a migration has not been applied
+    """
+    latest = max((version for version, _ in available_migrations()), default=0)
+    current = current_version(engine)
+    if current < latest:
+        raise SchemaOutOfDateError(current, latest)
+    return current
@@ -0,0 +1,155 @@
+"""Keyset (cursor) pagination for list views, and positional paging of ranked results."""
+import base64
+import binascii
+import json
+from dataclasses import dataclass, field
+from typing import Any, Generic, List, Optional, Sequence, TypeVar
+
+from sqlalchemy import ColumnElement, Select, tuple_
+from sqlmodel import Session
+
+T = TypeVar("T")
+
+# Ranked results reachable through ranked_page, bounding the cost of deep pages
+MAX_RANKED_RESULTS = 1000
+
+
+class InvalidCursorError(ValueError):
+    def __init__(self, cursor: str):
+        super().__init__(f"Invalid page cursor: {cursor}")
+
+
+@dataclass
+class Page(Generic[T]):
+    """One page of results with opaque cursors to its neighbours."""
+    
+    items: List[T] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode sort key values as an opaque URL-safe token."""
+    payload = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """Decode a token produced by encode_cursor.
+    
+    Raises:
+        InvalidCursorError: If the token is not a valid cursor
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursorError(cursor)
+    if not isinstance(values, list):
+        raise InvalidCursorError(cursor)
+    return values
+
+
+def keyset_page(
+    session: Session,
+    stmt: Select,
+    keys: Sequence[ColumnElement],
+    per_page: int,
+    after: str = "",
+    before: str = "",
+) -> Page:
+    """Fetch the page after or before a cursor, ordered by keys.
+    
+    Seeks with a row-value comparison on keys instead of OFFSET, so every
+    page costs the same regardless of depth. keys must be unique together,
+    e.g. (name, id), and should be backed by an index.
+    
+    Args:
+        session: Database session
+        stmt: Select of a single entity, already filtered
+        keys: Sort key expressions, ascending
+        per_page: Page size
+        after: Cursor of the last item on the previous page
+        before: Cursor of the first item on the next page
+        
+    Returns:
+        Page of entities with next/prev cursors, None at either end
+        
+    Raises:
+        InvalidCursorError: If a cursor cannot be decoded
+    """
+    backwards = bool(before)
+    cursor = before or after
+    stmt = stmt.add_columns(*keys)
+    if cursor:
+        position = decode_cursor(cursor)
+        if len(position) != len(keys):
+            raise InvalidCursorError(cursor)
+        row_key = tuple_(*keys)
+        stmt = stmt.where(row_key < tuple(position) if backwards else row_key > tuple(position))
+    order = [key.desc() for key in keys] if backwards else list(keys)
+    rows = list(session.execute(stmt.order_by(*order).limit(per_page + 1)).all())
+    
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    if not rows:
+        return Page()
+    
+    first = encode_cursor(rows[0][1:])
+    last = encode_cursor(rows[-1][1:])
+    return Page(
+        items=[row[0] for row in rows],
+        next_cursor=last if (more and not backwards) or (backwards and cursor) else None,
+        prev_cursor=first if (more and backwards) or (not backwards and cursor) else None,
+    )
+
+
+def ranked_page(
+    session: Session,
+    stmt: Select,
+    order: Sequence[ColumnElement],
+    per_page: int,
+    after: str = "",
+    before: str = "",
+    max_results: int = MAX_RANKED_RESULTS,
+) -> Page:
+    """Fetch the page after or before a cursor within the top max_results.
+    
+    Relevance ranks such as FTS5 bm25 scores shift whenever the index
+    changes, so a page boundary keyed on a rank would skip or repeat rows
+    after a write. Ranked results are paged by position instead, and only
+    the first max_results positions are served, so OFFSET stays cheap. A
+    write between two requests can still shift rows by a few positions.
+    
+    Args:
+        session: Database session
+        stmt: Select of a single entity, already filtered
+        order: Ranking expressions, best first, ending with a unique tiebreak
+        per_page: Page size
+        after: Cursor of the next page from the previous one
+        before: Cursor of the previous page from the next one
+        max_results: Positions that can be paged to
+        
+    Returns:
+        Page of entities with next/prev cursors, None at either end
+        
+    Raises:
+        InvalidCursorError: If a cursor cannot be decoded
+    """
+    cursor = before or after
+    start = 0
+    if cursor:
+        position = decode_cursor(cursor)
+        if len(position) != 1 or type(position[0]) is not int or not 0 <= position[0] <= max_results:
+            raise InvalidCursorError(cursor)
+        start = max(position[0] - per_page, 0) if before else position[0]
+    end = min(start + per_page, max_results)
+    
+    items = list(session.scalars(stmt.order_by(*order).offset(start).limit(end - start + 1)).all())
+    more = len(items) > end - start and end < max_results
+    return Page(
+        items=items[:end - start],
+        next_cursor=encode_cursor([end]) if more else None,
+        prev_cursor=encode_cursor([start]) if start > 0 else None,
+    )
@@ -0,0 +1,273 @@
+"""Cheapest places to buy a basket of products."""
+import json
+import os
+import time
+from decimal import Decimal
+from itertools import repeat
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlmodel import Session, col, select
+
+from webapp.products.models import BasketItem, BasketLine, BasketPlan, BasketQuote
+from webapp.stores.models import Store
+
+# Cost of an item a store does not stock, larger than any real basket
+_UNSTOCKED = 1 << 62
+
+# Seconds a quote may take; the split search settles for the best split found by then
+BASKET_QUOTE_SECONDS = float(os.getenv("BASKET_QUOTE_SECONDS", "0.05"))
+
+
+class _Matrix:
+    """Basket costs in integer cents, one row per store and one column per item."""
+    
+    def __init__(self, items: List[BasketItem], cents: Dict[int, Dict[int, int]]):
+        self.items = items
+        self.cents = cents
+        self.store_ids = sorted(set().union(*cents.values()))
+        # Built a column at a time with map; only items bought more than once run Python per cell
+        columns = []
+        for item in items:
+            column = list(map(cents[item.product_id].get, self.store_ids, repeat(_UNSTOCKED)))
+            if item.quantity != 1:
+                column = [cost * item.quantity if cost < _UNSTOCKED else cost for cost in column]
+            columns.append(column)
+        self.costs = [list(row) for row in zip(*columns)]
+    
+    def plan(self, session: Session, stores: Sequence[int]) -> BasketPlan:
+        """Buy each item at the cheapest of the given store rows."""
+        rows = [min(stores, key=lambda row: self.costs[row][column]) for column in range(len(self.items))]
+        store_ids = sorted({self.store_ids[row] for row in rows})
+        names = dict(session.exec(select(Store.id, Store.name).where(col(Store.id).in_(store_ids))).all())
+        lines = []
+        for item, row in zip(self.items, rows):
+            store_id = self.store_ids[row]
+            price = Decimal(self.cents[item.product_id][store_id]) / 100
+            lines.append(BasketLine(
+                product_id=item.product_id,
+                store_id=store_id,
+                store_name=names[store_id],
+                quantity=item.quantity,
+                price=price,
+                cost=price * item.quantity
+            ))
+        return BasketPlan(store_ids=store_ids, total=sum((line.cost for line in lines), Decimal("0.00")), lines=lines)
+
+
+def load_current_prices(
+    session: Session,
+    product_ids: Sequence[int],
+    city: Optional[str] = None,
+    state: Optional[str] = None
+) -> Dict[int, Dict[int, int]]:
+    """Current price of each product at each eligible store, in one query.
+    
+    Each product's stores and prices in integer cents come back as a pair
+    of JSON arrays, so the driver returns a row per product rather than per
+    price and no Decimal is built per cell.
+    
+    Args:
+        session: Database session
+        product_ids: Products to price
+        city: Only stores in this city
+        state: Only stores in this state
+        
+    Returns:
+        Prices in cents keyed by product id then store id
+    """
+    # Both aggregates step through the same rows, so their lists line up
+    sql = (
+        "SELECT price.product_id, json_group_array(price.store_id), "
+        "json_group_array(CAST(round(price.price * 100) AS INTEGER)) FROM currentprice AS price"
+    )
+    params: List = list(product_ids)
+    if city or state:
+        sql += " JOIN store ON store.id = price.store_id"
+    sql += f" WHERE price.product_id IN ({', '.join('?' * len(product_ids))})"
+    if city:
+        sql += " AND store.city = ?"
+        params.append(city)
+    if state:
+        sql += " AND store.state = ?"
+        params.append(state)
+    sql += " GROUP BY price.product_id"
+    
+    return {
+        product_id: dict(zip(json.loads(store_ids), json.loads(cents)))
+        for product_id, store_ids, cents in session.connection().exec_driver_sql(sql, tuple(params))
+    }
+
+
+def quote_basket(
+    session: Session,
+    items: Sequence[BasketItem],
+    max_stores: int = 2,
+    city: Optional[str] = None,
+    state: Optional[str] = None,
+    exact: bool = False
+) -> BasketQuote:
+    """Find the cheapest single store and cheapest split of a basket.
+    
+    Repeated products are merged. Products that no eligible store prices
+    are reported as missing and left out of both plans.
+    
+    Args:
+        session: Database session
+        items: Products and quantities to buy
+        max_stores: Most stores the split may visit
+        city: Only consider stores in this city
+        state: Only consider stores in this state
+        exact: Search until the split is proven cheapest, ignoring BASKET_QUOTE_SECONDS
+        
+    Returns:
+        The cheapest store stocking every priced item, if any, and the
+        cheapest split across at most max_stores stores; a split the search
+        could not prove optimal within BASKET_QUOTE_SECONDS is marked inexact
+    """
+    deadline = None if exact else time.perf_counter() + BASKET_QUOTE_SECONDS
+    quantities: Dict[int, int] = {}
+    for item in items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    
+    prices = load_current_prices(session, list(quantities), city=city, state=state)
+    basket = [BasketItem(product_id=product_id, quantity=quantity) for product_id, quantity in quantities.items() if product_id in prices]
+    quote = BasketQuote(missing=[product_id for product_id in quantities if product_id not in prices])
+    if not basket:
+        return quote
+    
+    matrix = _Matrix(basket, prices)
+    totals = [sum(costs) for costs in matrix.costs]
+    cheapest = min(range(len(totals)), key=totals.__getitem__)
+    if totals[cheapest] < _UNSTOCKED:
+        quote.cheapest_store = matrix.plan(session, [cheapest])
+    
+    if max_stores == 1:
+        quote.cheapest_split = quote.cheapest_store
+        return quote
+    split, exact = cheapest_split(matrix.costs, max_stores, deadline=deadline)
+    if split is not None:
+        quote.cheapest_split = matrix.plan(session, split)
+        quote.cheapest_split.exact = exact
+    return quote
+
+
+def cheapest_split(
+    costs: List[List[int]],
+    max_stores: int,
+    deadline: Optional[float] = None
+) -> Tuple[Optional[List[int]], bool]:
+    """Choose at most max_stores rows minimising the sum of column minimums.
+    
+    Branch and bound, one store added per level, each child excluding the
+    siblings tried before it. Bounds are taken on a relaxation that prices
+    unstocked items at their dearest stocked price, which never overprices a
+    choice that stocks everything; coverage is tracked separately and only
+    complete choices become the incumbent.
+    
+    First stores are tried cheapest first and bounded by buying every item
+    at its cheapest remaining candidate. Further stores are scored by their
+    gain, how much adding one alone would cut the total, and tried best gain
+    first. Gains only shrink as stores are added, so the total minus the
+    best gains that still fit bounds a branch, and a parent's gains bound
+    its children's: candidates that cannot close the gap to the incumbent
+    are never rescored. Both bounds grow along the order they are used in,
+    so once one reaches the incumbent the remaining siblings are pruned.
+    
+    Children are explored in the order a greedy planner would pick them,
+    so the first leaf reached completes the greedy split. From then on a
+    search still running at the deadline stops and returns the incumbent
+    unproven.
+    
+    Args:
+        costs: Cost of each item at each store, _UNSTOCKED where not sold
+        max_stores: Most rows to choose
+        deadline: time.perf_counter() value to stop searching at, None to search to the end
+        
+    Returns:
+        Indexes of the chosen rows, or None if no choice covers every item,
+        and whether the search proved the choice optimal
+    """
+    columns = list(zip(*costs))
+    dearest = [max(filter(_UNSTOCKED.__gt__, column), default=None) for column in columns]
+    if None in dearest:
+        return None, True
+    # Relaxed a column at a time, leaving the usual fully stocked columns as they are
+    relaxed = [list(row) for row in zip(*(
+        column if high == max(column) else [min(cost, high) for cost in column]
+        for column, high in zip(columns, dearest)
+    ))]
+    # One byte per item, 1 where stocked: OR-ing these masks never carries, so they combine like bit sets
+    stocks = [int.from_bytes(bytes(map(_UNSTOCKED.__gt__, row)), "big") for row in costs]
+    everything = int.from_bytes(bytes([1]) * len(dearest), "big")
+    best_total = _UNSTOCKED
+    best: List[int] = []
+    # Whether the greedy split has been tried, after which the search may stop at the deadline
+    settled = max_stores == 1
+    timed_out = False
+    
+    def out_of_time() -> bool:
+        nonlocal timed_out
+        timed_out = timed_out or (
+            deadline is not None and settled and bool(best) and time.perf_counter() >= deadline
+        )
+        return timed_out
+    
+    def search(
+        chosen: List[int],
+        paying: List[int],
+        stocked: int,
+        candidates: List[int],
+        slots: int,
+        upper: Optional[Dict[int, int]]
+    ) -> None:
+        nonlocal best_total, best, settled
+        if out_of_time():
+            return
+        current = sum(paying)
+        if upper is not None:
+            # A candidate can only help if it and the best other candidates could close the gap
+            needed = current - best_total - sum(upper[store] for store in candidates[:slots - 1])
+            candidates = [store for store in candidates if upper[store] > needed]
+        gains = {store: current - sum(map(min, paying, relaxed[store])) for store in candidates}
+        settled = settled or slots == 1
+        
+        ranked = sorted(gains, key=gains.__getitem__, reverse=True)
+        for position, store in enumerate(ranked):
+            if current - sum(gains[other] for other in ranked[position:position + slots]) >= best_total:
+                return
+            if current - gains[store] < best_total and stocked | stocks[store] == everything:
+                best_total, best = current - gains[store], chosen + [store]
+            if slots > 1 and not out_of_time():
+                search(
+                    chosen + [store],
+                    list(map(min, paying, relaxed[store])),
+                    stocked | stocks[store],
+                    ranked[position + 1:],
+                    slots - 1,
+                    gains
+                )
+    
+    order = sorted(range(len(costs)), key=lambda store: sum(relaxed[store]))
+    # floor[t]: each item bought at its cheapest store among order[t:], built
+    # once the first store's branch has settled the greedy split it prunes against
+    floor: List[int] = []
+    for position, store in enumerate(order):
+        if out_of_time():
+            break
+        if position == 1:
+            cheapest = dearest
+            for later in reversed(order):
+                cheapest = list(map(min, cheapest, relaxed[later]))
+                floor.append(sum(cheapest))
+            floor.reverse()
+        if floor and floor[position] >= best_total:
+            break
+        if stocks[store] == everything and sum(relaxed[store]) < best_total:
+            best_total, best = sum(relaxed[store]), [store]
+        if max_stores > 1:
+            search([store], relaxed[store], stocks[store], order[position + 1:], max_stores - 1, None)
+    
+    exact = not timed_out
+    if best_total >= _UNSTOCKED:
+        return None, exact
+    return best, exact
@@ -1,49 +1,88 @@
 """ETL functions for product data."""
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, List
+from operator import itemgetter
+from typing import Iterable, Iterator, Optional, List, Tuple
 import csv
-from sqlmodel import Session, select, insert, Column
+import re
+from sqlalchemy import DateTime, bindparam, case, exists, func, literal, or_
+from sqlalchemy.dialects.sqlite import dialect as sqlite_dialect, insert as sqlite_insert
+from sqlmodel import Session, select, insert, col, Column
 
+from webapp.cache import PRODUCTS, bump_data_version
+from webapp.database import DEFAULT_BATCH_SIZE, SQLITE_DATETIME_FORMAT, UpsertResult, batched
+from webapp.files import open_csv
+from webapp.imports.ledger import ImportLedger
+from webapp.jobs.runner import report_progress
 from webapp.products.models import PluCommodity, Product
+from webapp.query_budget import query_budget
+from webapp.writer import write
 
+DEFAULT_PLU_CSV = Path('data/commodities.csv')
 
-def import_all_plu_to_products(session: Session) -> List[Product]:
+# Import ledger feed for PLU commodity files
+PLU_FEED = "plu"
+
+# Upsert columns, natural key first
+PLU_COLUMNS = tuple(
+    column.name for column in PluCommodity.__table__.columns  # type: ignore
+    if column.name != "id"
+)
+
+# CSV headers load_plu_rows cannot do without; other columns default to NULL
+PLU_REQUIRED_HEADERS = (
+    "Plu", "Type", "Category", "Commodity", "Variety", "Size", "Status",
+    "Updated_by", "Updated_at", "Created_at", "Language"
+)
+PLU_TIMESTAMP_POSITIONS = tuple(
+    PLU_COLUMNS.index(column) for column in ("updated_at", "created_at", "deleted_at")
+)
+PLU_TIMESTAMP_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}")
+
+
+class PluSchemaError(ValueError):
+    def __init__(self, csv_path: Path, problem: str):
+        super().__init__(f"Invalid PLU commodities file {csv_path}: {problem}")
+
+
+def import_all_plu_to_products(session: Session) -> UpsertResult:
     """Import all PLU commodities to Products.
     
+    Runs as a single INSERT ... SELECT so names, units and active flags are
+    computed in SQL and PLUs that already have a product are skipped there.
+    
     Args:
         session: Database session
         
     Returns:
-        List of created Products
+        Counts of inserted products and PLUs that already had one
     """
-    stmt = select(PluCommodity)
-    plus = session.exec(stmt).all()
-    products = []
-    
-    for plu in plus:
-        # Check if product already exists
-        stmt = select(Product).where(Product.upc == plu.plu)
-        existing = session.exec(stmt).first()
-        if existing:
-            products.append(existing)
-            continue
-            
-        # Create new product
-        product = Product(
-            name=f"{plu.commodity} - {plu.variety}".title(),
-            upc=plu.plu,
-            unit="lb" if plu.measures_na else "each",
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow(),
-            is_active=plu.deleted_at is None
-        )
-        
-        session.add(product)
-        products.append(product)
+    plu = PluCommodity.__table__  # type: ignore
+    product = Product.__table__  # type: ignore
+    now = literal(datetime.utcnow(), DateTime)
+    
+    rows = select(
+        func.title(plu.c.commodity + " - " + plu.c.variety),
+        plu.c.plu,
+        case((func.coalesce(plu.c.measures_na, "") != "", "lb"), else_="each"),
+        now,
+        now,
+        plu.c.deleted_at.is_(None)
+    ).where(~exists().where(product.c.upc == plu.c.plu))
+    stmt = insert(product).from_select(
+        ["name", "upc", "unit", "created_at", "updated_at", "is_active"],
+        rows
+    )
+    
+    @query_budget(2)
+    def save(session: Session) -> Tuple[int, int]:
+        total = session.scalar(select(func.count()).select_from(plu)) or 0
+        return total, session.connection().execute(stmt).rowcount
     
-    session.commit()
-    return products
+    total, inserted = write(session, save)
+    bump_data_version(PRODUCTS)
+    report_progress(rows_read=total, rows_written=inserted)
+    return UpsertResult(inserted=inserted, unchanged=total - inserted)
 
 def import_plu_to_product(session: Session, plu_id: int) -> Optional[Product]:
     """Import a PLU commodity to a Product.
@@ -76,9 +115,8 @@ def import_plu_to_product(session: Session, plu_id: int) -> Optional[Product]:
         is_active=plu.deleted_at is None
     )
     
-    session.add(product)
-    session.commit()
-    session.refresh(product)
+    write(session, lambda session: session.add(product))
+    bump_data_version(PRODUCTS)
     
     return product
 
@@ -93,84 +131,211 @@ def load_plu_commodities(csv_path: Optional[Path] = None) -> List[PluCommodity]:
         List of PLU commodity instances (not yet persisted)
     """
     if csv_path is None:
-        csv_path = Path('data/commodities.csv')
+        csv_path = DEFAULT_PLU_CSV
         
     if not csv_path.exists():
         raise FileNotFoundError(f'CSV file not found: {csv_path}')
         
-    commodities = []
+    return [_plu_from_row(row) for row in _iter_plu_rows(csv_path)]
+
+
+def _iter_plu_rows(csv_path: Path) -> Iterator[dict]:
+    """Stream raw rows from a PLU commodities CSV file."""
     with csv_path.open() as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            plu = PluCommodity(
-                plu=row['Plu'],
-                type=row['Type'],
-                category=row['Category'],
-                commodity=row['Commodity'],
-                variety=row['Variety'],
-                size=row['Size'],
-                measures_na=row.get('Measures_na'),
-                measures_row=row.get('Measures_row'),
-                restrictions=row.get('Restrictions'),
-                botanical=row.get('Botanical'),
-                aka=row.get('Aka'),
-                status=row['Status'],
-                link=row.get('Link'),
-                notes=row.get('Notes'),
-                updated_by=row['Updated_by'],
-                updated_at=datetime.strptime(row['Updated_at'], '%Y-%m-%d %H:%M:%S'),
-                created_at=datetime.strptime(row['Created_at'], '%Y-%m-%d %H:%M:%S'),
-                deleted_at=datetime.strptime(row['Deleted_at'], '%Y-%m-%d %H:%M:%S') if row.get('Deleted_at') else None,
-                language=row['Language']
-            )
-            commodities.append(plu)
-            
-    return commodities
+        yield from csv.DictReader(f)
+
+
+def _plu_from_row(row: dict) -> PluCommodity:
+    """Build a PLU commodity from a raw CSV row."""
+    return PluCommodity(
+        plu=row['Plu'],
+        type=row['Type'],
+        category=row['Category'],
+        commodity=row['Commodity'],
+        variety=row['Variety'],
+        size=row['Size'],
+        measures_na=row.get('Measures_na'),
+        measures_row=row.get('Measures_row'),
+        restrictions=row.get('Restrictions'),
+        botanical=row.get('Botanical'),
+        aka=row.get('Aka'),
+        status=row['Status'],
+        link=row.get('Link'),
+        notes=row.get('Notes'),
+        updated_by=row['Updated_by'],
+        updated_at=datetime.strptime(row['Updated_at'], '%Y-%m-%d %H:%M:%S'),
+        created_at=datetime.strptime(row['Created_at'], '%Y-%m-%d %H:%M:%S'),
+        deleted_at=datetime.strptime(row['Deleted_at'], '%Y-%m-%d %H:%M:%S') if row.get('Deleted_at') else None,
+        language=row['Language']
+    )
+
+
+def load_plu_rows(csv_path: Path) -> Iterator[tuple]:
+    """Stream PLU commodity rows as tuples ready for save_plu_rows.
+    
+    Bulk-load fast path: skips model construction entirely. The header is
+    validated once against PLU_REQUIRED_HEADERS; per row, only the field
+    count and the fixed timestamp layout are checked, and timestamps are
+    rewritten straight into SQLite storage format without building
+    datetime objects.
+    
+    Args:
+        csv_path: Path to plain or gzip-compressed CSV file
+        
+    Yields:
+        Column values in PLU_COLUMNS order
+        
+    Raises:
+        PluSchemaError: If the header lacks required columns, a row has the
+            wrong number of fields or a timestamp is malformed
+    """
+    with open_csv(csv_path) as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        missing = [name for name in PLU_REQUIRED_HEADERS if name not in header]
+        if missing:
+            raise PluSchemaError(csv_path, f"missing columns {', '.join(missing)}")
+        
+        index = {name.lower(): position for position, name in enumerate(header)}
+        positions = [index.get(column) for column in PLU_COLUMNS]
+        width = len(header)
+        for record in reader:
+            if len(record) != width:
+                raise PluSchemaError(csv_path, f"line {reader.line_num} has {len(record)} fields, expected {width}")
+            values = [record[position] if position is not None else None for position in positions]
+            for column in PLU_TIMESTAMP_POSITIONS:
+                values[column] = _sql_timestamp(csv_path, reader.line_num, values[column])
+            yield tuple(values)
+
+
+def _sql_timestamp(csv_path: Path, line: int, value: Optional[str]) -> Optional[str]:
+    """Convert a 'YYYY-MM-DD HH:MM:SS' CSV timestamp to SQLite storage format."""
+    if not value:
+        return None
+    if not PLU_TIMESTAMP_PATTERN.fullmatch(value):
+        raise PluSchemaError(csv_path, f"line {line} has malformed timestamp {value!r}")
+    return value + ".000000"
 
 
-def save_plu_commodities(session: Session, commodities: List[PluCommodity]) -> List[PluCommodity]:
+def save_plu_commodities(
+    session: Session,
+    commodities: Iterable[PluCommodity],
+    batch_size: int = DEFAULT_BATCH_SIZE
+) -> UpsertResult:
     """Save PLU commodities to database using bulk upsert.
     
     Args:
         session: Database session
-        commodities: List of PLU commodity instances to save
+        commodities: PLU commodity instances to save
+        batch_size: Number of rows written per write batch
+        
+    Returns:
+        Counts of inserted, updated and unchanged PLU commodities
+    """
+    rows = (
+        tuple(_to_sql_value(getattr(plu, column)) for column in PLU_COLUMNS)
+        for plu in commodities
+    )
+    return save_plu_rows(session, rows, batch_size=batch_size)
+
+
+def save_plu_rows(
+    session: Session,
+    rows: Iterable[tuple],
+    batch_size: int = DEFAULT_BATCH_SIZE
+) -> UpsertResult:
+    """Upsert PLU rows keyed on plu, committing once per batch.
+    
+    Existing rows are only rewritten when at least one column differs, and
+    each batch is its own write through the group-commit writer so readers
+    are never blocked for the length of a full refresh.
+    
+    Args:
+        session: Database session
+        rows: Column values in PLU_COLUMNS order, timestamps already in
+            SQLite storage format
+        batch_size: Number of rows written per write batch
         
     Returns:
-        List of saved PLU commodities
+        Counts of inserted, updated and unchanged PLU commodities
     """
-    if not commodities:
-        return []
-    
-    saved_plus = []
-    for plu in commodities:
-        # Check if PLU already exists
-        stmt = select(PluCommodity).where(PluCommodity.plu == plu.plu)
-        existing = session.exec(stmt).first()
+    @query_budget(2)
+    def save(session: Session, batch: List[tuple]) -> Tuple[int, int]:
+        existing = session.scalar(
+            select(func.count()).select_from(PluCommodity).where(
+                col(PluCommodity.plu).in_([row[0] for row in batch])
+            )
+        ) or 0
+        return existing, session.connection().exec_driver_sql(PLU_UPSERT_SQL, batch).rowcount
+    
+    result = UpsertResult()
+    for batch in batched(rows, batch_size):
+        batch = list({row[0]: row for row in batch}.values())
+        existing, written = write(session, lambda session: save(session, batch))
+        bump_data_version(PRODUCTS)
         
-        if existing:
-            # Update existing PLU
-            for key, value in plu.model_dump().items():
-                if key not in ['id']:
-                    setattr(existing, key, value)
-            saved_plus.append(existing)
-        else:
-            # Add new PLU
-            session.add(plu)
-            saved_plus.append(plu)
-    
-    session.commit()
-    return saved_plus
-
-
-def import_plu_commodities(session: Session, csv_path: Optional[Path] = None) -> List[PluCommodity]:
+        inserted = len(batch) - existing
+        updated = written - inserted
+        report_progress(rows_read=len(batch), rows_written=written)
+        result += UpsertResult(inserted=inserted, updated=updated, unchanged=existing - updated)
+    return result
+
+
+def _build_plu_upsert_sql() -> str:
+    """Compile the positional INSERT ... ON CONFLICT(plu) DO UPDATE used by save_plu_rows."""
+    table = PluCommodity.__table__  # type: ignore
+    stmt = sqlite_insert(table).values({column: bindparam(column) for column in PLU_COLUMNS})
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["plu"],
+        set_={column: stmt.excluded[column] for column in PLU_COLUMNS[1:]},
+        where=or_(*(
+            table.c[column].is_distinct_from(stmt.excluded[column])
+            for column in PLU_COLUMNS[1:]
+        ))
+    )
+    return str(stmt.compile(dialect=sqlite_dialect()))
+
+
+def _to_sql_value(value):
+    """Convert a model value to what SQLAlchemy would store in SQLite."""
+    if isinstance(value, datetime):
+        return value.strftime(SQLITE_DATETIME_FORMAT)
+    return value
+
+
+PLU_UPSERT_SQL = _build_plu_upsert_sql()
+
+
+def import_plu_commodities(
+    session: Session,
+    csv_path: Optional[Path] = None,
+    force: bool = False
+) -> UpsertResult:
     """Import PLU commodities from CSV file.
     
+    The import ledger short-circuits a file identical to the last import and
+    otherwise only saves rows whose fingerprint has changed.
+    
     Args:
         session: Database session
         csv_path: Path to CSV file, defaults to data/commodities.csv
+        force: Re-import every row even if the ledger has seen it
         
     Returns:
-        List of created/updated PLU commodities
+        Counts of inserted, updated and unchanged PLU commodities
     """
-    commodities = load_plu_commodities(csv_path)
-    return save_plu_commodities(session, commodities)
+    if csv_path is None:
+        csv_path = DEFAULT_PLU_CSV
+    if not csv_path.exists():
+        raise FileNotFoundError(f'CSV file not found: {csv_path}')
+    
+    ledger = ImportLedger(session, PLU_FEED, csv_path)
+    if not force and ledger.unchanged():
+        last = ledger.last_import()
+        return UpsertResult(unchanged=last.row_count if last else 0)
+    
+    rows = ledger.changed_rows(load_plu_rows(csv_path), key=itemgetter(0), force=force)
+    result = save_plu_rows(session, rows)
+    result.unchanged += ledger.rows_skipped
+    ledger.commit()
+    return result
@@ -1,24 +1,41 @@
 """Generate fake product prices for testing."""
-from datetime import datetime
+from datetime import datetime, timedelta
 from decimal import Decimal
 import random
 from sqlmodel import Session, select
 from itertools import groupby
-from typing import List
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
 
+from webapp.cache import PRICES, bump_data_version
+from webapp.database import DEFAULT_BATCH_SIZE, SQLITE_DATETIME_FORMAT, batched
+from webapp.jobs.runner import report_progress
 from webapp.products.models import Product, ProductPrice, PluCommodity
+from webapp.products.prices import INSERT_PRICE_SQL
 from webapp.stores.models import Store
+from webapp.writer import write
 
+# Shelf prices in cents: $0.79 to $5.99 with common retail endings
+PRICE_POINTS = tuple(
+    cents for cents in (dollars * 100 + ending for dollars in range(6) for ending in (0, 25, 33, 50, 75, 99))
+    if 79 <= cents <= 599
+)
 
-def make_fake_prices(session: Session) -> List[ProductPrice]:
-    """Generate fake prices for products across stores.
+# Chance a store changes a product's price on a given day
+DAILY_PRICE_CHANGE_RATE = 0.05
+
+# Rows written per transaction by save_price_history, larger than ETL batches
+# because every row is a plain tuple
+HISTORY_BATCH_SIZE = DEFAULT_BATCH_SIZE * 25
+
+# (product_id, store_id, price, observed_at) as bound by save_price_history
+HistoryRow = Tuple[int, int, float, str]
+
+
+def sample_fake_price_products(session: Session, rng: random.Random) -> List[Product]:
+    """Pick the products fake prices are generated for.
     
     Takes 90% of non-retailer categories and 50% of products within each category.
-    Prices range from $0.79 to $5.99, always ending in .99
     """
-    # Get all stores
-    stores = session.exec(select(Store)).all()
-    
     # Get products with PLU codes, excluding retailer assigned
     stmt = select(Product, PluCommodity).join(
         PluCommodity,
@@ -35,51 +52,151 @@ def make_fake_prices(session: Session) -> List[ProductPrice]:
     # Take 90% of categories
     categories = list(by_category.keys())
     num_categories = int(len(categories) * 0.9)
-    selected_categories = random.sample(categories, num_categories)
+    selected_categories = rng.sample(categories, num_categories)
     
-    prices = []
+    selected_products = []
     for category in selected_categories:
         # Take 50% of products in category
         products = by_category[category]
         num_products = int(len(products) * 0.5)
-        selected_products = random.sample(products, num_products)
-        
+        selected_products.extend(rng.sample(products, num_products))
+    return selected_products
+
+
+def make_fake_prices(session: Session) -> List[ProductPrice]:
+    """Generate fake prices for products across stores.
+    
+    Takes 90% of non-retailer categories and 50% of products within each category.
+    Prices range from $0.79 to $5.99, always ending in .99
+    """
+    # Get all stores
+    stores = session.exec(select(Store)).all()
+    
+    prices = []
+    for product in sample_fake_price_products(session, random.Random()):
         # Create prices for each store
-        for product in selected_products:
-            for store in stores:
-                base_price = random.randint(79, 500) / 100
-                cents = base_price % 1
-                dollars = int(base_price)
-                
-                # Normalize cents to common retail endings
-                if cents < 0.125:
-                    cents = 0
-                elif cents < 0.29:
-                    cents = 0.25
-                elif cents < 0.415:
-                    cents = 0.33
-                elif cents < 0.625:
-                    cents = 0.50
-                elif cents < 0.875:
-                    cents = 0.75
-                else:
-                    cents = 0.99
-                
-                price = Decimal(str(dollars + cents)).quantize(Decimal('.01'))
-                prices.append(
-                    ProductPrice(
-                        product_id=product.id,
-                        store_id=store.id,
-                        price=price,
-                        observed_at=datetime.utcnow()
-                    )
+        for store in stores:
+            base_price = random.randint(79, 500) / 100
+            cents = base_price % 1
+            dollars = int(base_price)
+            
+            # Normalize cents to common retail endings
+            if cents < 0.125:
+                cents = 0
+            elif cents < 0.29:
+                cents = 0.25
+            elif cents < 0.415:
+                cents = 0.33
+            elif cents < 0.625:
+                cents = 0.50
+            elif cents < 0.875:
+                cents = 0.75
+            else:
+                cents = 0.99
+            
+            price = Decimal(str(dollars + cents)).quantize(Decimal('.01'))
+            prices.append(
+                ProductPrice(
+                    product_id=product.id,
+                    store_id=store.id,
+                    price=price,
+                    observed_at=datetime.utcnow()
                 )
+            )
     
     return prices
 
 
 def save_product_prices(session: Session, prices: List[ProductPrice]) -> None:
-    """Save generated product prices to database."""
-    for price in prices:
-        session.add(price)
-    session.commit()
\ No newline at end of file
+    """Save generated product prices to database; triggers update current and best prices."""
+    write(session, lambda session: session.add_all(prices))
+    bump_data_version(PRICES)
+    report_progress(rows_read=len(prices), rows_written=len(prices))
+
+def generate_price_history(
+    product_ids: Sequence[int],
+    store_ids: Sequence[int],
+    days: int,
+    seed: Optional[int] = None,
+    end: Optional[datetime] = None,
+    change_rate: float = DAILY_PRICE_CHANGE_RATE
+) -> Iterator[HistoryRow]:
+    """Yield one price observation per product, store and day.
+    
+    Each (product, store) starts at a random shelf price and keeps it from
+    day to day, changing on roughly change_rate of days. The day-to-day draws
+    for a series are taken in two bulk calls and prices are integer cents, so
+    no Decimal or ORM object is built per row. The same seed yields the same
+    rows.
+    
+    Args:
+        product_ids: Products to price
+        store_ids: Stores observing every product
+        days: Days of history, ending at end
+        seed: Seed for the random generator
+        end: Day of the last observation, defaults to today
+        change_rate: Chance of a price change on any day
+        
+    Yields:
+        (product_id, store_id, price, observed_at) rows ready for save_price_history
+    """
+    rng = random.Random(seed)
+    end = (end or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+    stamps = [(end - timedelta(days=days - 1 - day)).strftime(SQLITE_DATETIME_FORMAT) for day in range(days)]
+    prices = [cents / 100 for cents in PRICE_POINTS]
+    
+    for product_id in product_ids:
+        for store_id in store_ids:
+            changes = rng.choices((False, True), weights=(1 - change_rate, change_rate), k=days)
+            draws = iter(rng.choices(prices, k=days + 1))
+            price = next(draws)
+            for changed, stamp in zip(changes, stamps):
+                if changed:
+                    price = next(draws)
+                yield product_id, store_id, price, stamp
+
+
+def save_price_history(
+    session: Session,
+    rows: Iterable[HistoryRow],
+    batch_size: int = HISTORY_BATCH_SIZE
+) -> int:
+    """Bulk insert generated observations; triggers update current and best prices.
+    
+    Rows are bound straight into executemany, one write batch at a time
+    through the group-commit writer.
+    
+    Args:
+        session: Database session
+        rows: Rows from generate_price_history
+        batch_size: Rows per transaction
+        
+    Returns:
+        Number of observations written
+    """
+    written = 0
+    for batch in batched(rows, batch_size):
+        write(session, lambda session: session.connection().exec_driver_sql(INSERT_PRICE_SQL, batch))
+        written += len(batch)
+        report_progress(rows_read=len(batch), rows_written=len(batch))
+    
+    bump_data_version(PRICES)
+    return written
+
+
+def make_fake_price_history(session: Session, days: int, seed: Optional[int] = None) -> int:
+    """Generate and save days of fake prices for sampled products at every store.
+    
+    Args:
+        session: Database session
+        days: Days of history per product and store
+        seed: Seed for product sampling and price draws
+        
+    Returns:
+        Number of observations written
+    """
+    rng = random.Random(seed)
+    product_ids = [product.id for product in sample_fake_price_products(session, rng)]
+    store_ids = session.exec(select(Store.id)).all()
+    rows = generate_price_history(product_ids, store_ids, days, seed=rng.randrange(2**32))
+    return save_price_history(session, rows)
@@ -0,0 +1,238 @@
+"""Streaming ingestion of price observations from scanner feeds.
+
+Bodies are NDJSON objects or CSV rows with a header, one observation per
+line, each carrying product_id or upc, store_id, price and optionally
+observed_at. Lines are parsed as the body arrives and written in batches,
+so a large upload never sits in memory and its earlier batches are
+committed before the rest has been received.
+"""
+import csv
+import json
+import logging
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import AsyncIterable, AsyncIterator, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import tuple_
+from sqlmodel import Session, select
+
+from webapp.cache import PRICES, PRODUCTS, STORES, VersionedCache, bump_data_version
+from webapp.database import batched
+from webapp.products.models import IngestBatch, IngestResult, Product, ProductPrice, as_naive_utc
+from webapp.products.prices import REFRESH_BATCH_SIZE, Observation, insert_observations
+from webapp.stores.models import Store
+from webapp.writer import write
+
+logger = logging.getLogger(__name__)
+
+# Observations written per transaction
+INGEST_BATCH_SIZE = 10000
+
+# Error messages kept per batch; the rest are only counted
+MAX_BATCH_ERRORS = 10
+
+INGEST_FORMATS = {
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "text/csv": "csv",
+}
+
+# UPC -> product id and known product and store ids, reloaded after product or store writes
+_lookups = VersionedCache(max_size=3)
+
+
+class IngestFormatError(ValueError):
+    """Raised when a request body is in a format ingestion does not read."""
+    
+    def __init__(self, content_type: str):
+        self.content_type = content_type
+        super().__init__(f"Unsupported price feed format: {content_type or 'none'}; "
+                         f"use one of {', '.join(sorted(INGEST_FORMATS))}")
+
+
+class _RowError(ValueError):
+    """A feed line that cannot become an observation."""
+
+
+def ingest_format(content_type: str, override: Optional[str] = None) -> str:
+    """Feed format named by a format parameter or a Content-Type header.
+    
+    Raises:
+        IngestFormatError: If neither names a supported format
+    """
+    if override in INGEST_FORMATS.values():
+        return override  # type: ignore
+    media_type = content_type.split(";")[0].strip().lower()
+    if override is None and media_type in INGEST_FORMATS:
+        return INGEST_FORMATS[media_type]
+    raise IngestFormatError(override or content_type)
+
+
+async def aiter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """Split a streamed UTF-8 body into lines as chunks arrive."""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig").rstrip("\r")
+    if pending:
+        yield pending.decode("utf-8-sig").rstrip("\r")
+
+
+class PriceIngester:
+    """Turns feed lines into observations and commits them in batches.
+    
+    UPCs, product ids and store ids are resolved against in-memory lookups,
+    since SQLite does not enforce the price tables' foreign keys. Repeats of an
+    observation, whether within a batch or already stored, are counted as
+    duplicates rather than written again.
+    
+    Args:
+        session: Database session
+        format: "ndjson" or "csv"
+        batch_size: Observations per transaction
+    """
+    
+    def __init__(self, session: Session, format: str, batch_size: int = INGEST_BATCH_SIZE):
+        self.session = session
+        self.format = format
+        self.batch_size = batch_size
+        self.result = IngestResult()
+        self._header: Optional[List[str]] = None
+        self._line = 0
+        self._rows: List[Observation] = []
+        self._stats = IngestBatch(batch=1)
+        self._upcs: Dict[str, int] = _lookups.get_or_compute(
+            "upcs", [PRODUCTS],
+            lambda: dict(session.exec(select(Product.upc, Product.id).where(Product.upc != None)).all())  # noqa: E711
+        )
+        self._products: Set[int] = _lookups.get_or_compute(
+            "products", [PRODUCTS], lambda: set(session.exec(select(Product.id)).all())
+        )
+        self._stores: Set[int] = _lookups.get_or_compute(
+            "stores", [STORES], lambda: set(session.exec(select(Store.id)).all())
+        )
+    
+    def feed(self, line: str) -> None:
+        """Parse one feed line, writing a batch once it is full."""
+        self._line += 1
+        if not line.strip():
+            return
+        if self.format == "csv" and self._header is None:
+            self._header = [name.strip().lower() for name in next(csv.reader([line]))]
+            return
+        
+        self._stats.received += 1
+        try:
+            self._rows.append(self._observation(self._record(line)))
+        except _RowError as e:
+            self._stats.rejected += 1
+            if len(self._stats.errors) < MAX_BATCH_ERRORS:
+                self._stats.errors.append(f"line {self._line}: {e}")
+        if self._stats.received >= self.batch_size:
+            self.flush()
+    
+    def feed_all(self, lines: Iterable[str]) -> None:
+        """Parse a run of feed lines, writing each batch as it fills."""
+        for line in lines:
+            self.feed(line)
+    
+    def flush(self) -> None:
+        """Write the pending batch through the group-commit writer, recording its stats."""
+        stats = self._stats
+        if stats.received == 0:
+            return
+        stats.accepted = write(self.session, lambda session: self._insert_new(session, self._rows))
+        stats.duplicates = stats.received - stats.rejected - stats.accepted
+        if stats.accepted:
+            bump_data_version(PRICES)
+        
+        self.result.batches.append(stats)
+        for field in ("received", "accepted", "duplicates", "rejected"):
+            setattr(self.result, field, getattr(self.result, field) + getattr(stats, field))
+        logger.info(f"Ingested price batch {stats.batch}: {stats.accepted} accepted, "
+                    f"{stats.duplicates} duplicates, {stats.rejected} rejected")
+        self._rows = []
+        self._stats = IngestBatch(batch=stats.batch + 1)
+    
+    def finish(self) -> IngestResult:
+        """Write the last partial batch and return the overall result."""
+        self.flush()
+        return self.result
+    
+    def _record(self, line: str) -> dict:
+        """Field values of one line, keyed by lowercase field name."""
+        if self.format == "csv":
+            values = next(csv.reader([line]))
+            if len(values) != len(self._header):  # type: ignore
+                raise _RowError(f"expected {len(self._header)} fields, got {len(values)}")  # type: ignore
+            return dict(zip(self._header, values))  # type: ignore
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise _RowError(f"invalid JSON: {e.msg}")
+        if not isinstance(record, dict):
+            raise _RowError("expected a JSON object")
+        return {str(key).lower(): value for key, value in record.items()}
+    
+    def _observation(self, record: dict) -> Observation:
+        """Validate a record and resolve it to an observation."""
+        if record.get("product_id") not in (None, ""):
+            product_id = _as_int(record["product_id"], "product_id")
+            if product_id not in self._products:
+                raise _RowError(f"unknown product_id {product_id}")
+        elif record.get("upc") not in (None, ""):
+            product_id = self._upcs.get(str(record["upc"]).strip())
+            if product_id is None:
+                raise _RowError(f"unknown upc {record['upc']}")
+        else:
+            raise _RowError("missing product_id or upc")
+        
+        store_id = _as_int(record.get("store_id"), "store_id")
+        if store_id not in self._stores:
+            raise _RowError(f"unknown store_id {store_id}")
+        
+        try:
+            price = Decimal(str(record.get("price"))).quantize(Decimal(".01"))
+        except InvalidOperation:
+            raise _RowError(f"invalid price {record.get('price')}")
+        if not price.is_finite() or price < 0:
+            raise _RowError(f"invalid price {record.get('price')}")
+        
+        observed_at = record.get("observed_at")
+        if observed_at in (None, ""):
+            return product_id, store_id, price, datetime.utcnow()
+        try:
+            moment = datetime.fromisoformat(str(observed_at).replace("Z", "+00:00"))
+        except ValueError:
+            raise _RowError(f"invalid observed_at {observed_at}")
+        return product_id, store_id, price, as_naive_utc(moment)
+    
+    def _insert_new(self, session: Session, rows: List[Observation]) -> int:
+        """Insert the rows that are not already stored, returning how many."""
+        rows = self._new_observations(session, rows)
+        if rows:
+            insert_observations(session, rows)
+        return len(rows)
+    
+    def _new_observations(self, session: Session, rows: List[Observation]) -> List[Observation]:
+        """Rows that neither repeat an earlier row nor an already stored observation."""
+        unique = list(dict.fromkeys(rows))
+        stored = set()
+        for batch in batched(unique, REFRESH_BATCH_SIZE):
+            stored.update(tuple(row) for row in session.exec(
+                select(ProductPrice.product_id, ProductPrice.store_id, ProductPrice.price, ProductPrice.observed_at)
+                .where(tuple_(ProductPrice.product_id, ProductPrice.store_id, ProductPrice.observed_at).in_(  # type: ignore
+                    [(product_id, store_id, observed_at) for product_id, store_id, _, observed_at in batch]
+                ))
+            ).all())
+        return [row for row in unique if row not in stored]
+
+
+def _as_int(value, field: str) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise _RowError(f"invalid {field} {value}")
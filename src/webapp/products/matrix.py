@@ -0,0 +1,85 @@
+"""Product by store price comparison matrices."""
+from typing import Optional
+
+from sqlmodel import Session, col, select
+
+from webapp.cache import PRICES, PRODUCTS, STORES, VersionedCache
+from webapp.products.models import CurrentPrice, MatrixAxis, PluCommodity, PriceMatrix, Product
+from webapp.stores.models import Store
+
+# Largest matrix served, in rows and columns
+MATRIX_MAX_PRODUCTS = 500
+MATRIX_MAX_STORES = 100
+
+# Serialized matrices, recomputed after price, product or store writes
+_matrices = VersionedCache(max_size=64)
+
+
+def build_price_matrix(
+    session: Session,
+    category: Optional[str] = None,
+    city: Optional[str] = None,
+    state: Optional[str] = None,
+    max_products: int = MATRIX_MAX_PRODUCTS,
+    max_stores: int = MATRIX_MAX_STORES
+) -> PriceMatrix:
+    """Compare current prices of matching products across matching stores.
+    
+    Both axes are ordered by name and cut at their maximum; each axis query
+    fetches one extra row to tell whether it was cut. Every cell comes from
+    one query over CurrentPrice restricted to the two axes, pivoted in memory.
+    
+    Args:
+        session: Database session
+        category: Only products whose PLU is in this category
+        city: Only stores in this city
+        state: Only stores in this state
+        max_products: Most product rows
+        max_stores: Most store columns
+        
+    Returns:
+        Dense matrix of prices, None where a store has not priced a product,
+        marked truncated if either axis was cut
+    """
+    products = select(Product.id, Product.name).where(Product.is_active)
+    if category:
+        products = products.join(PluCommodity, PluCommodity.plu == Product.upc).where(PluCommodity.category == category)
+    products = products.order_by(Product.name, Product.id).limit(max_products + 1)
+    
+    stores = select(Store.id, Store.name).where(Store.is_active)
+    if city:
+        stores = stores.where(Store.city == city)
+    if state:
+        stores = stores.where(Store.state == state)
+    stores = stores.order_by(Store.name, Store.id).limit(max_stores + 1)
+    
+    rows = [MatrixAxis(id=id, name=name) for id, name in session.exec(products)]
+    columns = [MatrixAxis(id=id, name=name) for id, name in session.exec(stores)]
+    truncated = len(rows) > max_products or len(columns) > max_stores
+    rows, columns = rows[:max_products], columns[:max_stores]
+    row_of = {product.id: i for i, product in enumerate(rows)}
+    column_of = {store.id: j for j, store in enumerate(columns)}
+    
+    prices = [[None] * len(columns) for _ in rows]
+    if rows and columns:
+        cells = select(CurrentPrice.product_id, CurrentPrice.store_id, CurrentPrice.price).where(
+            col(CurrentPrice.product_id).in_(list(row_of)),
+            col(CurrentPrice.store_id).in_(list(column_of))
+        )
+        for product_id, store_id, price in session.connection().execute(cells):
+            prices[row_of[product_id]][column_of[store_id]] = price
+    return PriceMatrix(products=rows, stores=columns, prices=prices, truncated=truncated)
+
+
+def price_matrix_json(
+    session: Session,
+    category: Optional[str] = None,
+    city: Optional[str] = None,
+    state: Optional[str] = None
+) -> bytes:
+    """JSON body of build_price_matrix, cached until prices, products or stores change."""
+    return _matrices.get_or_compute(
+        (category, city, state),
+        [PRICES, PRODUCTS, STORES],
+        lambda: build_price_matrix(session, category=category, city=city, state=state).model_dump_json().encode()
+    )
@@ -1,8 +1,9 @@
 """Product data models."""
-from datetime import datetime
+from datetime import datetime, timezone
 from decimal import Decimal
-from typing import Optional
-from pydantic import ConfigDict
+from typing import List, Optional
+from pydantic import ConfigDict, field_validator
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel, Relationship
 from webapp.stores.models import Store
 
@@ -35,6 +36,10 @@ class Product(SQLModel, table=True):
 class ProductPrice(SQLModel, table=True):
     """Product price at a specific store and time."""
     
+    __table_args__ = (
+        Index("ix_productprice_product_store_observed", "product_id", "store_id", "observed_at"),
+    )
+    
     id: Optional[int] = Field(default=None, primary_key=True)
     product_id: int = Field(foreign_key="product.id", index=True)
     store_id: int = Field(foreign_key="store.id", index=True)
@@ -55,9 +60,39 @@ class ProductPrice(SQLModel, table=True):
         }
 
 
+class CurrentPrice(SQLModel, table=True):
+    """Latest ProductPrice observation of each product at each store.
+    
+    Rows are maintained by a trigger on productprice, see
+    webapp.products.prices.
+    """
+    
+    product_id: int = Field(foreign_key="product.id", primary_key=True)
+    store_id: int = Field(foreign_key="store.id", primary_key=True)
+    price: Decimal = Field(max_digits=10, decimal_places=2)
+    observed_at: datetime
+
+
+class BestPrice(SQLModel, table=True):
+    """Lowest current price of a product across stores.
+    
+    Derived from CurrentPrice the same way CurrentPrice is derived from
+    ProductPrice: rows are maintained by triggers, see webapp.products.prices.
+    """
+    
+    product_id: int = Field(foreign_key="product.id", primary_key=True)
+    store_id: int = Field(foreign_key="store.id")
+    price: Decimal = Field(max_digits=10, decimal_places=2)
+    observed_at: datetime
+
+
 class ProductPriceSnapshot(SQLModel, table=True):
     """Product price snapshot with validity period."""
     
+    __table_args__ = (
+        Index("ix_productpricesnapshot_product_store_valid_from", "product_id", "store_id", "valid_from"),
+    )
+    
     id: Optional[int] = Field(default=None, primary_key=True)
     product_id: int = Field(foreign_key="product.id", index=True)
     store_id: int = Field(foreign_key="store.id", index=True)
@@ -81,6 +116,142 @@ class ProductPriceSnapshot(SQLModel, table=True):
         }
 
 
+class SnapshotWatermark(SQLModel, table=True):
+    """Highest ProductPrice id already compacted into snapshots."""
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    last_price_id: int = Field(default=0)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+def as_naive_utc(moment: datetime) -> datetime:
+    """A moment as the naive UTC datetime the database stores; naive input is taken as UTC."""
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class PriceLookup(SQLModel):
+    """A point-in-time price question: product at store as of a moment."""
+    
+    product_id: int
+    store_id: int
+    at: datetime
+    
+    @field_validator("at")
+    @classmethod
+    def _naive_utc(cls, at: datetime) -> datetime:
+        return as_naive_utc(at)
+
+
+class PricePoint(PriceLookup):
+    """Answer to a PriceLookup; price is None when no snapshot covers the moment."""
+    
+    price: Optional[Decimal] = None
+    valid_from: Optional[datetime] = None
+    valid_until: Optional[datetime] = None
+
+
+class BasketItem(SQLModel):
+    """A product and how many of it to buy."""
+    
+    product_id: int
+    quantity: int = Field(default=1, ge=1)
+
+
+class BasketRequest(SQLModel):
+    """A basket to price and where it may be bought.
+    
+    exact asks for a split proven cheapest however long the search takes,
+    rather than the best split found within the quote's time limit.
+    """
+    
+    items: List[BasketItem]
+    max_stores: int = Field(default=2, ge=1)
+    city: Optional[str] = None
+    state: Optional[str] = None
+    exact: bool = False
+
+
+class BasketLine(SQLModel):
+    """Where one basket item is bought and what it costs."""
+    
+    product_id: int
+    store_id: int
+    store_name: str
+    quantity: int
+    price: Decimal
+    cost: Decimal
+
+
+class BasketPlan(SQLModel):
+    """Stores to visit and the lines bought at each.
+    
+    exact is False when the search stopped at its time limit before proving
+    no cheaper plan exists; callers that need a proven split ask for one
+    with BasketRequest.exact.
+    """
+    
+    store_ids: List[int]
+    total: Decimal
+    lines: List[BasketLine]
+    exact: bool = True
+
+
+class BasketQuote(SQLModel):
+    """Cheapest single store and cheapest split for a basket.
+    
+    Products no eligible store prices are listed in missing and left out of
+    both plans.
+    """
+    
+    cheapest_store: Optional[BasketPlan] = None
+    cheapest_split: Optional[BasketPlan] = None
+    missing: List[int] = []
+
+
+class MatrixAxis(SQLModel):
+    """A product row or store column of a price matrix."""
+    
+    id: int
+    name: str
+
+
+class PriceMatrix(SQLModel):
+    """Current prices of products (rows) at stores (columns).
+    
+    prices[i][j] is the price of products[i] at stores[j], or None if the
+    store has no observation of it. truncated is True when more products or
+    stores matched than the matrix holds, and only the first by name are shown.
+    """
+    
+    products: List[MatrixAxis]
+    stores: List[MatrixAxis]
+    prices: List[List[Optional[Decimal]]]
+    truncated: bool = False
+
+
+class IngestBatch(SQLModel):
+    """Outcome of one committed batch of ingested price observations."""
+    
+    batch: int
+    received: int = 0
+    accepted: int = 0
+    duplicates: int = 0
+    rejected: int = 0
+    errors: List[str] = []
+
+
+class IngestResult(SQLModel):
+    """Per-batch and overall outcome of a price ingestion request."""
+    
+    batches: List[IngestBatch] = []
+    received: int = 0
+    accepted: int = 0
+    duplicates: int = 0
+    rejected: int = 0
+
+
 class PluCommodity(SQLModel, table=True):
     """PLU commodity representing a standardized produce item."""
     
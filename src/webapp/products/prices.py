@@ -0,0 +1,113 @@
+"""Maintenance of current prices per product and store, and the best per product.
+
+Both tables are derived by triggers, so every insert path, including raw
+executemany, keeps them current: a trigger on productprice keeps each
+store's latest observation in CurrentPrice, and triggers on currentprice
+keep the cheapest current price per product in BestPrice. The DDL is
+attached to CurrentPrice's after_create event so
+SQLModel.metadata.create_all installs it.
+"""
+from datetime import datetime
+from decimal import Decimal
+from typing import List, Tuple
+
+from sqlalchemy import DDL, Connection, event, text
+from sqlmodel import Session
+
+from webapp.database import SQLITE_DATETIME_FORMAT
+from webapp.products.models import CurrentPrice
+
+# (product_id, store_id, price, observed_at) of a written ProductPrice row
+Observation = Tuple[int, int, Decimal, datetime]
+
+# Keys looked up per statement, bounded by SQLite's variable limit
+REFRESH_BATCH_SIZE = 500
+
+# Raw executemany insert of observations, bound as (product_id, store_id, price, observed_at)
+INSERT_PRICE_SQL = "INSERT INTO productprice (product_id, store_id, price, observed_at) VALUES (?, ?, ?, ?)"
+
+CURRENT_PRICE_TRIGGER = (
+    "CREATE TRIGGER IF NOT EXISTS productprice_current AFTER INSERT ON productprice BEGIN "
+    "INSERT INTO currentprice (product_id, store_id, price, observed_at) "
+    "VALUES (new.product_id, new.store_id, new.price, new.observed_at) "
+    "ON CONFLICT (product_id, store_id) DO UPDATE SET price = excluded.price, observed_at = excluded.observed_at "
+    "WHERE excluded.observed_at >= currentprice.observed_at; END"
+)
+
+# Best is the lowest price, then the freshest observation, then the lowest store id
+_BEATS_BEST = (
+    "excluded.price < bestprice.price OR (excluded.price = bestprice.price AND "
+    "(excluded.observed_at > bestprice.observed_at OR "
+    "(excluded.observed_at = bestprice.observed_at AND excluded.store_id < bestprice.store_id)))"
+)
+_SET_BEST = "store_id = excluded.store_id, price = excluded.price, observed_at = excluded.observed_at"
+_BEST_STORE = "(SELECT store_id FROM bestprice WHERE product_id = new.product_id)"
+_OFFER_BEST = (
+    "INSERT INTO bestprice (product_id, store_id, price, observed_at) "
+    "VALUES (new.product_id, new.store_id, new.price, new.observed_at) "
+    f"ON CONFLICT (product_id) DO UPDATE SET {_SET_BEST} WHERE {_BEATS_BEST}; END"
+)
+
+BEST_PRICE_TRIGGERS = (
+    # A new store price, or a changed price at another store, only has to beat the best
+    f"CREATE TRIGGER IF NOT EXISTS currentprice_best_insert AFTER INSERT ON currentprice BEGIN {_OFFER_BEST}",
+    "CREATE TRIGGER IF NOT EXISTS currentprice_best_update AFTER UPDATE ON currentprice "
+    f"WHEN new.store_id IS NOT {_BEST_STORE} BEGIN {_OFFER_BEST}",
+    # The best store changed its price, so any store may now be cheapest
+    "CREATE TRIGGER IF NOT EXISTS currentprice_best_recompute AFTER UPDATE ON currentprice "
+    f"WHEN new.store_id = {_BEST_STORE} BEGIN "
+    "INSERT INTO bestprice (product_id, store_id, price, observed_at) "
+    "SELECT product_id, store_id, price, observed_at FROM currentprice WHERE product_id = new.product_id "
+    "ORDER BY price, observed_at DESC, store_id LIMIT 1 "
+    f"ON CONFLICT (product_id) DO UPDATE SET {_SET_BEST}; END"
+)
+
+for _trigger in (CURRENT_PRICE_TRIGGER, *BEST_PRICE_TRIGGERS):
+    event.listen(CurrentPrice.__table__, "after_create", DDL(_trigger).execute_if(dialect="sqlite"))  # type: ignore
+
+_CURRENT_PRICE_SQL = """
+INSERT INTO currentprice (product_id, store_id, price, observed_at)
+SELECT product_id, store_id, price, observed_at FROM (
+    SELECT product_id, store_id, price, observed_at,
+           ROW_NUMBER() OVER (PARTITION BY product_id, store_id ORDER BY observed_at DESC, id DESC) AS rn
+    FROM productprice
+)
+WHERE rn = 1
+"""
+
+_BEST_PRICE_SQL = """
+INSERT INTO bestprice (product_id, store_id, price, observed_at)
+SELECT product_id, store_id, price, observed_at FROM (
+    SELECT product_id, store_id, price, observed_at,
+           ROW_NUMBER() OVER (PARTITION BY product_id ORDER BY price, observed_at DESC, store_id) AS rn
+    FROM currentprice
+)
+WHERE rn = 1
+"""
+
+
+def insert_observations(session: Session, observations: List[Observation]) -> None:
+    """Bulk insert observations without ORM objects.
+    
+    The caller commits; CurrentPrice and BestPrice follow through their triggers.
+    
+    Args:
+        session: Database session
+        observations: Observations to write
+    """
+    session.connection().exec_driver_sql(INSERT_PRICE_SQL, [
+        (product_id, store_id, float(price), observed_at.strftime(SQLITE_DATETIME_FORMAT))
+        for product_id, store_id, price, observed_at in observations
+    ])
+
+
+def refresh_current_prices(connection: Connection) -> None:
+    """Rebuild CurrentPrice from ProductPrice, e.g. after deleting observations."""
+    connection.execute(text("DELETE FROM currentprice"))
+    connection.execute(text(_CURRENT_PRICE_SQL))
+
+
+def refresh_best_prices(connection: Connection) -> None:
+    """Rebuild BestPrice from CurrentPrice, e.g. after rebuilding current prices."""
+    connection.execute(text("DELETE FROM bestprice"))
+    connection.execute(text(_BEST_PRICE_SQL))
@@ -1,104 +1,232 @@
 """Product routes and views."""
-from fastapi import APIRouter, Request, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Request, Depends
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from sqlmodel import Session, select, text, or_, col
 from sqlalchemy import func, cast, String, desc, asc
 
-from webapp.database import get_session
+from webapp.cache import PRICES, PRODUCTS, VersionedCache
+from webapp.database import get_session, run_in_db
+from webapp.http_cache import cached_response
+from webapp.jobs.runner import submit_job
 from webapp.products.etl import import_plu_commodities, import_all_plu_to_products
-from webapp.products.models import Product, ProductPrice
-from webapp.products.fakeit import make_fake_prices
+from webapp.products.basket import quote_basket
+from webapp.products.models import BasketQuote, BasketRequest, BestPrice, IngestResult, PriceLookup, PriceMatrix, PricePoint, Product, as_naive_utc
+from webapp.products.ingest import IngestFormatError, PriceIngester, aiter_lines, ingest_format
+from webapp.products.matrix import price_matrix_json
+from webapp.products.fakeit import make_fake_price_history, make_fake_prices, save_product_prices
+from webapp.products.snapshots import compact_price_snapshots, price_at, prices_at
+from webapp.pagination import InvalidCursorError, keyset_page, ranked_page
+from webapp.query_budget import query_budget
+from webapp.search import PRODUCT_SEARCH, match_query, matches
+from webapp.templating import templates
+from webapp.stores.models import Store
 
 router = APIRouter(prefix="/products", tags=["products"])
-templates = Jinja2Templates(directory="src/webapp/templates")
 
-@router.get("/", response_class=HTMLResponse)
-async def list_products(
-    request: Request,
-    session: Session = Depends(get_session),
-    q: str = "",
-    page: int = 1
-):
-    """List products with search and pagination."""
-    per_page = 100
-    offset = (page - 1) * per_page
-    
+PER_PAGE = 100
+
+# Product counts per search term, recomputed after product writes
+_totals = VersionedCache()
+
+def _product_page(session: Session, q: str, after: str, before: str):
+    """Query one page of products, the total for the search term and their best prices."""
     stmt = select(Product)
-    if q:
-        stmt = stmt.where(cast(Product.name, String).ilike(f"%{q}%"))
+    keys = [Product.name, Product.id]
+    paginate = keyset_page
+    if match := match_query(q):
+        stmt = stmt.join(PRODUCT_SEARCH, PRODUCT_SEARCH.c.rowid == Product.id).where(matches(PRODUCT_SEARCH, match))
+        keys = [PRODUCT_SEARCH.c.rank, Product.id]
+        # Ranks move as the index changes, so search results are paged by position rather than by rank
+        paginate = ranked_page
     
-    total = session.scalar(select(func.count()).select_from(stmt.subquery())) or 0
-    products = session.exec(
-        stmt.order_by(Product.name).offset(offset).limit(per_page)
-    ).all()
-    total_pages = (total + per_page - 1) // per_page
+    total = _totals.get_or_compute(
+        q, [PRODUCTS],
+        lambda: session.scalar(select(func.count()).select_from(stmt.subquery())) or 0
+    )
+    try:
+        page = paginate(session, stmt, keys, PER_PAGE, after=after, before=before)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # Get lowest prices for each product
-    product_ids = [p.id for p in products]
+    # Best current price per product, maintained on price writes
+    product_ids = [p.id for p in page.items]
+    prices_by_product = {}
     if product_ids:
         prices_stmt = (
-            select(ProductPrice)
-            .where(col(ProductPrice.product_id).in_(product_ids))
-            .order_by(asc(ProductPrice.price))
+            select(BestPrice.product_id, BestPrice.price, BestPrice.observed_at, Store.name.label("store_name"))
+            .join(Store, Store.id == BestPrice.store_id)
+            .where(col(BestPrice.product_id).in_(product_ids))
         )
-        prices = session.exec(prices_stmt).all()
-        
-        # Group by product_id, keeping lowest price
-        prices_by_product = {}
-        for price in prices:
-            if price.product_id not in prices_by_product:
-                prices_by_product[price.product_id] = price
-    else:
-        prices_by_product = {}
+        prices_by_product = {row.product_id: row for row in session.exec(prices_stmt).all()}
+    return page, total, prices_by_product
+
+@router.get("/", response_class=HTMLResponse)
+@cached_response(PRODUCTS, PRICES)
+@query_budget(3)
+async def list_products(
+    request: Request,
+    session: Session = Depends(get_session),
+    q: str = "",
+    after: str = "",
+    before: str = "",
+    job: Optional[int] = None
+):
+    """List products, by name with keyset pagination, or by search rank paged by position."""
+    page, total, prices_by_product = await run_in_db(_product_page, session, q, after, before)
     
     return templates.TemplateResponse(
         "products/list.html",
         {
             "request": request,
-            "products": products,
+            "products": page.items,
             "q": q,
-            "page": page,
-            "total_pages": total_pages,
+            "next_cursor": page.next_cursor,
+            "prev_cursor": page.prev_cursor,
             "total": total,
-            "prices": prices_by_product
+            "prices": prices_by_product,
+            "job": job
         }
     )
 
-@router.post("/fake-prices")
-async def generate_fake_prices(
-    request: Request,
+@router.get("/price-matrix", response_model=PriceMatrix)
+async def get_price_matrix(
+    session: Session = Depends(get_session),
+    category: Optional[str] = None,
+    city: Optional[str] = None,
+    state: Optional[str] = None
+) -> Response:
+    """Current prices of products in a PLU category at stores in a city."""
+    return Response(
+        content=await run_in_db(price_matrix_json, session, category=category, city=city, state=state),
+        media_type="application/json"
+    )
+
+@router.get("/{product_id}/price", response_model=PricePoint)
+async def get_price_at(
+    product_id: int,
+    store_id: int,
+    at: Optional[datetime] = None,
     session: Session = Depends(get_session)
-):
-    """Generate fake prices for products."""
-    prices = make_fake_prices(session)
-    for price in prices:
-        session.add(price)
-    session.commit()
-    return RedirectResponse(url="/products", status_code=303)
+) -> PricePoint:
+    """Price of a product at a store at a moment, from compacted snapshots."""
+    at = as_naive_utc(at) if at else datetime.utcnow()
+    snapshot = await run_in_db(price_at, session, product_id, store_id, at)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="No price known for that product, store and time")
+    return PricePoint(
+        product_id=product_id,
+        store_id=store_id,
+        at=at,
+        price=snapshot.price,
+        valid_from=snapshot.valid_from,
+        valid_until=snapshot.valid_until
+    )
 
-@router.post("/import-plu")
-async def import_plu(
+@router.post("/prices", response_model=List[PricePoint])
+async def get_prices_at(
+    lookups: List[PriceLookup],
+    session: Session = Depends(get_session)
+) -> List[PricePoint]:
+    """Batch point-in-time price lookups, answered in input order."""
+    return await run_in_db(prices_at, session, lookups)
+
+@router.post("/prices/ingest", response_model=IngestResult)
+async def ingest_prices(
     request: Request,
+    session: Session = Depends(get_session),
+    format: Optional[str] = None
+) -> IngestResult:
+    """Stream NDJSON or CSV price observations into the database in batches."""
+    try:
+        fmt = ingest_format(request.headers.get("content-type", ""), format)
+    except IngestFormatError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    # Building the ingester loads the UPC and store lookups on a cache miss
+    ingester = await run_in_db(PriceIngester, session, fmt)
+    # Lines are handed to the DB pool a batch at a time so parsing and writes stay off the loop
+    lines = []
+    async for line in aiter_lines(request.stream()):
+        lines.append(line)
+        if len(lines) >= ingester.batch_size:
+            await run_in_db(ingester.feed_all, lines)
+            lines = []
+    await run_in_db(ingester.feed_all, lines)
+    return await run_in_db(ingester.finish)
+
+@router.post("/basket", response_model=BasketQuote)
+async def price_basket(
+    basket: BasketRequest,
     session: Session = Depends(get_session)
+) -> BasketQuote:
+    """Cheapest single store and cheapest split across up to max_stores stores, marked exact once proven cheapest."""
+    return await run_in_db(
+        quote_basket, session, basket.items, max_stores=basket.max_stores, city=basket.city, state=basket.state,
+        exact=basket.exact
+    )
+
+def _fake_prices_job(days: int, seed: Optional[int]):
+    """Job body generating fake current prices, or days of price history."""
+    def run(session: Session) -> str:
+        if days > 0:
+            return f"Generated {make_fake_price_history(session, days, seed=seed)} price observations"
+        prices = make_fake_prices(session)
+        save_product_prices(session, prices)
+        return f"Generated {len(prices)} prices"
+    return run
+
+@router.post("/fake-prices")
+async def generate_fake_prices(
+    request: Request,
+    days: int = 0,
+    seed: Optional[int] = None
 ) -> RedirectResponse:
-    """Import PLU commodities from default CSV."""
-    try:
-        commodities = import_plu_commodities(session)
-        request.session["flash"] = [{"type": "success", "text": f"Successfully imported {len(commodities)} PLU commodities"}]
-    except Exception as e:
-        request.session["flash"] = [{"type": "error", "text": f"Failed to import PLU commodities: {str(e)}"}]
-    return RedirectResponse(url="/products", status_code=303)
+    """Start a background job generating fake prices for products, or days of price history."""
+    job_id = await run_in_db(submit_job, "fake-prices", _fake_prices_job(days, seed))
+    request.session["flash"] = [{"type": "success", "text": f"Started fake price generation (job #{job_id})"}]
+    return RedirectResponse(url=f"/products?job={job_id}", status_code=303)
 
-@router.post("/import-plu-products")
-async def import_plu_products(
+@router.post("/compact-prices")
+async def compact_prices(
     request: Request,
-    session: Session = Depends(get_session)
+    session: Session = Depends(get_session),
+    rebuild: bool = False
 ) -> RedirectResponse:
-    """Convert all PLU commodities to products."""
+    """Compact new price observations into snapshots."""
     try:
-        products = import_all_plu_to_products(session)
-        request.session["flash"] = [{"type": "success", "text": f"Successfully converted {len(products)} PLUs to products"}]
+        result = await run_in_db(compact_price_snapshots, session, rebuild=rebuild)
+        request.session["flash"] = [{
+            "type": "success",
+            "text": f"Compacted {result.observations} price observations: "
+                    f"{result.snapshots_opened} snapshots opened, {result.snapshots_closed} closed"
+        }]
     except Exception as e:
-        request.session["flash"] = [{"type": "error", "text": f"Failed to convert PLUs to products: {str(e)}"}]
+        request.session["flash"] = [{"type": "error", "text": f"Failed to compact prices: {str(e)}"}]
     return RedirectResponse(url="/products", status_code=303)
+
+def _import_plu_job(session: Session) -> str:
+    """Job body for the PLU commodity import."""
+    result = import_plu_commodities(session)
+    return (f"Imported PLU commodities: {result.inserted} new, "
+            f"{result.updated} updated, {result.unchanged} unchanged")
+
+def _import_plu_products_job(session: Session) -> str:
+    """Job body converting PLU commodities to products."""
+    result = import_all_plu_to_products(session)
+    return f"Converted {result.inserted} PLUs to products ({result.unchanged} already existed)"
+
+@router.post("/import-plu")
+async def import_plu(request: Request) -> RedirectResponse:
+    """Start a background import of PLU commodities from the default CSV."""
+    job_id = await run_in_db(submit_job, "import-plu", _import_plu_job)
+    request.session["flash"] = [{"type": "success", "text": f"Started PLU commodity import (job #{job_id})"}]
+    return RedirectResponse(url=f"/products?job={job_id}", status_code=303)
+
+@router.post("/import-plu-products")
+async def import_plu_products(request: Request) -> RedirectResponse:
+    """Start a background conversion of all PLU commodities to products."""
+    job_id = await run_in_db(submit_job, "import-plu-products", _import_plu_products_job)
+    request.session["flash"] = [{"type": "success", "text": f"Started PLU to product conversion (job #{job_id})"}]
+    return RedirectResponse(url=f"/products?job={job_id}", status_code=303)
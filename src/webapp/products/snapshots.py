@@ -0,0 +1,349 @@
+"""Compaction of raw ProductPrice observations into ProductPriceSnapshot runs,
+and point-in-time price lookups against those runs."""
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from itertools import groupby
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import DateTime, Integer, bindparam, column, delete, func, table, text, tuple_, update
+from sqlmodel import Session, select
+
+from webapp.cache import PRICES, bump_data_version
+from webapp.database import DEFAULT_BATCH_SIZE, batched
+from webapp.products.models import PriceLookup, PricePoint, ProductPrice, ProductPriceSnapshot, SnapshotWatermark
+from webapp.writer import write
+
+# valid_until of the open snapshot holding a store's current price
+OPEN_ENDED = datetime(9999, 12, 31, 23, 59, 59)
+
+# Observations read per compaction transaction
+COMPACTION_BATCH_SIZE = 10000
+
+# Lookups staged per round trip by prices_at
+LOOKUP_BATCH_SIZE = 50000
+
+# Connection-local staging table for batch lookups
+_LOOKUPS = table(
+    "price_lookup",
+    column("seq", Integer),
+    column("product_id", Integer),
+    column("store_id", Integer),
+    column("at", DateTime),
+)
+_CREATE_LOOKUPS = text(
+    "CREATE TEMP TABLE IF NOT EXISTS price_lookup "
+    "(seq INTEGER PRIMARY KEY, product_id INTEGER, store_id INTEGER, at DATETIME)"
+)
+
+Key = Tuple[int, int]
+
+
+@dataclass
+class CompactionResult:
+    """Counts reported by compact_price_snapshots."""
+    
+    observations: int = 0
+    snapshots_opened: int = 0
+    snapshots_closed: int = 0
+    keys_rebuilt: int = 0
+
+
+@dataclass
+class _OpenRun:
+    """The latest snapshot of a (product, store) while compacting."""
+    
+    price: Decimal
+    valid_from: datetime
+    snapshot_id: Optional[int] = None
+    pending: Optional[dict] = None
+    # Newest observation already folded into the key's snapshots
+    newest: Optional[datetime] = None
+    
+    @property
+    def compacted_until(self) -> datetime:
+        """Observations before this moment have already been compacted."""
+        return max(self.valid_from, self.newest or self.valid_from)
+
+
+def compact_price_snapshots(
+    session: Session,
+    rebuild: bool = False,
+    batch_size: int = COMPACTION_BATCH_SIZE
+) -> CompactionResult:
+    """Run-length encode price observations into snapshots.
+    
+    Consecutive equal prices for a (product, store) collapse into one
+    snapshot valid from the first observation until the next different
+    price; the latest snapshot stays open until OPEN_ENDED. Only
+    observations above the stored watermark are read, in id order, one
+    group-commit writer batch each. An observation older than the newest one already
+    compacted for its (product, store) arrived late, even if it falls inside
+    the open run, so that key is rebuilt from its full history.
+    
+    Args:
+        session: Database session
+        rebuild: Drop all snapshots and recompact every observation
+        batch_size: Observations processed per transaction
+        
+    Returns:
+        Counts of observations read and snapshots written
+    """
+    result = CompactionResult()
+    
+    def reset(session: Session) -> None:
+        session.exec(delete(ProductPriceSnapshot))  # type: ignore
+        watermark = session.exec(select(SnapshotWatermark)).first() or SnapshotWatermark()
+        watermark.last_price_id = 0
+        session.add(watermark)
+    
+    def compact_next_batch(session: Session) -> int:
+        watermark = session.exec(select(SnapshotWatermark)).first() or SnapshotWatermark()
+        observations = session.exec(
+            select(ProductPrice.id, ProductPrice.product_id, ProductPrice.store_id, ProductPrice.price, ProductPrice.observed_at)
+            .where(ProductPrice.id > watermark.last_price_id)  # type: ignore
+            .order_by(ProductPrice.id)
+            .limit(batch_size)
+        ).all()
+        if not observations:
+            return 0
+        _compact_batch(session, observations, watermark.last_price_id, result)
+        watermark.last_price_id = observations[-1][0]
+        watermark.updated_at = datetime.utcnow()
+        session.add(watermark)
+        return len(observations)
+    
+    if rebuild:
+        write(session, reset)
+    while compacted := write(session, compact_next_batch):
+        result.observations += compacted
+    
+    bump_data_version(PRICES)
+    return result
+
+
+def _compact_batch(
+    session: Session,
+    observations: List[tuple],
+    last_price_id: int,
+    result: CompactionResult
+) -> None:
+    """Fold one id-ordered batch of observations, all above last_price_id, into the snapshot table."""
+    by_key = sorted(observations, key=lambda row: (row[1], row[2], row[4], row[0]))
+    runs = _open_runs(session, list({(row[1], row[2]) for row in observations}), last_price_id)
+    late: Set[Key] = set()
+    closes: Dict[int, datetime] = {}
+    opens: List[dict] = []
+    
+    for key, rows in groupby(by_key, key=lambda row: (row[1], row[2])):
+        run = runs.get(key)
+        for _, product_id, store_id, price, observed_at in rows:
+            if run is not None and observed_at < run.compacted_until:
+                late.add(key)
+                break
+            if run is not None and price == run.price:
+                continue
+            if run is not None:
+                if run.pending is not None:
+                    run.pending["valid_until"] = observed_at
+                else:
+                    closes[run.snapshot_id] = observed_at  # type: ignore
+            pending = {
+                "product_id": product_id,
+                "store_id": store_id,
+                "price": price,
+                "valid_from": observed_at,
+                "valid_until": OPEN_ENDED,
+                "created_at": datetime.utcnow(),
+            }
+            opens.append(pending)
+            run = _OpenRun(price=price, valid_from=observed_at, pending=pending)
+    
+    opens = [row for row in opens if (row["product_id"], row["store_id"]) not in late]
+    late_ids = {runs[key].snapshot_id for key in late if key in runs}
+    closes = {snapshot_id: until for snapshot_id, until in closes.items() if snapshot_id not in late_ids}
+    
+    if closes:
+        session.connection().execute(
+            update(ProductPriceSnapshot.__table__)  # type: ignore
+            .where(ProductPriceSnapshot.__table__.c.id == bindparam("snapshot_id"))  # type: ignore
+            .values(valid_until=bindparam("until")),
+            [{"snapshot_id": snapshot_id, "until": until} for snapshot_id, until in closes.items()]
+        )
+    if opens:
+        session.connection().execute(ProductPriceSnapshot.__table__.insert(), opens)  # type: ignore
+    for key in late:
+        rebuild_key(session, key)
+    
+    result.snapshots_closed += len(closes)
+    result.snapshots_opened += len(opens)
+    result.keys_rebuilt += len(late)
+
+
+def _open_runs(session: Session, keys: List[Key], last_price_id: int) -> Dict[Key, _OpenRun]:
+    """Latest snapshot and newest compacted observation per (product, store) for the given keys."""
+    runs = {}
+    for batch in batched(keys, DEFAULT_BATCH_SIZE // 4):
+        newest = dict(
+            ((product_id, store_id), observed_at)
+            for product_id, store_id, observed_at in session.exec(
+                select(ProductPrice.product_id, ProductPrice.store_id, func.max(ProductPrice.observed_at))
+                .where(
+                    tuple_(ProductPrice.product_id, ProductPrice.store_id).in_(batch),  # type: ignore
+                    ProductPrice.id <= last_price_id  # type: ignore
+                )
+                .group_by(ProductPrice.product_id, ProductPrice.store_id)
+            )
+        )
+        latest = (
+            select(
+                ProductPriceSnapshot.product_id,
+                ProductPriceSnapshot.store_id,
+                func.max(ProductPriceSnapshot.valid_from).label("valid_from")
+            )
+            .where(tuple_(ProductPriceSnapshot.product_id, ProductPriceSnapshot.store_id).in_(batch))  # type: ignore
+            .group_by(ProductPriceSnapshot.product_id, ProductPriceSnapshot.store_id)
+            .subquery()
+        )
+        rows = session.exec(
+            select(ProductPriceSnapshot).join(
+                latest,
+                (ProductPriceSnapshot.product_id == latest.c.product_id)
+                & (ProductPriceSnapshot.store_id == latest.c.store_id)
+                & (ProductPriceSnapshot.valid_from == latest.c.valid_from)
+            )
+        ).all()
+        runs.update({
+            (snapshot.product_id, snapshot.store_id): _OpenRun(
+                price=snapshot.price,
+                valid_from=snapshot.valid_from,
+                snapshot_id=snapshot.id,
+                newest=newest.get((snapshot.product_id, snapshot.store_id))
+            )
+            for snapshot in rows
+        })
+    return runs
+
+
+def rebuild_key(session: Session, key: Key) -> None:
+    """Recompute every snapshot of one (product, store) from its observations."""
+    product_id, store_id = key
+    session.exec(delete(ProductPriceSnapshot).where(  # type: ignore
+        ProductPriceSnapshot.product_id == product_id,  # type: ignore
+        ProductPriceSnapshot.store_id == store_id  # type: ignore
+    ))
+    observations = session.exec(
+        select(ProductPrice.price, ProductPrice.observed_at)
+        .where(ProductPrice.product_id == product_id, ProductPrice.store_id == store_id)
+        .order_by(ProductPrice.observed_at, ProductPrice.id)
+    ).all()
+    snapshots = []
+    for price, observed_at in observations:
+        if snapshots and snapshots[-1]["price"] == price:
+            continue
+        if snapshots:
+            snapshots[-1]["valid_until"] = observed_at
+        snapshots.append({
+            "product_id": product_id,
+            "store_id": store_id,
+            "price": price,
+            "valid_from": observed_at,
+            "valid_until": OPEN_ENDED,
+            "created_at": datetime.utcnow(),
+        })
+    if snapshots:
+        session.connection().execute(ProductPriceSnapshot.__table__.insert(), snapshots)  # type: ignore
+
+
+def price_at(session: Session, product_id: int, store_id: int, at: datetime) -> Optional[ProductPriceSnapshot]:
+    """Snapshot holding a product's price at a store at a moment.
+    
+    Seeks the (product_id, store_id, valid_from) index to the last run
+    starting at or before `at`; runs are contiguous, so that is the only
+    candidate. Observations newer than the compaction watermark are not
+    visible until compact_price_snapshots runs.
+    
+    Args:
+        session: Database session
+        product_id: Product to price
+        store_id: Store the price was observed at
+        at: Moment to price at
+        
+    Returns:
+        The covering snapshot, or None if no price was known at that moment
+    """
+    snapshot = session.exec(
+        select(ProductPriceSnapshot)
+        .where(
+            ProductPriceSnapshot.product_id == product_id,
+            ProductPriceSnapshot.store_id == store_id,
+            ProductPriceSnapshot.valid_from <= at
+        )
+        .order_by(ProductPriceSnapshot.valid_from.desc())  # type: ignore
+        .limit(1)
+    ).first()
+    if snapshot is None or snapshot.valid_until <= at:
+        return None
+    return snapshot
+
+
+def prices_at(
+    session: Session,
+    lookups: Iterable[PriceLookup],
+    batch_size: int = LOOKUP_BATCH_SIZE
+) -> List[PricePoint]:
+    """Answer many point-in-time lookups in a few statements.
+    
+    Lookups are staged in a temporary table and resolved with one
+    correlated index seek each, the same seek price_at issues, so a batch
+    costs one round trip instead of one query per lookup.
+    
+    Args:
+        session: Database session
+        lookups: Product, store and moment to price, in any order
+        batch_size: Lookups staged per statement
+        
+    Returns:
+        One PricePoint per lookup, in input order
+    """
+    snapshots = ProductPriceSnapshot.__table__  # type: ignore
+    covering = (
+        select(snapshots.c.id)
+        .where(
+            snapshots.c.product_id == _LOOKUPS.c.product_id,
+            snapshots.c.store_id == _LOOKUPS.c.store_id,
+            snapshots.c.valid_from <= _LOOKUPS.c.at
+        )
+        .order_by(snapshots.c.valid_from.desc())
+        .limit(1)
+        .correlate(_LOOKUPS)
+        .scalar_subquery()
+    )
+    stmt = (
+        select(_LOOKUPS.c.seq, snapshots.c.price, snapshots.c.valid_from, snapshots.c.valid_until)
+        .select_from(_LOOKUPS.outerjoin(
+            snapshots, (snapshots.c.id == covering) & (snapshots.c.valid_until > _LOOKUPS.c.at)
+        ))
+        .order_by(_LOOKUPS.c.seq)
+    )
+    
+    connection = session.connection()
+    connection.execute(_CREATE_LOOKUPS)
+    points = []
+    for batch in batched(lookups, batch_size):
+        connection.execute(_LOOKUPS.delete())
+        connection.execute(_LOOKUPS.insert(), [
+            {"seq": seq, "product_id": lookup.product_id, "store_id": lookup.store_id, "at": lookup.at}
+            for seq, lookup in enumerate(batch)
+        ])
+        for lookup, row in zip(batch, connection.execute(stmt)):
+            points.append(PricePoint(
+                product_id=lookup.product_id,
+                store_id=lookup.store_id,
+                at=lookup.at,
+                price=row.price,
+                valid_from=row.valid_from,
+                valid_until=row.valid_until
+            ))
+    connection.execute(_LOOKUPS.delete())
+    return points
@@ -0,0 +1,248 @@
+"""Query budgets and N+1 detection.
+
+Code declares how many SQL statements it may run, as a decorator on sync or
+async functions or as a context manager:
+
+    @query_budget(2)
+    def upsert_stores(session, rows): ...
+
+    with query_budget(max_queries=10, max_repeats=3):
+        ...
+
+Every statement run inside the budget, including on the DB pool through
+run_in_db, is counted by shape. Transaction control statements such as
+BEGIN and SAVEPOINT are not counted. A statement's shape is its SQL with
+whitespace and expanded parameter lists collapsed. Exceeding the budget,
+or running one shape more than max_repeats times (the signature of an N+1
+loop), is a violation and is reported with the first code location that
+ran each offending shape.
+
+QueryBudgetMiddleware puts every request under REQUEST_QUERY_BUDGET.
+QUERY_BUDGET_MODE picks what a violation does: "log" (the default) logs a
+warning, "raise" raises QueryBudgetExceededError (the test suite's mode) and
+"off" stops counting.
+"""
+import functools
+import inspect
+import logging
+import os
+import re
+import sys
+import threading
+from contextvars import ContextVar, Token
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+from sqlalchemy import Engine, event
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable)
+
+# What a budget violation does, set with QUERY_BUDGET_MODE
+OFF = "off"
+LOG = "log"
+RAISE = "raise"
+QUERY_BUDGET_MODES = (OFF, LOG, RAISE)
+
+# Times one statement shape may run inside a budget before it is reported as N+1
+DEFAULT_MAX_REPEATS = 10
+
+# Statements any single request may run
+REQUEST_QUERY_BUDGET = int(os.getenv("REQUEST_QUERY_BUDGET", "25"))
+
+# Shapes listed when a budget's total is exceeded
+REPORTED_SHAPES = 5
+
+_WEBAPP_DIR = str(Path(__file__).parent)
+
+_PARAMETER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_VALUES_LIST = re.compile(r"(\([^()]*\))(?:\s*,\s*\1)+")
+_WHITESPACE = re.compile(r"\s+")
+
+# Transaction control the caller did not ask for, e.g. savepoints opened by the writer
+_TRANSACTION_CONTROL = re.compile(r"^\s*(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE)\b", re.IGNORECASE)
+
+
+class UnknownQueryBudgetModeError(ValueError):
+    """Raised when QUERY_BUDGET_MODE is not one of QUERY_BUDGET_MODES."""
+    
+    def __init__(self, mode: str):
+        self.mode = mode
+        super().__init__(f"Unknown query budget mode: {mode}. Expected one of {', '.join(QUERY_BUDGET_MODES)}")
+
+
+class QueryBudgetExceededError(RuntimeError):
+    """Raised in raise mode when code runs more queries than it budgeted for."""
+    
+    def __init__(self, name: str, violations: List[str]):
+        self.name = name
+        self.violations = violations
+        super().__init__(f"Query budget exceeded in {name}:\n" + "\n".join(violations))
+
+
+class QueryBudget:
+    """Counts the statements run while active and checks them against a budget."""
+    
+    def __init__(
+        self,
+        max_queries: Optional[int] = None,
+        max_repeats: Optional[int] = DEFAULT_MAX_REPEATS,
+        name: str = "query budget"
+    ):
+        self.max_queries = max_queries
+        self.max_repeats = max_repeats
+        self.name = name
+        self.queries = 0
+        # Statement shape -> [times run, first location that ran it]
+        self.shapes: Dict[str, List] = {}
+        self._lock = threading.Lock()
+        self._token: Optional[Token] = None
+    
+    def __enter__(self) -> "QueryBudget":
+        if _budget_mode() != OFF:
+            self._token = _active_budgets.set(_active_budgets.get() + (self,))
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self._token is None:
+            return
+        _active_budgets.reset(self._token)
+        self._token = None
+        # Let the original error surface rather than a budget report
+        if exc_type is None:
+            self.check()
+    
+    def __call__(self, func: F) -> F:
+        """Decorate a function so each call runs under a fresh copy of this budget."""
+        name = f"{func.__module__}.{func.__qualname__}"
+        
+        def fresh() -> "QueryBudget":
+            return QueryBudget(self.max_queries, self.max_repeats, name=name)
+        
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with fresh():
+                    return await func(*args, **kwargs)
+            return async_wrapper  # type: ignore
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with fresh():
+                return func(*args, **kwargs)
+        return wrapper  # type: ignore
+    
+    def record(self, shape: str) -> None:
+        """Count one statement, remembering where its shape first ran."""
+        with self._lock:
+            self.queries += 1
+            seen = self.shapes.get(shape)
+            if seen is None:
+                self.shapes[shape] = [1, _caller_location()]
+            else:
+                seen[0] += 1
+    
+    def violations(self) -> List[str]:
+        """Descriptions of everything over budget, empty if within it."""
+        found = []
+        by_count = sorted(self.shapes.items(), key=lambda item: item[1][0], reverse=True)
+        if self.max_queries is not None and self.queries > self.max_queries:
+            found.append(f"ran {self.queries} queries, budget is {self.max_queries}")
+            found.extend(
+                f"  {count}x at {location}: {shape}" for shape, (count, location) in by_count[:REPORTED_SHAPES]
+            )
+        if self.max_repeats is not None:
+            found.extend(
+                f"possible N+1: {count}x at {location}: {shape}"
+                for shape, (count, location) in by_count if count > self.max_repeats
+            )
+        return found
+    
+    def check(self) -> None:
+        """Report violations according to QUERY_BUDGET_MODE.
+        
+        Raises:
+            QueryBudgetExceededError: In raise mode, if the budget was exceeded
+        """
+        violations = self.violations()
+        if not violations:
+            return
+        if _budget_mode() == RAISE:
+            raise QueryBudgetExceededError(self.name, violations)
+        logger.warning(f"Query budget exceeded in {self.name}:\n" + "\n".join(violations))
+
+
+def query_budget(
+    max_queries: Optional[int] = None,
+    max_repeats: Optional[int] = DEFAULT_MAX_REPEATS,
+    name: str = "query budget"
+) -> QueryBudget:
+    """A query budget, used as a decorator or a context manager.
+    
+    Args:
+        max_queries: Most statements allowed, None for no limit
+        max_repeats: Most times any one statement shape may run, None for no limit
+        name: What to call the budget in reports; decorators use the function name
+    
+    Returns:
+        The budget, counting once entered
+    """
+    return QueryBudget(max_queries, max_repeats, name)
+
+
+_active_budgets: ContextVar[Tuple[QueryBudget, ...]] = ContextVar("active_budgets", default=())
+
+
+def _budget_mode() -> str:
+    mode = os.getenv("QUERY_BUDGET_MODE", LOG)
+    if mode not in QUERY_BUDGET_MODES:
+        raise UnknownQueryBudgetModeError(mode)
+    return mode
+
+
+def statement_shape(statement: str) -> str:
+    """SQL with whitespace and parameter lists collapsed, so only varying values differ."""
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    shape = _PARAMETER_LIST.sub("?, ...", shape)
+    return _VALUES_LIST.sub(r"\1, ...", shape)
+
+
+def _caller_location() -> str:
+    """Innermost application frame outside this module, as path:line in function."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_WEBAPP_DIR) and filename != __file__:
+            path = Path(filename).relative_to(Path(_WEBAPP_DIR).parent)
+            return f"{path}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "<unknown>"
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany) -> None:
+    budgets = _active_budgets.get()
+    if not budgets or _TRANSACTION_CONTROL.match(statement):
+        return
+    shape = statement_shape(statement)
+    for budget in budgets:
+        budget.record(shape)
+
+
+class QueryBudgetMiddleware:
+    """ASGI middleware putting every HTTP request under REQUEST_QUERY_BUDGET."""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        budget = query_budget(REQUEST_QUERY_BUDGET, name=f"{scope['method']} {scope['path']}")
+        with budget:
+            await self.app(scope, receive, send)
+            if route := scope.get("route"):
+                budget.name = f"{scope['method']} {route.path}"
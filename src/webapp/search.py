@@ -0,0 +1,128 @@
+"""SQLite FTS5 full-text search over products and stores.
+
+product_search indexes Product.name/brand together with the commodity,
+variety, aka and botanical name of the PLU sharing the product's UPC.
+store_search is an external-content index over Store.name/address/city.
+Both are kept in sync by triggers, so every write path, including bulk
+INSERT ... SELECT and ON CONFLICT upserts, updates them.
+
+The DDL is attached to the tables' after_create events, so
+SQLModel.metadata.create_all builds the indexes for fresh databases.
+"""
+import re
+from typing import List, Optional
+
+from sqlalchemy import DDL, ColumnElement, Engine, column, event, literal_column, table
+
+from webapp.products.models import PluCommodity, Product
+from webapp.stores.models import Store
+
+PRODUCT_SEARCH = table("product_search", column("rowid"), column("rank"))
+STORE_SEARCH = table("store_search", column("rowid"), column("rank"))
+
+# Columns of product_search rows, built from a product p and its PLU c
+_PRODUCT_DOCUMENT = "p.id, p.name, p.brand, c.commodity, c.variety, c.aka, c.botanical"
+_PRODUCT_SOURCE = "product p LEFT JOIN plucommodity c ON c.plu = p.upc"
+
+PRODUCT_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5("
+    "name, brand, commodity, variety, aka, botanical, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    # Rank name matches above brand and PLU attributes
+    "INSERT INTO product_search (product_search, rank) "
+    "VALUES ('rank', 'bm25(10.0, 5.0, 2.0, 2.0, 1.0, 1.0)')",
+    "CREATE TRIGGER IF NOT EXISTS product_search_ai AFTER INSERT ON product BEGIN "
+    f"INSERT INTO product_search (rowid, name, brand, commodity, variety, aka, botanical) "
+    f"SELECT {_PRODUCT_DOCUMENT} FROM {_PRODUCT_SOURCE} WHERE p.id = new.id; END",
+    "CREATE TRIGGER IF NOT EXISTS product_search_au AFTER UPDATE ON product BEGIN "
+    "DELETE FROM product_search WHERE rowid = old.id; "
+    f"INSERT INTO product_search (rowid, name, brand, commodity, variety, aka, botanical) "
+    f"SELECT {_PRODUCT_DOCUMENT} FROM {_PRODUCT_SOURCE} WHERE p.id = new.id; END",
+    "CREATE TRIGGER IF NOT EXISTS product_search_ad AFTER DELETE ON product BEGIN "
+    "DELETE FROM product_search WHERE rowid = old.id; END",
+]
+
+PLU_SEARCH_DDL = [
+    f"CREATE TRIGGER IF NOT EXISTS product_search_plu_{event_name} AFTER {operation} ON plucommodity BEGIN "
+    f"DELETE FROM product_search WHERE rowid IN "
+    f"(SELECT id FROM product WHERE upc IN ({affected})); "
+    f"INSERT INTO product_search (rowid, name, brand, commodity, variety, aka, botanical) "
+    f"SELECT {_PRODUCT_DOCUMENT} FROM {_PRODUCT_SOURCE} WHERE p.upc IN ({affected}); END"
+    for event_name, operation, affected in [
+        ("ai", "INSERT", "new.plu"),
+        ("au", "UPDATE", "old.plu, new.plu"),
+        ("ad", "DELETE", "old.plu"),
+    ]
+]
+
+STORE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS store_search USING fts5("
+    "name, address, city, content = 'store', content_rowid = 'id', "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    "INSERT INTO store_search (store_search, rank) VALUES ('rank', 'bm25(10.0, 2.0, 1.0)')",
+    "CREATE TRIGGER IF NOT EXISTS store_search_ai AFTER INSERT ON store BEGIN "
+    "INSERT INTO store_search (rowid, name, address, city) "
+    "VALUES (new.id, new.name, new.address, new.city); END",
+    "CREATE TRIGGER IF NOT EXISTS store_search_au AFTER UPDATE ON store BEGIN "
+    "INSERT INTO store_search (store_search, rowid, name, address, city) "
+    "VALUES ('delete', old.id, old.name, old.address, old.city); "
+    "INSERT INTO store_search (rowid, name, address, city) "
+    "VALUES (new.id, new.name, new.address, new.city); END",
+    "CREATE TRIGGER IF NOT EXISTS store_search_ad AFTER DELETE ON store BEGIN "
+    "INSERT INTO store_search (store_search, rowid, name, address, city) "
+    "VALUES ('delete', old.id, old.name, old.address, old.city); END",
+]
+
+for _table, _statements in [
+    (Product.__table__, PRODUCT_SEARCH_DDL),  # type: ignore
+    (PluCommodity.__table__, PLU_SEARCH_DDL),  # type: ignore
+    (Store.__table__, STORE_SEARCH_DDL),  # type: ignore
+]:
+    for _statement in _statements:
+        event.listen(_table, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+
+
+def create_search_index(engine: Engine) -> None:
+    """Create the search tables and triggers if missing.
+    
+    Indexes that did not exist yet are populated from existing rows.
+    """
+    with engine.begin() as conn:
+        existing = set(conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE name IN ('product_search', 'store_search')"
+        ).scalars())
+        for statement in PRODUCT_SEARCH_DDL + PLU_SEARCH_DDL + STORE_SEARCH_DDL:
+            conn.exec_driver_sql(statement)
+    if existing != {"product_search", "store_search"}:
+        rebuild_search_index(engine)
+
+
+def rebuild_search_index(engine: Engine) -> None:
+    """Repopulate both search indexes from their source tables."""
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DELETE FROM product_search")
+        conn.exec_driver_sql(
+            f"INSERT INTO product_search (rowid, name, brand, commodity, variety, aka, botanical) "
+            f"SELECT {_PRODUCT_DOCUMENT} FROM {_PRODUCT_SOURCE}"
+        )
+        conn.exec_driver_sql("INSERT INTO store_search (store_search) VALUES ('rebuild')")
+
+
+def match_query(q: str) -> Optional[str]:
+    """Turn user input into an FTS5 query matching every word as a prefix.
+    
+    Args:
+        q: Raw search box text
+        
+    Returns:
+        FTS5 MATCH expression, or None if q has no searchable words
+    """
+    words: List[str] = re.findall(r"\w+", q)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def matches(index, query: str) -> ColumnElement:
+    """WHERE clause restricting a join with a search index to query matches."""
+    return literal_column(index.name).op("MATCH")(query)
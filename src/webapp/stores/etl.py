@@ -1,13 +1,39 @@
 """Store ETL functions for importing data from various sources."""
 import csv
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
 from datetime import datetime, UTC
+from itertools import islice
 from pathlib import Path
-from typing import Iterator, List
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set
 
+from sqlalchemy import func, or_, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlmodel import Session, select
 
-from webapp.database import engine
+from webapp.cache import STORES, bump_data_version
+from webapp.database import DEFAULT_BATCH_SIZE, UpsertResult, batched, engine
+from webapp.files import open_csv
+from webapp.imports.ledger import ImportLedger
+from webapp.jobs.runner import report_progress
+from webapp.query_budget import query_budget
 from webapp.stores.models import Store
+from webapp.writer import write
+
+# Import ledger feed for store files
+STORE_FEED = "stores"
+
+# Files picked up by import_store_directory
+STORE_FILE_PATTERNS = ("*.csv", "*.csv.gz")
+
+# Columns refreshed when an imported store matches an existing one
+STORE_UPDATE_FIELDS = ("city", "state", "zip_code")
+
+
+class UnknownStoreFormatError(ValueError):
+    def __init__(self, format: str):
+        super().__init__(f"Unknown store import format: {format}")
 
 
 def load_chattanooga_stores_from_csv(csv_path: Path) -> Iterator[Store]:
@@ -19,20 +45,32 @@ def load_chattanooga_stores_from_csv(csv_path: Path) -> Iterator[Store]:
     Yields:
         Store models
     """
-    with open(csv_path) as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            address_parts = row["address"].split(",")
-            yield Store(
-                name=row["name"],
-                address=address_parts[0].strip(),
-                city=row["city"].split(",")[0].strip(),
-                state=row["state"],
-                zip_code=row["zip_code"] if row["zip_code"] else None,
-                phone=row["phone"],
-                rating=float(row["rating"]) if row["rating"] else None,
-                is_active=row["is_active"].lower() == "true"
-            )
+    return convert_chattanooga_stores_to_store(iter_store_rows_from_csv(csv_path))
+
+
+def convert_chattanooga_stores_to_store(rows: Iterable[dict]) -> Iterator[Store]:
+    """Convert Chattanooga store export rows to Store models.
+    
+    The export's phone and rating columns have no Store field and are not
+    imported. A blank zip_code is taken from the full address.
+    
+    Args:
+        rows: Store dicts from the Chattanooga export
+        
+    Yields:
+        Store models
+    """
+    for row in rows:
+        address_parts = row["address"].split(",")
+        state_zip = address_parts[-2].split() if len(address_parts) > 2 else []  # ['TN', '37405']
+        yield Store(
+            name=row["name"],
+            address=address_parts[0].strip(),
+            city=row["city"].split(",")[0].strip(),
+            state=row["state"],
+            zip_code=row["zip_code"] or (state_zip[1][:5] if len(state_zip) > 1 else ""),
+            is_active=row["is_active"].lower() == "true"
+        )
 
 
 def load_gmaps_stores_from_csv(csv_path: Path) -> List[dict]:
@@ -44,19 +82,30 @@ def load_gmaps_stores_from_csv(csv_path: Path) -> List[dict]:
     Returns:
         List of store records as dicts
     """
-    stores = []
-    with open(csv_path) as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            stores.append(row)
-    return stores
+    return list(iter_store_rows_from_csv(csv_path))
+
 
+def iter_store_rows_from_csv(csv_path: Path) -> Iterator[dict]:
+    """Stream store records from a CSV export.
+    
+    Only the current row is held in memory; gzip-compressed files are
+    decompressed on the fly.
+    
+    Args:
+        csv_path: Path to plain or gzip-compressed CSV file
+        
+    Yields:
+        Store records as dicts
+    """
+    with open_csv(csv_path) as f:
+        yield from csv.DictReader(f)
 
-def convert_gmaps_stores_to_store(gmaps_stores: List[dict]) -> Iterator[Store]:
+
+def convert_gmaps_stores_to_store(gmaps_stores: Iterable[dict]) -> Iterator[Store]:
     """Convert Google Maps store format to Store models.
     
     Args:
-        gmaps_stores: List of store dicts from Google Maps export
+        gmaps_stores: Store dicts from Google Maps export
         
     Yields:
         Store models
@@ -77,41 +126,264 @@ def convert_gmaps_stores_to_store(gmaps_stores: List[dict]) -> Iterator[Store]:
         )
 
 
-def import_chattanooga_stores(csv_path: Path) -> None:
+def import_stores(
+    csv_path: Path,
+    format: str = "gmaps",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    force: bool = False
+) -> UpsertResult:
+    """Import stores from a CSV file as a streaming pipeline.
+    
+    Parsing and conversion are lazy generators pulled by the batch writer,
+    so at most one batch of stores is in memory regardless of file size.
+    The import ledger short-circuits files identical to the last import and
+    otherwise skips rows whose fingerprint has not changed.
+    
+    Args:
+        csv_path: Path to plain or gzip-compressed CSV file
+        format: Source layout, one of STORE_FORMATS
+        batch_size: Number of stores written per write batch
+        force: Re-import every row even if the ledger has seen it
+        
+    Returns:
+        Counts of inserted, updated and unchanged stores
+        
+    Raises:
+        UnknownStoreFormatError: If format is not a known layout
+    """
+    converter = STORE_FORMATS.get(format)
+    if converter is None:
+        raise UnknownStoreFormatError(format)
+    
+    with Session(engine) as session:
+        ledger = ImportLedger(session, STORE_FEED, csv_path)
+        if not force and ledger.unchanged():
+            last = ledger.last_import()
+            return UpsertResult(unchanged=last.row_count if last else 0)
+        
+        rows = ledger.changed_rows(
+            iter_store_rows_from_csv(csv_path), key=_store_row_key, batch_size=batch_size, force=force
+        )
+        result = save_stores_to_db(converter(rows), batch_size=batch_size)
+        result.unchanged += ledger.rows_skipped
+        ledger.commit()
+    return result
+
+
+def import_chattanooga_stores(csv_path: Path, force: bool = False) -> UpsertResult:
     """Import Chattanooga stores from Google Maps CSV export.
     
     Args:
         csv_path: Path to CSV file
+        force: Re-import every row even if the ledger has seen it
+        
+    Returns:
+        Counts of inserted, updated and unchanged stores
     """
-    stores = load_gmaps_stores_from_csv(csv_path)
-    store_models = convert_gmaps_stores_to_store(stores)
-    save_stores_to_db(store_models)
+    return import_stores(csv_path, format="gmaps", force=force)
+
+
+# Store CSV layouts understood by import_stores, as row converters
+STORE_FORMATS: Dict[str, Callable[[Iterable[dict]], Iterator[Store]]] = {
+    "gmaps": convert_gmaps_stores_to_store,
+    "chattanooga": convert_chattanooga_stores_to_store,
+}
 
 
-def save_stores_to_db(stores: Iterator[Store]) -> None:
+def save_stores_to_db(
+    stores: Iterable[Store],
+    batch_size: int = DEFAULT_BATCH_SIZE
+) -> UpsertResult:
     """Save stores to database, updating existing records if found.
     
+    Stores are matched on (name, address) and written in batches with
+    INSERT ... ON CONFLICT DO UPDATE, one writer batch each.
+    
     Args:
         stores: Iterator of Store models to save
+        batch_size: Number of stores written per write batch
+        
+    Returns:
+        Counts of inserted, updated and unchanged stores
+    """
+    return save_store_rows((_store_to_row(store) for store in stores), batch_size=batch_size)
+
+
+def save_store_rows(
+    rows: Iterable[dict],
+    batch_size: int = DEFAULT_BATCH_SIZE
+) -> UpsertResult:
+    """Save store rows to database in batches, one writer batch each.
+    
+    Args:
+        rows: Store column values as dicts
+        batch_size: Number of stores written per write batch
+        
+    Returns:
+        Counts of inserted, updated and unchanged stores
     """
+    result = UpsertResult()
     with Session(engine) as session:
-        for store in stores:
-            # Check for existing store by name and address
-            stmt = select(Store).where(
-                Store.name == store.name,  # type: ignore
-                Store.address == store.address  # type: ignore
-            )
-            existing = session.exec(stmt).first()
-            
-            if existing:
-                # Update existing store
-                for field in ['city', 'state', 'zip_code']:
-                    setattr(existing, field, getattr(store, field))
-                existing.updated_at = datetime.now(UTC)
-                session.add(existing)
-                session.commit()
-            else:
-                # Insert new store
-                session.add(store)
-                
-        session.commit()
+        for batch in batched(rows, batch_size):
+            batch_result = write(session, lambda session: upsert_stores(session, batch))
+            bump_data_version(STORES)
+            report_progress(rows_read=len(batch), rows_written=batch_result.inserted + batch_result.updated)
+            result += batch_result
+    return result
+
+
+def import_store_files(
+    csv_paths: Iterable[Path],
+    format: str = "gmaps",
+    max_workers: Optional[int] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE
+) -> UpsertResult:
+    """Import several store CSV files, parsing them in parallel.
+    
+    Each file is parsed and normalized in a worker process. Results are
+    funnelled, in completion order, to a single batched writer in this
+    process so SQLite only ever sees one writer. Only about one file per
+    worker is parsed ahead of the writer, so memory stays bounded however
+    many files there are. Workers are spawned rather than forked, since this
+    process already runs writer, DB pool and job threads.
+    
+    Args:
+        csv_paths: Paths to plain or gzip-compressed CSV files
+        format: Source layout, one of STORE_FORMATS
+        max_workers: Worker processes, defaults to the CPU count
+        batch_size: Number of stores written per write batch
+        
+    Returns:
+        Counts of inserted, updated and unchanged stores
+        
+    Raises:
+        UnknownStoreFormatError: If format is not a known layout
+    """
+    if format not in STORE_FORMATS:
+        raise UnknownStoreFormatError(format)
+    csv_paths = list(csv_paths)
+    if not csv_paths:
+        return UpsertResult()
+    
+    max_workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        rows = _parsed_store_rows(pool, csv_paths, format, window=max_workers)
+        return save_store_rows(rows, batch_size=batch_size)
+
+
+def import_store_directory(directory: Path, format: str = "gmaps") -> UpsertResult:
+    """Import every store CSV file in a directory.
+    
+    Args:
+        directory: Directory holding one export per metro area
+        format: Source layout, one of STORE_FORMATS
+        
+    Returns:
+        Counts of inserted, updated and unchanged stores
+        
+    Raises:
+        FileNotFoundError: If directory does not exist
+    """
+    if not directory.is_dir():
+        raise FileNotFoundError(f"Store import directory not found: {directory}")
+    csv_paths = sorted(
+        path for pattern in STORE_FILE_PATTERNS for path in directory.glob(pattern)
+    )
+    return import_store_files(csv_paths, format=format)
+
+
+def _parsed_store_rows(
+    pool: ProcessPoolExecutor,
+    csv_paths: Iterable[Path],
+    format: str,
+    window: int
+) -> Iterator[dict]:
+    """Rows of every file in completion order, with at most window files parsing at once.
+    
+    Each file's rows are released once consumed, and the next file is only
+    submitted as one finishes.
+    """
+    paths = iter(csv_paths)
+    pending: Set[Future] = {pool.submit(_parse_store_file, path, format) for path in islice(paths, window)}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for path in islice(paths, len(done)):
+            pending.add(pool.submit(_parse_store_file, path, format))
+        while done:
+            rows = done.pop().result()
+            yield from rows
+            del rows
+
+
+def _parse_store_file(csv_path: Path, format: str) -> List[dict]:
+    """Parse and normalize one store file into rows, in a worker process."""
+    stores = STORE_FORMATS[format](iter_store_rows_from_csv(csv_path))
+    return [_store_to_row(store) for store in stores]
+
+
+@query_budget(2)
+def upsert_stores(session: Session, rows: List[dict]) -> UpsertResult:
+    """Upsert one batch of store rows keyed on (name, address).
+    
+    Rows repeating a key within the batch collapse to the last one. Existing
+    stores are only rewritten when one of STORE_UPDATE_FIELDS differs.
+    
+    Args:
+        session: Database session, committed by the caller
+        rows: Store column values as dicts
+        
+    Returns:
+        Counts of inserted, updated and unchanged stores
+    """
+    rows = list({(row["name"], row["address"]): row for row in rows}.values())
+    if not rows:
+        return UpsertResult()
+    
+    keys = [(row["name"], row["address"]) for row in rows]
+    existing = session.scalar(
+        select(func.count()).select_from(Store).where(
+            tuple_(Store.name, Store.address).in_(keys)  # type: ignore
+        )
+    ) or 0
+    
+    table = Store.__table__  # type: ignore
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["name", "address"],
+        set_={
+            **{field: stmt.excluded[field] for field in STORE_UPDATE_FIELDS},
+            "updated_at": datetime.now(UTC)
+        },
+        where=or_(*(
+            table.c[field].is_distinct_from(stmt.excluded[field])
+            for field in STORE_UPDATE_FIELDS
+        ))
+    )
+    written = session.connection().execute(stmt, rows).rowcount
+    
+    inserted = len(rows) - existing
+    updated = written - inserted
+    return UpsertResult(inserted=inserted, updated=updated, unchanged=existing - updated)
+
+
+def _store_row_key(row: dict) -> str:
+    """Natural key of a source row for the import ledger.
+    
+    The street part of the address, as stores are matched on, so a row whose
+    city or zip code changes keeps its key and its fingerprint is replaced.
+    """
+    return f"{row['name']}\x1f{row['address'].split(',')[0].strip()}"
+
+
+def _store_to_row(store: Store) -> dict:
+    """Column values for a Store model, ready for a bulk insert."""
+    return {
+        "name": store.name,
+        "address": store.address,
+        "city": store.city,
+        "state": store.state,
+        "zip_code": store.zip_code,
+        "created_at": store.created_at,
+        "updated_at": store.updated_at,
+        "is_active": store.is_active
+    }
@@ -2,12 +2,17 @@
 from datetime import datetime
 from typing import Optional
 from pydantic import ConfigDict
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel
 
 
 class Store(SQLModel, table=True):
     """Store model representing a grocery store location."""
     
+    __table_args__ = (
+        Index("ix_store_name_address", "name", "address", unique=True),
+    )
+    
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str = Field(index=True)
     address: str
@@ -1,71 +1,109 @@
 """Store routes and views."""
 from pathlib import Path
+from typing import Optional
 import logging
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import HTMLResponse, RedirectResponse
 from sqlmodel import Session, select
-from sqlalchemy import cast, String, func
-from fastapi.templating import Jinja2Templates
+from sqlalchemy import func
 
-from webapp.database import get_session
+from webapp.cache import STORES, VersionedCache
+from webapp.database import get_session, run_in_db
+from webapp.http_cache import cached_response
+from webapp.jobs.runner import submit_job
+from webapp.pagination import InvalidCursorError, keyset_page, ranked_page
+from webapp.query_budget import query_budget
+from webapp.search import STORE_SEARCH, match_query, matches
+from webapp.templating import templates
 from webapp.stores.models import Store
-from webapp.stores.etl import import_chattanooga_stores
+from webapp.config import STORE_IMPORT_DIR
+from webapp.stores.etl import import_chattanooga_stores, import_store_directory
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/stores", tags=["stores"])
-templates = Jinja2Templates(directory="src/webapp/templates")
 
-# Dummy data
+PER_PAGE = 100
+
+# Store counts per search term, recomputed after store writes
+_totals = VersionedCache()
+
+
+def _store_page(session: Session, q: str, after: str, before: str):
+    """Query one page of active stores and the total for the search term."""
+    stmt = select(Store).where(Store.is_active == True)
+    keys = [Store.name, Store.id]
+    paginate = keyset_page
+    if match := match_query(q):
+        stmt = stmt.join(STORE_SEARCH, STORE_SEARCH.c.rowid == Store.id).where(matches(STORE_SEARCH, match))
+        keys = [STORE_SEARCH.c.rank, Store.id]
+        # Ranks move as the index changes, so search results are paged by position rather than by rank
+        paginate = ranked_page
+    
+    total = _totals.get_or_compute(
+        q, [STORES],
+        lambda: session.scalar(select(func.count()).select_from(stmt.subquery())) or 0
+    )
+    try:
+        page = paginate(session, stmt, keys, PER_PAGE, after=after, before=before)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return page, total
 
 
 @router.get("/", response_class=HTMLResponse)
+@cached_response(STORES)
+@query_budget(2)
 async def list_stores(
     request: Request,
     session: Session = Depends(get_session),
     q: str = "",
-    page: int = 1
+    after: str = "",
+    before: str = "",
+    job: Optional[int] = None
 ):
-    """List stores with search and pagination."""
-    per_page = 100
-    offset = (page - 1) * per_page
-    
-    stmt = select(Store).where(Store.is_active == True)
-    if q:
-        stmt = stmt.where(cast(Store.name, String).ilike(f"%{q}%"))
-    
-    total = session.scalar(select(func.count()).select_from(stmt.subquery())) or 0
-    stores = session.exec(
-        stmt.order_by(Store.name).offset(offset).limit(per_page)
-    ).all()
-    total_pages = (total + per_page - 1) // per_page
+    """List stores, by name with keyset pagination, or by search rank paged by position."""
+    page, total = await run_in_db(_store_page, session, q, after, before)
     
     return templates.TemplateResponse(
         "stores/list.html",
         {
             "request": request,
-            "stores": stores,
+            "stores": page.items,
             "q": q,
-            "page": page,
-            "total_pages": total_pages,
-            "total": total
+            "next_cursor": page.next_cursor,
+            "prev_cursor": page.prev_cursor,
+            "total": total,
+            "job": job
         }
     )
 
 
+def _import_chattanooga_job(session: Session) -> str:
+    """Job body for the Chattanooga store import."""
+    result = import_chattanooga_stores(Path("data/grocery_stores_chattanooga.csv"))
+    return (f"Imported Chattanooga stores: {result.inserted} new, "
+            f"{result.updated} updated, {result.unchanged} unchanged")
+
+
+def _import_directory_job(session: Session) -> str:
+    """Job body for the metro-area store directory import."""
+    result = import_store_directory(STORE_IMPORT_DIR)
+    return (f"Imported stores: {result.inserted} new, "
+            f"{result.updated} updated, {result.unchanged} unchanged")
+
+
 @router.post("/import-chattanooga")
-async def import_chattanooga(
-    request: Request,
-    session: Session = Depends(get_session)
-):
-    """Import Chattanooga stores from Google Maps CSV."""
-    try:
-        logger.info("Starting Chattanooga stores import")
-        csv_path = Path("data/grocery_stores_chattanooga.csv")
-        import_chattanooga_stores(csv_path)
-        logger.info("Completed Chattanooga stores import")
-        request.session["flash"] = [{"type": "success", "text": "Successfully imported Chattanooga stores"}]
-    except Exception as e:
-        logger.error(f"Failed to import Chattanooga stores: {e}")
-        request.session["flash"] = [{"type": "error", "text": f"Failed to import stores: {str(e)}"}]
-    return RedirectResponse(url="/stores", status_code=303)
+async def import_chattanooga(request: Request):
+    """Start a background import of Chattanooga stores from Google Maps CSV."""
+    job_id = await run_in_db(submit_job, "import-chattanooga", _import_chattanooga_job)
+    request.session["flash"] = [{"type": "success", "text": f"Started Chattanooga store import (job #{job_id})"}]
+    return RedirectResponse(url=f"/stores?job={job_id}", status_code=303)
+
+
+@router.post("/import-directory")
+async def import_directory(request: Request):
+    """Start a background import of every metro-area store CSV in the import directory."""
+    job_id = await run_in_db(submit_job, "import-directory", _import_directory_job)
+    request.session["flash"] = [{"type": "success", "text": f"Started store import from {STORE_IMPORT_DIR} (job #{job_id})"}]
+    return RedirectResponse(url=f"/stores?job={job_id}", status_code=303)
@@ -0,0 +1,111 @@
+"""The one Jinja environment shared by every view.
+
+Compiled templates are kept in an on-disk bytecode cache, warmed once by the
+server supervisor, so cold workers load bytecode instead of compiling. Outside
+development the loader does not stat template files on every render.
+
+Expensive partials can be cached with the fragment cache tag:
+
+    {% cache ("product-row", product.id), ["products", "prices"] %}
+        <tr>...</tr>
+    {% endcache %}
+
+The body is rendered once per key and reused until one of the listed data
+scopes is bumped by a write.
+"""
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Hashable, Sequence
+
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from webapp.cache import VersionedCache
+from webapp.config import DEVELOPMENT, TEMPLATE_CACHE_DIR
+from webapp.metrics import record_render
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_DIR = Path(__file__).parent / "templates"
+
+# Rendered fragments kept across requests
+FRAGMENT_CACHE_SIZE = 20000
+
+_fragments = VersionedCache(FRAGMENT_CACHE_SIZE)
+
+
+class FragmentCacheExtension(Extension):
+    """Adds {% cache key, scopes %}...{% endcache %} backed by a VersionedCache."""
+    
+    tags = {"cache"}
+    
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        # Keys are scoped to the template and the tag's position in it so separate
+        # fragments never collide; string templates have no name and get a unique one
+        if not hasattr(parser, "fragment_template"):
+            parser.fragment_template = parser.name or f"<string {uuid.uuid4().hex}>"
+            parser.fragment_tags = 0
+        parser.fragment_tags += 1
+        site = nodes.Const((parser.fragment_template, parser.fragment_tags))
+        key = parser.parse_expression()
+        scopes = parser.parse_expression() if parser.stream.skip_if("comma") else nodes.List([])
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_render_fragment", [site, key, scopes]), [], [], body
+        ).set_lineno(lineno)
+    
+    def _render_fragment(self, site: tuple, key: Hashable, scopes: Sequence[str], caller) -> Markup:
+        """Cached body for key, rendering it on a miss or once its scopes change."""
+        return _fragments.get_or_compute((site, key), list(scopes), lambda: Markup(caller()))
+
+
+class TimedTemplate(Template):
+    """Template adding its render time to the current request's metrics."""
+    
+    def render(self, *args, **kwargs) -> str:
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            record_render(time.perf_counter() - started)
+
+
+def clear_fragment_cache() -> None:
+    """Drop every cached fragment."""
+    _fragments.clear()
+
+
+def _create_environment() -> Environment:
+    TEMPLATE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    environment = Environment(
+        loader=FileSystemLoader(TEMPLATES_DIR),
+        autoescape=True,
+        bytecode_cache=FileSystemBytecodeCache(str(TEMPLATE_CACHE_DIR)),
+        auto_reload=os.getenv("SERVER_MODE", DEVELOPMENT) == DEVELOPMENT,
+        extensions=[FragmentCacheExtension]
+    )
+    environment.template_class = TimedTemplate
+    return environment
+
+
+environment = _create_environment()
+templates = Jinja2Templates(env=environment)
+
+
+def warm_templates() -> int:
+    """Compile every template into the bytecode cache.
+    
+    Returns:
+        Number of templates compiled
+    """
+    names = environment.list_templates(extensions=["html"])
+    for name in names:
+        environment.get_template(name)
+    logger.info(f"Compiled {len(names)} templates into {TEMPLATE_CACHE_DIR}")
+    return len(names)
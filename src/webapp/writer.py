@@ -0,0 +1,204 @@
+"""Single-writer group commit for SQLite.
+
+SQLite allows one writer at a time, and every commit is an fsync. Instead of
+each import, ingester or generator opening its own write transaction, they
+submit write batches to one writer thread per database. The writer drains
+whatever has queued up, runs each batch in its own savepoint inside a single
+BEGIN IMMEDIATE transaction and commits once for the whole group. Producers
+block on, or await, a future that resolves only after that commit.
+
+Typical use:
+    inserted = write(session, lambda s: s.connection().exec_driver_sql(SQL, rows).rowcount)
+    bump_data_version(PRICES)
+
+Write functions get the writer's session and must not commit it themselves.
+"""
+import asyncio
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+from sqlalchemy import Engine
+from sqlmodel import Session
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Longest a write batch waits for others to share its commit
+WRITE_MAX_DELAY = float(os.getenv("WRITE_MAX_DELAY_MS", "2")) / 1000
+
+# Most write batches folded into one commit
+WRITE_MAX_GROUP = 64
+
+# A write batch runs against the writer's session and returns the producer's result
+WriteFunc = Callable[[Session], T]
+
+_Pending = Tuple[WriteFunc, Future]
+
+
+class WriterClosedError(RuntimeError):
+    """Raised when a write is submitted after the writer has shut down."""
+    
+    def __init__(self, url: str):
+        self.url = url
+        super().__init__(f"Writer for {url} is closed")
+
+
+class GroupCommitWriter:
+    """Dedicated writer thread committing queued write batches in groups."""
+    
+    def __init__(
+        self,
+        engine: Engine,
+        max_delay: float = WRITE_MAX_DELAY,
+        max_group: int = WRITE_MAX_GROUP
+    ):
+        self.engine = engine
+        self.max_delay = max_delay
+        self.max_group = max_group
+        self.commits = 0
+        self.writes = 0
+        self._queue: "queue.Queue[Optional[_Pending]]" = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+    
+    def submit(self, work: WriteFunc[T]) -> "Future[T]":
+        """Queue a write batch.
+        
+        Args:
+            work: Function doing the writes on the writer's session
+        
+        Returns:
+            Future resolving to work's result once its group has committed
+        
+        Raises:
+            WriterClosedError: If the writer has been closed
+        """
+        if self._closed:
+            raise WriterClosedError(str(self.engine.url))
+        future: "Future[T]" = Future()
+        self._queue.put((work, future))
+        return future
+    
+    async def write(self, work: WriteFunc[T]) -> T:
+        """Queue a write batch and await its commit.
+        
+        Args:
+            work: Function doing the writes on the writer's session
+        
+        Returns:
+            work's result, once its group has committed
+        """
+        return await asyncio.wrap_future(self.submit(work))
+    
+    def close(self) -> None:
+        """Commit everything already queued, then stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+    
+    def _run(self) -> None:
+        """Writer loop: take a batch, gather more until the deadline, commit."""
+        closing = False
+        while not closing:
+            pending = self._queue.get()
+            if pending is None:
+                break
+            group = [pending]
+            deadline = time.monotonic() + self.max_delay
+            while len(group) < self.max_group:
+                try:
+                    pending = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if pending is None:
+                    closing = True
+                    break
+                group.append(pending)
+            self._commit_group(group)
+    
+    def _commit_group(self, group: List[_Pending]) -> None:
+        """Run a group of write batches in one transaction, one savepoint each."""
+        done = []
+        try:
+            with Session(self.engine, expire_on_commit=False) as session:
+                # Take the write lock up front; savepoints then nest inside it
+                session.connection().exec_driver_sql("BEGIN IMMEDIATE")
+                for work, future in group:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with session.begin_nested():
+                            done.append((future, work(session)))
+                    except Exception as e:
+                        future.set_exception(e)
+                session.commit()
+        except Exception as e:
+            logger.exception(f"Group commit of {len(group)} write batches failed")
+            for future, _ in done:
+                future.set_exception(e)
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        self.commits += 1
+        self.writes += len(done)
+        for future, result in done:
+            future.set_result(result)
+
+
+_writers: Dict[Engine, GroupCommitWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(engine: Engine) -> GroupCommitWriter:
+    """The writer for a database, started on first use."""
+    with _writers_lock:
+        writer = _writers.get(engine)
+        if writer is None:
+            writer = _writers[engine] = GroupCommitWriter(engine)
+        return writer
+
+
+def write(session: Session, work: WriteFunc[T]) -> T:
+    """Run a write batch through the writer for the session's database.
+    
+    In-memory databases have one connection per thread, so the writer thread
+    could not see their data. There is nothing to coalesce on them anyway,
+    and the batch runs and commits on the caller's session.
+    
+    Args:
+        session: Session whose database to write to
+        work: Function doing the writes, without committing
+    
+    Returns:
+        work's result, once it has committed
+    """
+    engine = session.get_bind()
+    if engine.url.database in (None, "", ":memory:"):
+        result = work(session)
+        session.commit()
+        return result
+    # End the caller's transaction so it holds no lock the writer waits on
+    session.commit()
+    return get_writer(engine).submit(work).result()
+
+
+@atexit.register
+def close_writers() -> None:
+    """Drain and stop every writer."""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()